@@ -0,0 +1,196 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict
+from dotenv import load_dotenv
+from logger import setup_logger
+from ratelimit import TokenBucket
+
+# Setup logger
+logger = setup_logger("admission")
+
+# Load environment variables
+load_dotenv()
+
+# Model calls running at once across all LLM routes
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "32"))
+# Requests allowed to wait for a slot, in total and per user
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))
+ADMISSION_USER_QUEUE_SIZE = int(os.getenv("ADMISSION_USER_QUEUE_SIZE", "4"))
+# Estimated prompt + output tokens admitted per minute
+ADMISSION_TOKENS_PER_MINUTE = int(os.getenv("ADMISSION_TOKENS_PER_MINUTE", "400000"))
+# Longest a request may wait for budget and a slot before it is shed
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+
+class Overloaded(Exception):
+    """
+    Raised when a request is shed. 429 means the user has too many requests
+    waiting; 503 means the service as a whole is over capacity.
+    """
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+class Admission:
+    """A held slot. Releasing it twice is harmless."""
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller.release(time.monotonic() - self._started)
+
+class AdmissionController:
+    """
+    Admission control in front of the model calls. A request first reserves
+    its estimated tokens from the per-minute budget, then takes one of
+    `max_concurrency` slots. Waiting requests are queued per user and slots
+    are handed out round-robin across users, so one user's burst does not
+    starve everyone else. Requests that would wait longer than `max_wait`,
+    or find their queue full, are shed straight away with a retry hint.
+    """
+
+    def __init__(self, max_concurrency: int, queue_size: int, user_queue_size: int,
+                 tokens_per_minute: int, max_wait: float):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.user_queue_size = user_queue_size
+        self.max_wait = max_wait
+        self.budget = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self._queues: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        # Smoothed time a slot is held, for Retry-After estimates
+        self._service_time = 5.0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {
+            "user_queue_full": 0, "queue_full": 0, "queue_wait": 0, "token_budget": 0, "timeout": 0
+        }
+
+    def queue_wait_estimate(self, position: int) -> float:
+        return self._service_time * (position + 1) / self.max_concurrency
+
+    def reject(self, reason: str, status_code: int, detail: str, retry_after: float) -> Overloaded:
+        self.shed[reason] += 1
+        logger.warning(f"Shedding request ({reason}): {detail}")
+        return Overloaded(status_code, detail, retry_after)
+
+    async def acquire(self, user_id: str, tokens: int) -> Admission:
+        """
+        Wait for budget and a slot, raising Overloaded if the request cannot
+        be admitted within max_wait. The caller must release the admission.
+        """
+        user_queue = self._queues.get(user_id)
+        if user_queue is not None and len(user_queue) >= self.user_queue_size:
+            raise self.reject(
+                "user_queue_full", 429, "Too many requests in progress, please slow down",
+                self.queue_wait_estimate(len(user_queue))
+            )
+        if self.queued >= self.queue_size:
+            raise self.reject(
+                "queue_full", 503, "Service is over capacity, please retry later",
+                self.queue_wait_estimate(self.queued)
+            )
+
+        deadline = time.monotonic() + self.max_wait
+        if self.budget is not None:
+            wait = self.budget.wait_time(tokens)
+            if wait > self.max_wait:
+                raise self.reject("token_budget", 503, "Model token budget exhausted, please retry later", wait)
+            self.budget.reserve(tokens)
+            try:
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                return await self.take_slot(user_id, deadline)
+            except BaseException:
+                self.budget.refund(tokens)
+                raise
+        return await self.take_slot(user_id, deadline)
+
+    async def take_slot(self, user_id: str, deadline: float) -> Admission:
+        if self.in_flight < self.max_concurrency and not self.queued:
+            self.in_flight += 1
+            self.admitted += 1
+            return Admission(self)
+
+        # Fail fast rather than time out when the queue is too long to clear in time
+        expected_wait = self.queue_wait_estimate(self.queued)
+        if expected_wait > deadline - time.monotonic():
+            raise self.reject("queue_wait", 503, "Service is over capacity, please retry later", expected_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if not future.done():
+                self.dequeue(user_id, future)
+                raise self.reject(
+                    "timeout", 503, "Timed out waiting for capacity, please retry later",
+                    self.queue_wait_estimate(self.queued)
+                )
+        except asyncio.CancelledError:
+            # The client went away while waiting; give back a slot handed to it in the meantime
+            if future.done():
+                self.release(0.0, record=False)
+            else:
+                self.dequeue(user_id, future)
+            raise
+        self.admitted += 1
+        return Admission(self)
+
+    def dequeue(self, user_id: str, future: asyncio.Future) -> None:
+        future.cancel()
+        user_queue = self._queues.get(user_id)
+        if user_queue is not None and future in user_queue:
+            user_queue.remove(future)
+            self.queued -= 1
+            if not user_queue:
+                del self._queues[user_id]
+
+    def release(self, held: float, record: bool = True) -> None:
+        """
+        Hand the slot to the next waiting user, or free it.
+        """
+        if record:
+            self._service_time = 0.9 * self._service_time + 0.1 * held
+        while self._queues:
+            user_id, user_queue = next(iter(self._queues.items()))
+            future = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not future.done():
+                # The slot passes straight to the waiter, in_flight is unchanged
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, tokens: int):
+        admission = await self.acquire(user_id, tokens)
+        try:
+            yield admission
+        finally:
+            admission.release()
+
+llm_admission = AdmissionController(
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_QUEUE_SIZE,
+    ADMISSION_USER_QUEUE_SIZE,
+    ADMISSION_TOKENS_PER_MINUTE,
+    ADMISSION_MAX_WAIT
+)
@@ -1,32 +1,43 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from database import supabase
+from database import get_auth_client
 from logger import setup_logger
+from metrics import span
 from .models import UserResponse
+from .verifier import AUTH_VERIFY_MODE, SigningKeyUnavailable, token_verifier
 
 logger = setup_logger("auth")
 security = HTTPBearer()
 
+async def verify_remotely(token: str) -> UserResponse:
+    """Verify the JWT token with the Supabase auth server."""
+    auth_response = await get_auth_client().get_user(token)
+    if not auth_response or not auth_response.user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid user data",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return UserResponse(
+        id=auth_response.user.id,
+        email=auth_response.user.email,
+        access_token=token
+    )
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """Dependency to get the current authenticated user."""
     try:
-        # Verify the JWT token with Supabase
-        auth_response = supabase.auth.get_user(credentials.credentials)
-        if not auth_response or not auth_response.user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid user data",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
-        return UserResponse(
-            id=auth_response.user.id,
-            email=auth_response.user.email,
-            access_token=credentials.credentials
-        )
+        with span("auth"):
+            if AUTH_VERIFY_MODE == "local":
+                try:
+                    return await token_verifier.verify(credentials.credentials)
+                except SigningKeyUnavailable as e:
+                    logger.info(f"Falling back to remote token verification: {str(e)}")
+            return await verify_remotely(credentials.credentials)
     except Exception as e:
         logger.error(f"Authentication failed: {str(e)}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
             headers={"WWW-Authenticate": "Bearer"},
-        ) 
\ No newline at end of file
+        )
@@ -1,5 +1,5 @@
 from typing import Optional
-from database import supabase
+from database import get_auth_client, get_db
 from logger import setup_logger
 
 logger = setup_logger("auth")
@@ -8,7 +8,7 @@ class AuthService:
     @staticmethod
     async def sign_up(email: str, password: str) -> dict:
         try:
-            response = supabase.auth.sign_up({
+            response = await get_auth_client().sign_up({
                 "email": email,
                 "password": password
             })
@@ -23,7 +23,7 @@ class AuthService:
     @staticmethod
     async def sign_in(email: str, password: str) -> dict:
         try:
-            response = supabase.auth.sign_in_with_password({
+            response = await get_auth_client().sign_in_with_password({
                 "email": email,
                 "password": password
             })
@@ -40,7 +40,7 @@ class UserProfileService:
     @staticmethod
     async def get_profile(user_id: str) -> dict:
         try:
-            result = supabase.table("user_profiles").select("*").eq("id", user_id).single().execute()
+            result = await get_db().table("user_profiles").select("*").eq("id", user_id).single().execute()
             return result.data
         except Exception as e:
             logger.error(f"Failed to get user profile: {str(e)}")
@@ -49,7 +49,7 @@ class UserProfileService:
     @staticmethod
     async def update_profile(user_id: str, profile_data: dict) -> dict:
         try:
-            result = supabase.table("user_profiles").update(profile_data).eq("id", user_id).execute()
+            result = await get_db().table("user_profiles").update(profile_data).eq("id", user_id).execute()
             return result.data[0]
         except Exception as e:
             logger.error(f"Failed to update user profile: {str(e)}")
@@ -62,7 +62,7 @@ class UserProfileService:
                 "id": user_id,
                 "email": email
             }
-            result = supabase.table("user_profiles").insert(profile_data).execute()
+            result = await get_db().table("user_profiles").insert(profile_data).execute()
             return result.data[0]
         except Exception as e:
             logger.error(f"Failed to create user profile: {str(e)}")
@@ -0,0 +1,161 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+import jwt
+from dotenv import load_dotenv
+from logger import setup_logger
+from transport import pooled_client
+from .models import UserResponse
+
+logger = setup_logger("auth")
+
+# Load environment variables
+load_dotenv()
+
+# "local" verifies JWTs in-process, "remote" asks the Supabase auth server every time
+AUTH_VERIFY_MODE = os.getenv("AUTH_VERIFY_MODE", "local")
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+# Legacy HS256 projects sign with the JWT secret; otherwise keys come from the JWKS endpoint
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWKS_URL = os.getenv(
+    "SUPABASE_JWKS_URL",
+    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+AUTH_JWT_AUDIENCE = os.getenv("AUTH_JWT_AUDIENCE", "authenticated")
+AUTH_JWT_LEEWAY = float(os.getenv("AUTH_JWT_LEEWAY", "5"))
+AUTH_JWKS_REFRESH_INTERVAL = float(os.getenv("AUTH_JWKS_REFRESH_INTERVAL", "600"))
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "4096"))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", "60"))
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+class SigningKeyUnavailable(Exception):
+    """Raised when no local key can verify a token and remote verification is needed."""
+
+class TokenVerifier:
+    """
+    Verifies Supabase access tokens locally with PyJWT. Signing keys come
+    from the project JWT secret or a JWKS document that is refreshed in the
+    background. Recently verified tokens are kept in a small LRU so repeat
+    requests skip signature checks entirely.
+    """
+
+    def __init__(self, jwt_secret: Optional[str], jwks_url: Optional[str], audience: str,
+                 leeway: float, refresh_interval: float, cache_size: int, cache_ttl: float):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.leeway = leeway
+        self.refresh_interval = refresh_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._keys: Dict[str, jwt.PyJWK] = {}
+        self._keys_fetched_at = 0.0
+        # Last on-demand refresh for an unknown kid, successful or not
+        self._keys_requested_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._http = None
+        self._verified: OrderedDict = OrderedDict()
+
+    async def refresh_keys(self) -> None:
+        if self._http is None:
+            self._http = pooled_client(timeout=10)
+        response = await self._http.get(self.jwks_url)
+        response.raise_for_status()
+        try:
+            key_set = jwt.PyJWKSet.from_dict(response.json())
+        except jwt.PyJWKSetError as e:
+            # Asymmetric keys need the optional cryptography package
+            logger.error(f"No usable signing keys in JWKS: {str(e)}")
+            key_set = None
+        self._keys = {key.key_id: key for key in key_set.keys} if key_set else {}
+        self._keys_fetched_at = time.monotonic()
+        logger.info(f"Loaded {len(self._keys)} JWT signing keys")
+
+    async def _refresh_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh_keys()
+            except Exception as e:
+                logger.error(f"Failed to refresh JWKS: {str(e)}")
+
+    async def start(self) -> None:
+        """Load signing keys and start the background refresh, once."""
+        if self.jwt_secret or not self.jwks_url or self._refresh_task is not None:
+            return
+        self._refresh_task = asyncio.create_task(self._refresh_periodically())
+        try:
+            await self.refresh_keys()
+        except Exception as e:
+            logger.error(f"Failed to load JWKS: {str(e)}")
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+
+    async def _signing_key(self, token: str):
+        if self.jwt_secret:
+            return self.jwt_secret, ["HS256"]
+
+        await self.start()
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self._keys.get(kid)
+        now = time.monotonic()
+        if key is None and min(now - self._keys_fetched_at, now - self._keys_requested_at) > 30:
+            # Unknown kid: the project may have rotated keys since the last refresh
+            self._keys_requested_at = now
+            try:
+                await self.refresh_keys()
+            except Exception as e:
+                logger.error(f"Failed to refresh JWKS: {str(e)}")
+                raise SigningKeyUnavailable(f"No signing key for kid {kid!r} and the JWKS refresh failed") from e
+            key = self._keys.get(kid)
+        if key is None:
+            raise SigningKeyUnavailable(f"No signing key for kid {kid!r}")
+        return key.key, [key.algorithm_name] if key.algorithm_name else ASYMMETRIC_ALGORITHMS
+
+    async def verify(self, token: str) -> UserResponse:
+        """
+        Return the user for a valid token. Raises jwt.InvalidTokenError for
+        bad or expired tokens and SigningKeyUnavailable when only the auth
+        server can decide.
+        """
+        now = time.time()
+        cached = self._verified.get(token)
+        if cached is not None:
+            user, expires_at = cached
+            if expires_at > now:
+                self._verified.move_to_end(token)
+                return user
+            del self._verified[token]
+
+        key, algorithms = await self._signing_key(token)
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=algorithms,
+            audience=self.audience,
+            leeway=self.leeway,
+            options={"require": ["exp", "sub"]}
+        )
+        user = UserResponse(id=claims["sub"], email=claims.get("email"), access_token=token)
+
+        if self.cache_size > 0:
+            self._verified[token] = (user, min(claims["exp"], now + self.cache_ttl))
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return user
+
+token_verifier = TokenVerifier(
+    SUPABASE_JWT_SECRET,
+    SUPABASE_JWKS_URL,
+    AUTH_JWT_AUDIENCE,
+    AUTH_JWT_LEEWAY,
+    AUTH_JWKS_REFRESH_INTERVAL,
+    AUTH_TOKEN_CACHE_SIZE,
+    AUTH_TOKEN_CACHE_TTL
+)
@@ -0,0 +1,47 @@
+"""
+Compare two result files written by benchmarks.suite.
+
+Usage (from backend/):
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+METRICS = [
+    ("req/s", lambda result: result["throughput_rps"]),
+    ("p50 ms", lambda result: result["latency_ms"]["p50"]),
+    ("p95 ms", lambda result: result["latency_ms"]["p95"]),
+    ("p99 ms", lambda result: result["latency_ms"]["p99"]),
+    ("errors", lambda result: result["error_rate"])
+]
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def change(before: float, after: float) -> str:
+    if before == 0:
+        return "n/a" if after == 0 else "new"
+    return f"{(after - before) / before:+.1%}"
+
+def compare(before: dict, after: dict) -> None:
+    print(f"before: {before.get('commit')}  after: {after.get('commit')}")
+    if before.get("config") != after.get("config"):
+        print("warning: the runs used different settings")
+
+    baseline = {(r["scenario"], r["concurrency"]): r for r in before["results"]}
+    for result in after["results"]:
+        key = (result["scenario"], result["concurrency"])
+        if key not in baseline:
+            continue
+        print(f"\n{key[0]} c={key[1]}")
+        for label, value in METRICS:
+            old, new = value(baseline[key]), value(result)
+            print(f"  {label:>8} {old:>10.2f} -> {new:>10.2f}  {change(old, new):>8}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+    compare(load(args.before), load(args.after))
@@ -0,0 +1,151 @@
+"""
+Benchmark of GET /itineraries/export and POST /itineraries/import.
+
+Seeds one user with `--itineraries` itineraries, each with `--history`
+refinement_history rows, straight into the fake PostgREST. Then:
+
+- exports them as NDJSON while sampling the API process's resident memory,
+- for comparison, reads the same data the old way (every /itineraries page
+  plus one /history call per itinerary) for the first `--baseline` itineraries,
+- imports the export into a second user and checks the copy matches.
+
+Usage (from backend/):
+    python -m benchmarks.export --itineraries 10000 --history 3
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import httpx
+
+from benchmarks.search import random_itinerary
+from benchmarks.suite import Services, make_token
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+async def sample_rss(pid: int, samples: list) -> None:
+    while True:
+        samples.append(rss_mb(pid))
+        await asyncio.sleep(0.05)
+
+async def seed(fake: httpx.AsyncClient, user_id: str, itineraries: int, history: int, rng: random.Random) -> None:
+    for offset in range(0, itineraries, 1000):
+        rows = []
+        for _ in range(min(1000, itineraries - offset)):
+            row = random_itinerary(rng)
+            rows.append({**row, "user_id": user_id, "original_content": row["content"], "history_version": history,
+                         "current_version": history})
+        response = await fake.post("/rest/v1/itineraries", json=rows)
+        response.raise_for_status()
+        entries = [
+            {"itinerary_id": inserted["id"], "version": version, "base_version": version - 1,
+             "refinement_request": f"Refinement {version}", "content": inserted["content"] + f"\n\nVersion {version}"}
+            for inserted in response.json() for version in range(1, history + 1)
+        ]
+        if entries:
+            (await fake.post("/rest/v1/refinement_history", json=entries)).raise_for_status()
+
+async def export(http: httpx.AsyncClient, headers: dict, pid: int) -> bytes:
+    samples = []
+    sampler = asyncio.create_task(sample_rss(pid, samples))
+    start = time.perf_counter()
+    first_line = None
+    body = bytearray()
+    async with http.stream("GET", "/itineraries/export", headers=headers) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            if first_line is None:
+                first_line = time.perf_counter() - start
+            body.extend(chunk)
+    seconds = time.perf_counter() - start
+    sampler.cancel()
+    lines = body.count(b"\n")
+    print(f"export: {lines} itineraries, {len(body) / 1e6:.1f} MB in {seconds:.2f}s, first bytes after "
+          f"{first_line * 1000:.0f}ms, API RSS {min(samples):.0f} -> {max(samples):.0f} MB")
+    return bytes(body)
+
+async def baseline(http: httpx.AsyncClient, headers: dict, count: int) -> None:
+    start = time.perf_counter()
+    requests, ids, cursor = 0, [], None
+    while True:
+        params = {"limit": 100, "fields": "content,original_content"}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await http.get("/itineraries", params=params, headers=headers)).json()
+        requests += 1
+        ids.extend(row["id"] for row in page["itineraries"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    listing = time.perf_counter() - start
+    sample = ids[:count]
+    start = time.perf_counter()
+    for itinerary_id in sample:
+        (await http.get(f"/history/{itinerary_id}", headers=headers)).raise_for_status()
+    per_history = (time.perf_counter() - start) / max(1, len(sample))
+    estimate = listing + per_history * len(ids)
+    print(f"baseline: {requests} list pages in {listing:.2f}s plus {len(ids)} history requests at "
+          f"{per_history * 1000:.1f}ms each (measured on {len(sample)}): about {estimate:.0f}s, "
+          f"{requests + len(ids)} requests")
+
+async def run(args) -> None:
+    services = Services(args)
+    await services.start()
+    rng = random.Random(args.seed)
+    try:
+        source, target = str(uuid.uuid4()), str(uuid.uuid4())
+        async with httpx.AsyncClient(base_url=services.fake_url, timeout=args.timeout) as fake, \
+                httpx.AsyncClient(base_url=services.app_url, timeout=args.timeout) as http:
+            await seed(fake, source, args.itineraries, args.history, rng)
+            source_headers = {"Authorization": f"Bearer {make_token(source, args.jwt_secret)}"}
+            target_headers = {"Authorization": f"Bearer {make_token(target, args.jwt_secret)}"}
+
+            body = await export(http, source_headers, services.processes[-1].pid)
+            if args.baseline:
+                await baseline(http, source_headers, args.baseline)
+
+            start = time.perf_counter()
+            response = await http.post(
+                "/itineraries/import", content=body,
+                headers={**target_headers, "Content-Type": "application/x-ndjson"}
+            )
+            response.raise_for_status()
+            print(f"import: {response.json()} in {time.perf_counter() - start:.2f}s")
+
+            copy = await export(http, target_headers, services.processes[-1].pid)
+            fields = ["mood", "preferences", "content", "original_content", "history_version", "created_at"]
+            history_fields = ["version", "base_version", "refinement_request", "content", "delta"]
+
+            def comparable(line: bytes):
+                row = json.loads(line)
+                return [row[field] for field in fields], [[entry[field] for field in history_fields] for entry in row["history"]]
+
+            same = [comparable(line) for line in body.splitlines()] == [comparable(line) for line in copy.splitlines()]
+            print(f"imported copy matches the original: {same}")
+    finally:
+        services.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itineraries", type=int, default=10000)
+    parser.add_argument("--history", type=int, default=3, help="refinement_history rows per itinerary")
+    parser.add_argument("--baseline", type=int, default=200, help="history requests timed for the old path, 0 to skip")
+    parser.add_argument("--jwt-secret", default="benchmark-secret")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show output of the spawned servers")
+    args = parser.parse_args()
+    # Settings the shared Services runner expects
+    args.__dict__.update(
+        latency=0.0, tokens_per_second=400, db_latency=0.0, error_rate=0.0, stall_rate=0.0, stall_latency=10.0,
+        model_speed="", auth_mode="local", app_workers=1, app_url=None, fake_url=None
+    )
+    asyncio.run(run(args))
@@ -0,0 +1,538 @@
+"""
+Local stand-ins for the services the API talks to, served from one app:
+
+    /v1/responses   OpenAI Responses API with configurable latency and token rate
+    /rest/v1/...    in-memory PostgREST covering the queries and RPC functions model.py uses
+    /auth/v1/...    GoTrue user lookup for tokens signed with the JWT secret
+
+Usage (from backend/):
+    python -m benchmarks.fakes --port 54321 --latency 0.3 --tokens-per-second 400
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import jwt
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+ACTIVITIES = ["Old town walking tour", "Harbour cruise", "Street food market", "Modern art museum",
+              "Sunset viewpoint", "Botanical garden", "Jazz bar", "Cooking class", "Coastal hike"]
+LOCATIONS = ["Lisbon", "Porto", "Seville", "Naples", "Split", "Kyoto", "Oaxaca", "Tbilisi"]
+CUISINES = ["tapas", "seafood", "ramen", "mezze", "tacos", "gelato", None]
+TIMES = ["09:00", "12:30", "15:00", "19:30"]
+
+# Column defaults applied on insert, mirroring the Supabase schema
+TABLE_DEFAULTS = {
+    "itineraries": {
+        "preferences": None,
+        "refined": False,
+        "refinement_request": None,
+        "refinement_count": 0,
+        "structured": None,
+        "original_structured": None,
+        "is_favorite": False,
+        "history_version": 0,
+        "current_version": 0
+    },
+    "refinement_history": {"content": None, "delta": None, "base_version": None}
+}
+
+# Tables that can be embedded with select=*,child(*): parent -> {child: foreign key column}
+EMBEDDED_TABLES = {"itineraries": {"refinement_history": "itinerary_id"}}
+
+# Columns import_itineraries copies from each exported itinerary and history entry
+IMPORTED_COLUMNS = [
+    "mood", "preferences", "content", "original_content", "structured", "original_structured", "is_favorite",
+    "refined", "refinement_request", "refinement_count", "history_version", "current_version", "created_at"
+]
+IMPORTED_HISTORY_COLUMNS = ["version", "base_version", "refinement_request", "content", "delta", "created_at"]
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+def fake_slot(rng: random.Random, time_of_day: str) -> dict:
+    return {
+        "time": time_of_day,
+        "activity": rng.choice(ACTIVITIES),
+        "location": rng.choice(LOCATIONS),
+        "cuisine": rng.choice(CUISINES),
+        "notes": rng.choice([None, "Book ahead", "Bring comfortable shoes"])
+    }
+
+def fake_day(rng: random.Random, day: int) -> dict:
+    return {"day": day, "title": f"{rng.choice(LOCATIONS)} highlights", "slots": [fake_slot(rng, t) for t in TIMES]}
+
+def fake_output(rng: random.Random, text_format: Optional[dict]) -> str:
+    """
+    Output matching the requested json_schema format name, or free text.
+    """
+    name = (text_format or {}).get("format", {}).get("name")
+    if name == "slot":
+        return json.dumps(fake_slot(rng, rng.choice(TIMES)))
+    if name == "day":
+        return json.dumps(fake_day(rng, 1))
+    itinerary = {"title": f"Three days in {rng.choice(LOCATIONS)}", "days": [fake_day(rng, d) for d in (1, 2, 3)]}
+    if name is not None:
+        return json.dumps(itinerary)
+    return "\n".join(
+        f"Day {day['day']}: " + "; ".join(f"{slot['time']} {slot['activity']}" for slot in day["slots"])
+        for day in itinerary["days"]
+    )
+
+def response_body(response_id: str, model: str, text: str, input_tokens: int, status: str = "completed") -> dict:
+    output_tokens = estimate_tokens(text)
+    return {
+        "id": response_id,
+        "object": "response",
+        "created_at": int(time.time()),
+        "model": model,
+        "status": status,
+        "output": [{
+            "type": "message",
+            "id": f"msg_{response_id}",
+            "role": "assistant",
+            "status": status,
+            "content": [{"type": "output_text", "text": text, "annotations": []}]
+        }],
+        "parallel_tool_calls": True,
+        "tool_choice": "auto",
+        "tools": [],
+        "usage": {
+            "input_tokens": input_tokens,
+            "input_tokens_details": {"cached_tokens": 0},
+            "output_tokens": output_tokens,
+            "output_tokens_details": {"reasoning_tokens": 0},
+            "total_tokens": input_tokens + output_tokens
+        }
+    }
+
+class FakeResponses:
+    """
+    Waits `latency` seconds before the first token, then emits tokens at
+    `tokens_per_second` (0 means all at once). A share of calls can fail with
+    500, and a share can stall for `stall_latency` before their first token.
+    `model_speeds` makes some models faster, e.g. {"gpt-4o-mini": 3.0}.
+    """
+
+    def __init__(self, latency: float, tokens_per_second: float, error_rate: float = 0.0,
+                 stall_rate: float = 0.0, stall_latency: float = 10.0, seed: int = 0,
+                 model_speeds: Dict[str, float] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_latency = stall_latency
+        self.model_speeds = model_speeds or {}
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.output_tokens = 0
+
+    def generation_time(self, tokens: int, speed: float = 1.0) -> float:
+        return tokens / (self.tokens_per_second * speed) if self.tokens_per_second > 0 else 0.0
+
+    async def create(self, body: dict):
+        self.calls += 1
+        if self.rng.random() < self.error_rate:
+            await asyncio.sleep(self.latency)
+            return JSONResponse(status_code=500, content={"error": {"message": "Injected failure", "type": "server_error"}})
+
+        speed = self.model_speeds.get(body.get("model", ""), 1.0)
+        latency = self.stall_latency if self.rng.random() < self.stall_rate else self.latency / speed
+        response_id = f"resp_{uuid.uuid4().hex}"
+        text = fake_output(self.rng, body.get("text"))
+        input_tokens = estimate_tokens(json.dumps(body.get("input", "")))
+        self.output_tokens += estimate_tokens(text)
+        if body.get("stream"):
+            return StreamingResponse(
+                self.stream(response_id, body.get("model", ""), text, input_tokens, latency, speed),
+                media_type="text/event-stream"
+            )
+
+        await asyncio.sleep(latency + self.generation_time(estimate_tokens(text), speed))
+        return JSONResponse(response_body(response_id, body.get("model", ""), text, input_tokens))
+
+    async def stream(self, response_id: str, model: str, text: str, input_tokens: int, latency: float, speed: float):
+        sequence = itertools.count()
+
+        def event(payload: dict) -> str:
+            payload["sequence_number"] = next(sequence)
+            return f"event: {payload['type']}\ndata: {json.dumps(payload)}\n\n"
+
+        created = response_body(response_id, model, "", input_tokens, status="in_progress")
+        created["output"] = []
+        yield event({"type": "response.created", "response": created})
+        await asyncio.sleep(latency)
+
+        # Send roughly four tokens per chunk
+        chunk_size = 16
+        for start in range(0, len(text), chunk_size):
+            delta = text[start:start + chunk_size]
+            await asyncio.sleep(self.generation_time(estimate_tokens(delta), speed))
+            yield event({
+                "type": "response.output_text.delta",
+                "item_id": f"msg_{response_id}",
+                "output_index": 0,
+                "content_index": 0,
+                "delta": delta,
+                "logprobs": []
+            })
+        yield event({"type": "response.completed", "response": response_body(response_id, model, text, input_tokens)})
+
+def split_top_level(value: str) -> List[str]:
+    """
+    Split a PostgREST logic expression on commas outside quotes and parentheses.
+    """
+    parts, depth, quoted, current = [], 0, False, []
+    for char in value:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return parts
+
+def unquote(value: str) -> str:
+    return value[1:-1] if len(value) >= 2 and value[0] == value[-1] == '"' else value
+
+def coerce(value: str, like: Any) -> Any:
+    """Cast a filter value to the type of the stored column value."""
+    if value == "null":
+        return None
+    if isinstance(like, bool):
+        return value.lower() == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+def compare(op: str, left: Any, right: str) -> bool:
+    if op == "is":
+        return left is None if right == "null" else left == coerce(right, True)
+    if op == "in":
+        return left is not None and str(left) in {unquote(v) for v in split_top_level(right[1:-1])}
+    if left is None:
+        return False
+    right = coerce(unquote(right), left)
+    if right is None:
+        return False
+    return {
+        "eq": left == right,
+        "neq": left != right,
+        "gt": left > right,
+        "gte": left >= right,
+        "lt": left < right,
+        "lte": left <= right
+    }[op]
+
+def parse_condition(column: str, expression: str):
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, value = expression.split(".", 1)
+    return lambda row: compare(op, row.get(column), value) != negate
+
+def parse_logic(operator: str, expression: str):
+    conditions = []
+    for term in split_top_level(expression[1:-1]):
+        if term.startswith(("and(", "or(")):
+            name, rest = term.split("(", 1)
+            conditions.append(parse_logic(name, "(" + rest))
+        else:
+            column, condition = term.split(".", 1)
+            conditions.append(parse_condition(column, condition))
+    combine = all if operator == "and" else any
+    return lambda row: combine(condition(row) for condition in conditions)
+
+class FakePostgrest:
+    """In-memory tables answering the subset of PostgREST used by model.py."""
+
+    RESERVED_PARAMS = {"select", "order", "limit", "offset", "columns", "on_conflict"}
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.tables: Dict[str, List[dict]] = {}
+        self.sequences: Dict[str, itertools.count] = {}
+        self.requests = 0
+
+    def filters(self, params):
+        conditions = []
+        for key, value in params.multi_items():
+            if key in self.RESERVED_PARAMS:
+                continue
+            if key in ("or", "and"):
+                conditions.append(parse_logic(key, value))
+            else:
+                conditions.append(parse_condition(unquote(key), value))
+        return lambda row: all(condition(row) for condition in conditions)
+
+    def matching(self, table: str, params) -> List[dict]:
+        match = self.filters(params)
+        return [row for row in self.tables.get(table, []) if match(row)]
+
+    def project(self, table: Optional[str], rows: List[dict], select: Optional[str]) -> List[dict]:
+        if not select or select == "*":
+            return [dict(row) for row in rows]
+        columns, embedded = [], []
+        for column in split_top_level(select):
+            name, _, inner = column.strip().partition("(")
+            if inner:
+                embedded.append((name, inner[:-1]))
+            else:
+                columns.append(name)
+        projected = [dict(row) if "*" in columns else {column: row.get(column) for column in columns} for row in rows]
+        for name, inner in embedded:
+            key = EMBEDDED_TABLES[table][name]
+            children: Dict[Any, List[dict]] = {}
+            for child in self.tables.get(name, []):
+                children.setdefault(child[key], []).append(child)
+            for row, item in zip(rows, projected):
+                item[name] = self.project(name, children.get(row["id"], []), inner)
+        return projected
+
+    @staticmethod
+    def ordered(rows: List[dict], order: Optional[str]) -> List[dict]:
+        # Stable sorts applied from the last key to the first
+        for term in reversed((order or "").split(",")):
+            if not term:
+                continue
+            column, _, direction = term.partition(".")
+            rows = sorted(
+                rows,
+                key=lambda row: (row.get(column) is None, row.get(column) if row.get(column) is not None else 0),
+                reverse=direction.startswith("desc")
+            )
+        return rows
+
+    def reply(self, request: Request, rows: List[dict], status_code: int = 200, table: str = None):
+        if "return=minimal" in request.headers.get("prefer", ""):
+            return Response(status_code=status_code if status_code != 200 else 204)
+        rows = self.project(table, rows, request.query_params.get("select"))
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(rows) != 1:
+                return JSONResponse(status_code=406, content={"code": "PGRST116", "message": "JSON object requested, multiple (or no) rows returned"})
+            return JSONResponse(status_code=status_code, content=rows[0])
+        return JSONResponse(status_code=status_code, content=rows)
+
+    async def handle(self, request: Request, table: str):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request.query_params
+
+        if request.method == "GET":
+            rows = self.ordered(self.matching(table, params), params.get("order"))
+            offset = int(params.get("offset", 0))
+            limit = params.get("limit")
+            rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+            return self.reply(request, rows, table=table)
+
+        if request.method == "POST":
+            body = await request.json()
+            inserted = [self.insert(table, values) for values in (body if isinstance(body, list) else [body])]
+            return self.reply(request, inserted, 201, table)
+
+        if request.method == "PATCH":
+            values = await request.json()
+            rows = self.matching(table, params)
+            for row in rows:
+                row.update(values, updated_at=utc_now())
+            return self.reply(request, rows, table=table)
+
+        if request.method == "DELETE":
+            rows = self.matching(table, params)
+            self.tables[table] = [row for row in self.tables.get(table, []) if row not in rows]
+            return self.reply(request, rows, table=table)
+
+        return JSONResponse(status_code=405, content={"message": "Method not allowed"})
+
+    async def rpc(self, request: Request, function: str):
+        """
+        The functions from migrations/add_itinerary_functions.sql, each
+        answered in one request like the real ones.
+        """
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"rpc_{function}", None)
+        if handler is None:
+            return JSONResponse(status_code=404, content={"code": "PGRST202", "message": f"Could not find the function {function}"})
+        try:
+            rows = handler(**await request.json())
+        except RuntimeError as e:
+            return JSONResponse(status_code=409, content={"code": "40001", "message": str(e)})
+        return self.reply(request, rows)
+
+    def owned_itinerary(self, itinerary_id: int, user_id: str) -> Optional[dict]:
+        for row in self.tables.get("itineraries", []):
+            if row["id"] == itinerary_id and row["user_id"] == user_id:
+                return row
+        return None
+
+    def rpc_save_refinement(self, p_itinerary_id, p_user_id, p_version, p_base_version, p_refinement_request,
+                            p_content, p_structured, p_history_content, p_history_delta) -> List[dict]:
+        row = self.owned_itinerary(p_itinerary_id, p_user_id)
+        if row is None:
+            return []
+        if row["history_version"] != p_version - 1:
+            raise RuntimeError(f"Itinerary {p_itinerary_id} was refined concurrently")
+        row.update(
+            content=p_content, structured=p_structured, history_version=p_version,
+            current_version=p_version, updated_at=utc_now()
+        )
+        return [self.insert("refinement_history", {
+            "itinerary_id": p_itinerary_id,
+            "version": p_version,
+            "base_version": p_base_version,
+            "refinement_request": p_refinement_request,
+            "content": p_history_content,
+            "delta": p_history_delta
+        })]
+
+    def rpc_revert_itinerary(self, p_itinerary_id, p_user_id) -> List[dict]:
+        row = self.owned_itinerary(p_itinerary_id, p_user_id)
+        if row is None or row.get("original_content") is None:
+            return []
+        row.update(
+            content=row["original_content"], refined=False, refinement_request=None, refinement_count=0,
+            structured=row.get("original_structured"), current_version=0, updated_at=utc_now()
+        )
+        return [row]
+
+    def rpc_set_itinerary_favorite(self, p_itinerary_id, p_user_id, p_is_favorite) -> List[dict]:
+        row = self.owned_itinerary(p_itinerary_id, p_user_id)
+        if row is None:
+            return []
+        row.update(is_favorite=p_is_favorite, updated_at=utc_now())
+        return [row]
+
+    def rpc_import_itineraries(self, p_user_id, p_itineraries) -> List[dict]:
+        inserted = []
+        for item in p_itineraries:
+            values = {column: item[column] for column in IMPORTED_COLUMNS if item.get(column) is not None}
+            row = self.insert("itineraries", {**values, "user_id": p_user_id})
+            for entry in item.get("history") or []:
+                history = {column: entry[column] for column in IMPORTED_HISTORY_COLUMNS if entry.get(column) is not None}
+                self.insert("refinement_history", {**history, "itinerary_id": row["id"]})
+            inserted.append(row)
+        return inserted
+
+    def insert(self, table: str, values: dict) -> dict:
+        sequence = self.sequences.setdefault(table, itertools.count(1))
+        now = utc_now()
+        row = {**TABLE_DEFAULTS.get(table, {}), "id": next(sequence), "created_at": now, "updated_at": now, **values}
+        self.tables.setdefault(table, []).append(row)
+        return row
+
+class FakeGoTrue:
+    """Resolves access tokens signed with the shared JWT secret to users."""
+
+    def __init__(self, jwt_secret: str):
+        self.jwt_secret = jwt_secret
+
+    async def get_user(self, request: Request):
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        try:
+            claims = jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience="authenticated")
+        except jwt.InvalidTokenError as e:
+            return JSONResponse(status_code=401, content={"code": 401, "msg": str(e)})
+        return JSONResponse({
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "app_metadata": {},
+            "user_metadata": {},
+            "created_at": utc_now()
+        })
+
+def parse_model_speeds(value: str) -> Dict[str, float]:
+    speeds = {}
+    for item in value.split(","):
+        model, _, speed = item.partition("=")
+        if model.strip() and speed.strip():
+            speeds[model.strip()] = float(speed)
+    return speeds
+
+def create_fake_app(
+    latency: float = 0.3, tokens_per_second: float = 400, db_latency: float = 0.0,
+    error_rate: float = 0.0, jwt_secret: str = "benchmark-secret", stall_rate: float = 0.0, stall_latency: float = 10.0,
+    model_speeds: Dict[str, float] = None
+) -> FastAPI:
+    """
+    Build the combined fake upstream. The fakes are exposed on app.state so
+    callers can inspect call counts and stored rows.
+    """
+    app = FastAPI(title="WanderGen benchmark fakes")
+    responses = FakeResponses(latency, tokens_per_second, error_rate, stall_rate, stall_latency, model_speeds=model_speeds)
+    postgrest = FakePostgrest(db_latency)
+    gotrue = FakeGoTrue(jwt_secret)
+    app.state.responses = responses
+    app.state.postgrest = postgrest
+
+    @app.post("/v1/responses")
+    async def create_response(request: Request):
+        return await responses.create(await request.json())
+
+    @app.post("/rest/v1/rpc/{function}")
+    async def rpc(function: str, request: Request):
+        return await postgrest.rpc(request, function)
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def rest(table: str, request: Request):
+        return await postgrest.handle(request, table)
+
+    @app.get("/auth/v1/user")
+    async def get_user(request: Request):
+        return await gotrue.get_user(request)
+
+    @app.get("/stats")
+    async def stats():
+        return {
+            "responses_calls": responses.calls,
+            "output_tokens": responses.output_tokens,
+            "postgrest_requests": postgrest.requests,
+            "rows": {table: len(rows) for table, rows in postgrest.tables.items()}
+        }
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first output token")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="output token rate, 0 for instant")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="added PostgREST latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of model calls failing with 500")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of model calls stalling before the first token")
+    parser.add_argument("--stall-latency", type=float, default=10.0, help="seconds a stalled call waits")
+    parser.add_argument(
+        "--model-speed", default="", help='speed-up per model, e.g. "gpt-4o-mini=3" for a 3x faster small model'
+    )
+    parser.add_argument("--jwt-secret", default="benchmark-secret")
+    args = parser.parse_args()
+
+    app = create_fake_app(
+        args.latency, args.tokens_per_second, args.db_latency, args.error_rate, args.jwt_secret,
+        args.stall_rate, args.stall_latency, parse_model_speeds(args.model_speed)
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,73 @@
+"""
+Storage size and reconstruction latency of refinement history, comparing
+full copies per refinement with deltas plus periodic snapshots.
+
+Usage (from backend/):
+    python -m benchmarks.history_storage --refinements 20 --intervals 5,10,20
+"""
+import argparse
+import random
+import time
+
+from versioning import build_history_entry, rebuild_versions, snapshot_floor
+
+def make_itinerary(rng: random.Random, lines: int = 60) -> str:
+    words = ["museum", "harbour", "tapas", "sunset", "market", "hike", "ferry", "gelato", "old town", "jazz bar"]
+    return "".join(
+        f"Day {line // 20 + 1}, {8 + line % 20 // 2}:00 - " + " ".join(rng.choice(words) for _ in range(12)) + "\n"
+        for line in range(lines)
+    )
+
+def refine(rng: random.Random, content: str, edits: int = 3) -> str:
+    lines = content.splitlines(keepends=True)
+    for _ in range(edits):
+        index = rng.randrange(len(lines))
+        lines[index] = lines[index].rstrip("\n") + " (cheaper option)\n"
+    return "".join(lines)
+
+def stored_bytes(rows: list) -> int:
+    return sum(len(row["content"] or row["delta"]) for row in rows)
+
+def run(refinements: int, intervals: list, repeats: int):
+    rng = random.Random(42)
+    original = make_itinerary(rng)
+    versions = [original]
+    for _ in range(refinements):
+        versions.append(refine(rng, versions[-1]))
+
+    full_copy = sum(len(v) for v in versions[1:])
+    print(f"original: {len(original)} bytes, {refinements} refinements")
+    print(f"{'scheme':>18} {'history bytes':>14} {'ratio':>7} {'worst (us)':>12} {'all (us)':>10}")
+    print(f"{'full copies':>18} {full_copy:>14} {1.0:>7.2f} {'-':>12} {'-':>10}")
+
+    for interval in intervals:
+        rows = [
+            build_history_entry(1, v, v - 1, versions[v - 1], versions[v], "cheaper", interval)
+            for v in range(1, refinements + 1)
+        ]
+        assert rebuild_versions(original, rows)[refinements] == versions[-1]
+
+        # Worst single version: the longest chain back to a snapshot, fetched as get_refinement_version does
+        worst = max(v for v in range(1, refinements + 1) if v % interval == interval - 1 or v == 1)
+        floor = snapshot_floor(worst, interval)
+        chain = [row for row in rows if max(floor, 1) <= row["version"] <= worst]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rebuild_versions(original, chain)
+        worst_us = (time.perf_counter() - start) / repeats * 1e6
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            rebuild_versions(original, rows)
+        all_us = (time.perf_counter() - start) / repeats * 1e6
+
+        size = stored_bytes(rows)
+        print(f"{f'delta, K={interval}':>18} {size:>14} {size / full_copy:>7.2f} {worst_us:>12.1f} {all_us:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--refinements", type=int, default=20)
+    parser.add_argument("--intervals", default="5,10,20", help="comma-separated snapshot intervals")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+    run(args.refinements, [int(i) for i in args.intervals.split(",")], args.repeats)
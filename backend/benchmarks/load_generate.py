@@ -0,0 +1,123 @@
+"""
+Load test for POST /generate.
+
+Runs the FastAPI app in-process against stand-ins for OpenAI and PostgREST
+that simply sleep for a fixed latency, then measures throughput at
+increasing concurrency. With a non-blocking service layer throughput should
+grow roughly linearly with the number of in-flight requests.
+
+Usage (from backend/):
+    python -m benchmarks.load_generate --latency 0.5 --levels 1,4,16,64
+"""
+import argparse
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+# Any client not replaced by a stand-in is built from these; nothing contacts them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+
+import httpx
+
+import database
+import main
+import model
+
+class SleepyStream:
+    """A streamed response that sends its whole text as one delta after `latency`."""
+
+    def __init__(self, latency: float, text: str):
+        self.latency = latency
+        self.text = text
+
+    def __aiter__(self):
+        return self.events()
+
+    async def events(self):
+        await asyncio.sleep(self.latency)
+        yield SimpleNamespace(type="response.output_text.delta", delta=self.text)
+        response = SimpleNamespace(output=[SimpleNamespace(content=[SimpleNamespace(text=self.text)])], usage=None)
+        yield SimpleNamespace(type="response.completed", response=response)
+
+    async def close(self):
+        pass
+
+class SleepyResponses:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def create(self, input, **params):
+        # Model calls are always streamed, see llm.py
+        return SleepyStream(self.latency, "Day 1: beach. Day 2: seafood. Day 3: rest.")
+
+class SleepyQuery:
+    def __init__(self, latency: float, rows: list):
+        self.latency = latency
+        self.rows = rows
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(data=self.rows)
+
+class SleepyDatabase:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def table(self, name: str):
+        row = {
+            "id": 1,
+            "mood": "relaxed",
+            "preferences": "beach, seafood",
+            "content": "Day 1: beach.",
+            "user_id": "benchmark-user",
+            "is_favorite": False,
+            "created_at": "2025-01-01T00:00:00+00:00",
+            "updated_at": "2025-01-01T00:00:00+00:00"
+        }
+        return SleepyQuery(self.latency, [row])
+
+async def run_level(app, concurrency: int, requests_per_worker: int) -> dict:
+    payload = {"mood": "relaxed", "preferences": "beach, seafood", "cache": "bypass"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as http:
+        async def worker():
+            for _ in range(requests_per_worker):
+                response = await http.post("/generate", json=payload)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    total = concurrency * requests_per_worker
+    return {"concurrency": concurrency, "requests": total, "seconds": elapsed, "rps": total / elapsed}
+
+async def run(latency: float, db_latency: float, levels: list, requests_per_worker: int):
+    model.openai_provider.override(SimpleNamespace(responses=SleepyResponses(latency)))
+    database.db_provider.override(SleepyDatabase(db_latency))
+    main.app.dependency_overrides[main.get_current_user] = lambda: SimpleNamespace(id="benchmark-user")
+    # Every request comes from one user; measure the service layer, not admission control
+    main.llm_admission.max_concurrency = max(levels)
+    main.llm_admission.user_queue_size = max(levels)
+    main.llm_admission.budget = None
+
+    print(f"{'in-flight':>10} {'requests':>9} {'seconds':>9} {'req/s':>9}")
+    for concurrency in levels:
+        result = await run_level(main.app, concurrency, requests_per_worker)
+        print(f"{result['concurrency']:>10} {result['requests']:>9} {result['seconds']:>9.2f} {result['rps']:>9.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.5, help="simulated OpenAI latency in seconds")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="simulated PostgREST latency in seconds")
+    parser.add_argument("--levels", default="1,4,16,64", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=4, help="requests per in-flight worker")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",")]
+    asyncio.run(run(args.latency, args.db_latency, levels, args.requests))
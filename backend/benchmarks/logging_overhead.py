@@ -0,0 +1,90 @@
+"""
+Time spent on the calling thread per log line, and per request at a given
+number of lines, for the previous per-logger FileHandler + stdout setup
+and for the queue-based setup in logger.py. Output goes to a temporary
+directory and /dev/null so terminal speed does not skew the numbers.
+
+Usage (from backend/):
+    python -m benchmarks.logging_overhead --lines 20000 --lines-per-request 6
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from logger import TEXT_FORMAT, build_queue_handler, skip_unused_record_fields
+
+def legacy_logger(name: str, logs_dir: Path, stream) -> logging.Logger:
+    """The previous setup_logger: a file and a console handler added on every call."""
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    file_handler = logging.FileHandler(logs_dir / f"{name}.log", encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    logger.addHandler(file_handler)
+    logger.addHandler(console_handler)
+    return logger
+
+def queued_logger(name: str, logs_dir: Path, stream, sample_rate: float = 1.0):
+    """The queue-based setup from logger.py, built against the benchmark's own outputs."""
+    file_handler = logging.handlers.RotatingFileHandler(logs_dir / "queued.log", maxBytes=50 * 1024 * 1024)
+    file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    console_handler = logging.StreamHandler(stream)
+    console_handler.setFormatter(logging.Formatter('%(levelname)s: %(message)s'))
+    queue_handler = build_queue_handler(sample_rate)
+    listener = logging.handlers.QueueListener(queue_handler.queue, file_handler, console_handler)
+    listener.start()
+
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    return logger, listener
+
+def time_lines(logger: logging.Logger, lines: int) -> float:
+    start = time.perf_counter()
+    for i in range(lines):
+        logger.info(f"Successfully saved refinement version {i} to history")
+    return (time.perf_counter() - start) / lines
+
+def run(lines: int, lines_per_request: int):
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        logs_dir = Path(tmp)
+        results = []
+
+        results.append(("legacy", time_lines(legacy_logger("bench.legacy", logs_dir, devnull), lines)))
+
+        # "auth" used to be set up from two modules, doubling every line
+        duplicated = legacy_logger("bench.duplicated", logs_dir, devnull)
+        legacy_logger("bench.duplicated", logs_dir, devnull)
+        results.append(("legacy, set up twice", time_lines(duplicated, lines)))
+
+        logger, listener = queued_logger("bench.queued", logs_dir, devnull)
+        results.append(("queued", time_lines(logger, lines)))
+        listener.stop()
+
+        # What LOG_SKIP_RECORD_FIELDS=true applies process-wide
+        skip_unused_record_fields()
+
+        logger, listener = queued_logger("bench.skipped", logs_dir, devnull)
+        results.append(("queued, record fields skipped", time_lines(logger, lines)))
+        listener.stop()
+
+        logger, listener = queued_logger("bench.sampled", logs_dir, devnull, sample_rate=0.1)
+        results.append(("queued, 10% INFO sampled", time_lines(logger, lines)))
+        listener.stop()
+
+    print(f"{'setup':>30} {'us/line':>9} {'us/request':>11}")
+    for name, seconds in results:
+        print(f"{name:>30} {seconds * 1e6:>9.2f} {seconds * lines_per_request * 1e6:>11.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--lines-per-request", type=int, default=6, help="log lines written by a typical request")
+    args = parser.parse_args()
+    run(args.lines, args.lines_per_request)
@@ -0,0 +1,59 @@
+"""
+Per-request cost of the metrics instrumentation: a span, a histogram
+observation and a full pass through MetricsMiddleware around a no-op
+ASGI app, compared with calling the app directly.
+
+Usage (from backend/):
+    python -m benchmarks.metrics_overhead --iterations 100000
+"""
+import argparse
+import asyncio
+import time
+
+from metrics import Histogram, MetricsMiddleware, span
+
+async def noop_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+async def send(message):
+    pass
+
+async def time_app(app, iterations: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/bench"}
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / iterations
+
+def time_span(iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        with span("bench"):
+            pass
+    return (time.perf_counter() - start) / iterations
+
+def time_observe(iterations: int) -> float:
+    histogram = Histogram("bench_seconds", "Benchmark histogram.", ("route",))
+    start = time.perf_counter()
+    for i in range(iterations):
+        histogram.observe(i % 100 / 1000, ("/bench",))
+    return (time.perf_counter() - start) / iterations
+
+async def run(iterations: int):
+    bare = await time_app(noop_app, iterations)
+    instrumented = await time_app(MetricsMiddleware(noop_app), iterations)
+    print(f"{'span':>22} {time_span(iterations) * 1e6:>8.2f} us")
+    print(f"{'histogram observe':>22} {time_observe(iterations) * 1e6:>8.2f} us")
+    print(f"{'bare ASGI call':>22} {bare * 1e6:>8.2f} us")
+    print(f"{'with middleware':>22} {instrumented * 1e6:>8.2f} us")
+    print(f"{'middleware overhead':>22} {(instrumented - bare) * 1e6:>8.2f} us per request")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(run(args.iterations))
@@ -0,0 +1,107 @@
+"""
+Latency of GET /itineraries/search as a user's itinerary count grows.
+
+First times the in-process index (SEARCH_BACKEND=memory) directly at each
+size: build time and per-query p50/p99. Then seeds one user per size
+straight into the fake PostgREST and measures the endpoint end to end,
+the first (index building) search apart from the warm ones.
+
+Usage (from backend/):
+    python -m benchmarks.search --sizes 100,1000,10000,50000 --queries 200
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+
+import httpx
+
+from benchmarks.suite import MOODS, PREFERENCES, Services, make_token, percentile
+from search import UserIndex
+from semantic import tokenize
+
+PLACES = [
+    "harbour", "old town", "cathedral", "night market", "botanical garden", "castle", "riverside", "vineyard",
+    "fish market", "jazz club", "hot springs", "lighthouse", "gallery", "food hall", "temple", "ridge trail",
+    "lagoon", "bookshop", "rooftop bar", "ceramics studio", "sand dunes", "monastery", "tram museum", "oyster bar"
+]
+ACTIVITIES = ["Walk to", "Lunch at", "Visit the", "Kayak past the", "Sunset at", "Coffee near the", "Tour the"]
+QUERIES = ["lighthouse", "oyster bar", "jazz", "hot springs sunset", "ceramics", "cathedral coffee", "vineyard"]
+
+def random_itinerary(rng: random.Random) -> dict:
+    days = []
+    for day in range(1, rng.randint(2, 4) + 1):
+        slots = [f"- {rng.choice(ACTIVITIES)} {rng.choice(PLACES)}" for _ in range(4)]
+        days.append(f"## Day {day}\n" + "\n".join(slots))
+    return {"mood": rng.choice(MOODS), "preferences": rng.choice(PREFERENCES), "content": "\n\n".join(days)}
+
+def run_index(sizes, queries: int, rng: random.Random) -> None:
+    print(f"{'itineraries':>12} {'build (s)':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'matches':>8}")
+    for size in sizes:
+        rows = [random_itinerary(rng) for _ in range(size)]
+        index = UserIndex()
+        start = time.perf_counter()
+        for itinerary_id, row in enumerate(rows, 1):
+            index.put(itinerary_id, row["mood"], row["preferences"], row["content"], [])
+        build = time.perf_counter() - start
+
+        latencies, matches = [], 0
+        for _ in range(queries):
+            terms = tokenize(rng.choice(QUERIES))
+            start = time.perf_counter()
+            hits = index.search(terms, 21)
+            latencies.append(time.perf_counter() - start)
+            matches += len(index.postings.get(terms[0], {}))
+        latencies.sort()
+        print(f"{size:>12} {build:>10.2f} {percentile(latencies, 0.5) * 1000:>9.2f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.2f} {matches // queries:>8}")
+
+async def run_api(args, sizes, rng: random.Random) -> None:
+    services = Services(args)
+    await services.start()
+    try:
+        async with httpx.AsyncClient(base_url=services.fake_url, timeout=args.timeout) as fake, \
+                httpx.AsyncClient(base_url=services.app_url, timeout=args.timeout) as http:
+            print(f"{'itineraries':>12} {'first (ms)':>11} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+            for size in sizes:
+                user_id = str(uuid.uuid4())
+                for offset in range(0, size, 1000):
+                    rows = [{**random_itinerary(rng), "user_id": user_id} for _ in range(min(1000, size - offset))]
+                    (await fake.post("/rest/v1/itineraries", json=rows)).raise_for_status()
+                headers = {"Authorization": f"Bearer {make_token(user_id, args.jwt_secret)}"}
+
+                start = time.perf_counter()
+                (await http.get("/itineraries/search", params={"q": QUERIES[0]}, headers=headers)).raise_for_status()
+                first = time.perf_counter() - start
+                latencies = []
+                for _ in range(args.api_queries):
+                    start = time.perf_counter()
+                    response = await http.get("/itineraries/search", params={"q": rng.choice(QUERIES)}, headers=headers)
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+                latencies.sort()
+                print(f"{size:>12} {first * 1000:>11.1f} {percentile(latencies, 0.5) * 1000:>9.2f} "
+                      f"{percentile(latencies, 0.99) * 1000:>9.2f}")
+    finally:
+        services.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="itineraries per user")
+    parser.add_argument("--queries", type=int, default=200, help="queries per size against the index")
+    parser.add_argument("--api-queries", type=int, default=50, help="queries per size against the API")
+    parser.add_argument("--api-sizes", default="100,1000,10000", help="itineraries per user seeded into the fakes")
+    parser.add_argument("--jwt-secret", default="benchmark-secret")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show output of the spawned servers")
+    args = parser.parse_args()
+    # Settings the shared Services runner expects
+    args.__dict__.update(
+        latency=0.0, tokens_per_second=400, db_latency=0.0, error_rate=0.0, stall_rate=0.0, stall_latency=10.0,
+        model_speed="", auth_mode="local", app_workers=1, app_url=None, fake_url=None
+    )
+    rng = random.Random(args.seed)
+    run_index([int(size) for size in args.sizes.split(",")], args.queries, rng)
+    asyncio.run(run_api(args, [int(size) for size in args.api_sizes.split(",")], rng))
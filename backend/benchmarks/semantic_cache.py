@@ -0,0 +1,144 @@
+"""
+Lookup latency of the semantic generation cache at 100k entries, plus the
+cost of a warm restart from the memory-mapped file and a check that
+paraphrased requests match while unrelated ones do not.
+
+Usage (from backend/):
+    python -m benchmarks.semantic_cache --entries 100000 --lookups 2000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.suite import percentile
+from semantic import (
+    SEMANTIC_CACHE_WRITE_BATCH, SEMANTIC_CACHE_WRITE_INTERVAL, HashingEmbedder, SemanticCache, SemanticIndex, params_namespace
+)
+
+MOODS = [
+    "relaxed", "adventurous", "romantic", "curious", "nostalgic", "energetic", "lazy", "social", "reflective",
+    "festive", "calm", "wild", "cozy", "bold", "dreamy", "playful", "quiet", "hungry", "artsy", "sporty"
+]
+PREFERENCES = [
+    "beach", "seafood", "museums", "coffee", "hiking", "street food", "nightlife", "wine", "architecture",
+    "markets", "jazz", "surfing", "castles", "gardens", "vegan food", "shopping", "photography", "spas",
+    "cycling", "history", "temples", "lakes", "skiing", "theatre", "craft beer", "kayaking", "bookshops"
+]
+PARAMS = {"model": "gpt-4o", "temperature": 0.8}
+# (stored, paraphrase) pairs that should match
+PARAPHRASES = [
+    (("chill and relaxed", "beach, seafood"), ("relaxed, want to chill", "Seafood, beaches")),
+    (("adventurous", "hiking, kayaking"), ("feeling really adventurous", "kayaking and hiking")),
+    (("romantic", "wine, sunsets"), ("romantic", "sunset, wine")),
+]
+# (stored, different request) pairs that should not
+DIFFERENT = [
+    (("chill and relaxed", "beach, seafood"), ("chill and relaxed", "museums, coffee")),
+    (("adventurous", "hiking, kayaking"), ("nostalgic", "bookshops")),
+    (("romantic", "wine, sunsets"), ("romantic", None)),
+]
+
+def random_request(rng: random.Random):
+    mood = " ".join(rng.sample(MOODS, rng.randint(1, 2)))
+    preferences = ", ".join(rng.sample(PREFERENCES, rng.randint(0, 3))) or None
+    return mood, preferences
+
+def fill(index: SemanticIndex, embedder: HashingEmbedder, entries: int, rng: random.Random) -> float:
+    namespace = params_namespace(PARAMS)
+    start = time.perf_counter()
+    # Writing the matrix directly; SemanticIndex.add also records each entry in SQLite
+    batch = 1000
+    for offset in range(0, entries, batch):
+        count = min(batch, entries - offset)
+        vectors = embedder.embed_batch([random_request(rng) for _ in range(count)])
+        index.vectors[:, offset:offset + count] = vectors.T
+    index.namespaces[:entries] = namespace
+    index.valid[:entries] = True
+    index.values[:entries] = ["itinerary"] * entries
+    index.size = entries
+    return time.perf_counter() - start
+
+def time_lookups(cache: SemanticCache, requests, batch_size: int):
+    latencies = []
+    for offset in range(0, len(requests), batch_size):
+        chunk = requests[offset:offset + batch_size]
+        start = time.perf_counter()
+        if batch_size == 1:
+            cache.lookup(chunk[0][0], chunk[0][1], PARAMS)
+        else:
+            cache.lookup_batch(chunk, PARAMS)
+        latencies.append((time.perf_counter() - start) / len(chunk))
+    return sorted(latencies)
+
+def run(entries: int, lookups: int, dim: int, threshold: float) -> None:
+    rng = random.Random(42)
+    embedder = HashingEmbedder(dim)
+    index = SemanticIndex(dim, entries)
+    seconds = fill(index, embedder, entries, rng)
+    print(f"{entries} entries, dim {dim}: embedded and loaded in {seconds:.1f}s")
+    cache = SemanticCache(embedder, index, threshold, top_k=3)
+
+    requests = [random_request(rng) for _ in range(lookups)]
+    start = time.perf_counter()
+    for mood, preferences in requests:
+        embedder.embed(mood, preferences)
+    embed_us = (time.perf_counter() - start) / lookups * 1e6
+    query = embedder.embed(*requests[0])
+    start = time.perf_counter()
+    for _ in range(lookups // 10):
+        index.search(query, params_namespace(PARAMS), 3, threshold)
+    search_us = (time.perf_counter() - start) / (lookups // 10) * 1e6
+    print(f"embed: {embed_us:.1f}us per request, search only: {search_us:.1f}us")
+
+    print(f"{'batch':>6} {'p50 (us)':>10} {'p99 (us)':>10}   per request, embedding included")
+    for batch_size in (1, 16, 64):
+        latencies = time_lookups(cache, requests, batch_size)
+        print(f"{batch_size:>6} {percentile(latencies, 0.5) * 1e6:>10.1f} {percentile(latencies, 0.99) * 1e6:>10.1f}")
+    print(f"hit rate on random requests: {cache.hits / max(1, cache.hits + cache.misses):.2%}")
+
+    # Matching quality on a small cache with the default threshold
+    quality = SemanticCache(embedder, SemanticIndex(dim, 64), threshold, top_k=1)
+    for (stored, _) in PARAPHRASES:
+        quality.store(*stored, PARAMS, f"{stored}")
+    for stored, asked in PARAPHRASES + DIFFERENT:
+        similarity = float(embedder.embed(*stored) @ embedder.embed(*asked))
+        served = quality.lookup(*asked, PARAMS) is not None
+        print(f"  {str(asked):<48} vs {str(stored):<40} similarity {similarity:.2f} -> {'hit' if served else 'miss'}")
+
+def run_restart(entries: int, dim: int) -> None:
+    rng = random.Random(7)
+    embedder = HashingEmbedder(dim)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "semantic")
+        index = SemanticIndex(dim, entries, path)
+        start = time.perf_counter()
+        for _ in range(entries):
+            index.add(embedder.embed(*random_request(rng)), params_namespace(PARAMS), "itinerary " * 300)
+            if index.writes_due(SEMANTIC_CACHE_WRITE_BATCH, SEMANTIC_CACHE_WRITE_INTERVAL):
+                index.flush()
+        index.close()
+        add_ms = (time.perf_counter() - start) / entries * 1e3
+
+        start = time.perf_counter()
+        reopened = SemanticIndex(dim, entries, path)
+        load_seconds = time.perf_counter() - start
+        assert len(reopened) == entries and np.count_nonzero(reopened.vectors[:, :entries].any(axis=0)) == entries
+        reopened.close()
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        print(f"persistent: {add_ms:.2f}ms per add, {entries} entries reopened in {load_seconds:.2f}s, "
+              f"{size / 1e6:.0f} MB on disk")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--threshold", type=float, default=0.9)
+    parser.add_argument("--restart-entries", type=int, default=20000, help="entries written through SQLite and reopened")
+    args = parser.parse_args()
+    run(args.entries, args.lookups, args.dim, args.threshold)
+    run_restart(args.restart_entries, args.dim)
@@ -0,0 +1,115 @@
+"""
+Benchmark of speculative refinement (SPECULATION_ENABLED).
+
+Starts the fakes and the API twice, with speculation off and on. Each
+simulated user generates an itinerary, pauses for `--think-time` seconds
+and then asks for one refinement, drawn from the speculated candidates
+with probability `--likely-share` and from other requests otherwise.
+Reports refine latency for both runs and, for the speculative run, hit
+rate and wasted tokens from /metrics.
+
+Usage (from backend/):
+    python -m benchmarks.speculation --users 40 --think-time 1.5 --likely-share 0.7
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.suite import MOODS, PREFERENCES, Services, make_token, percentile
+
+LIKELY = ["Make it cheaper", "Add more food experiences", "Less walking"]
+UNLIKELY = ["Swap the museum for a hike", "Add a day trip to the coast", "Start each day later"]
+
+def metric_values(text: str, name: str) -> Dict[str, float]:
+    """Label string -> value for one metric in Prometheus text format."""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith(name + "{"):
+            labels, _, value = line[len(name):].rpartition(" ")
+            values[labels] = float(value)
+    return values
+
+async def user_session(http: httpx.AsyncClient, rng: random.Random, args, latencies: List[float]) -> None:
+    headers = {"Authorization": f"Bearer {make_token(str(uuid.uuid4()), args.jwt_secret)}"}
+    payload = {"mood": rng.choice(MOODS), "preferences": rng.choice(PREFERENCES), "cache": "bypass"}
+    response = await http.post("/generate", json=payload, headers=headers)
+    response.raise_for_status()
+    await asyncio.sleep(args.think_time * (0.5 + rng.random()))
+
+    request = rng.choice(LIKELY if rng.random() < args.likely_share else UNLIKELY)
+    started = time.perf_counter()
+    response = await http.post(
+        "/refine", json={"itinerary_id": response.json()["id"], "refinement_request": request}, headers=headers
+    )
+    response.raise_for_status()
+    latencies.append(time.perf_counter() - started)
+
+async def run(args, speculation: bool) -> dict:
+    os.environ["SPECULATION_ENABLED"] = "true" if speculation else "false"
+    os.environ["SPECULATION_REFINEMENTS"] = "|".join(LIKELY)
+    services = Services(args)
+    await services.start()
+    try:
+        rng = random.Random(args.seed)
+        latencies: List[float] = []
+        async with httpx.AsyncClient(base_url=services.app_url, timeout=args.timeout) as http:
+            sessions = []
+            for _ in range(args.users):
+                sessions.append(asyncio.create_task(user_session(http, rng, args, latencies)))
+                await asyncio.sleep(args.arrival_interval)
+            await asyncio.gather(*sessions)
+            metrics = (await http.get("/metrics")).text
+    finally:
+        services.stop()
+
+    ordered = sorted(latencies)
+    requests = metric_values(metrics, "wandergen_speculation_requests_total")
+    tokens = metric_values(metrics, "wandergen_speculation_tokens_total")
+    llm_tokens = metric_values(metrics, "wandergen_llm_tokens_total")
+    hits = requests.get('{result="hit"}', 0.0)
+    lookups = hits + requests.get('{result="miss"}', 0.0)
+    return {
+        "speculation": speculation,
+        "refine_ms": {
+            "p50": percentile(ordered, 0.50) * 1000,
+            "p95": percentile(ordered, 0.95) * 1000,
+            "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0
+        },
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "speculation_tokens_used": tokens.get('{kind="used"}', 0.0),
+        "speculation_tokens_wasted": tokens.get('{kind="wasted"}', 0.0),
+        "llm_tokens_total": sum(llm_tokens.values())
+    }
+
+async def main(args) -> None:
+    results = [await run(args, False), await run(args, True)]
+    for result in results:
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40)
+    parser.add_argument("--arrival-interval", type=float, default=0.1, help="seconds between users starting")
+    parser.add_argument("--think-time", type=float, default=1.5, help="mean pause between generate and refine")
+    parser.add_argument("--likely-share", type=float, default=0.7, help="share of refinements that were speculated")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake OpenAI seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="fake OpenAI output token rate")
+    parser.add_argument("--model-speed", default="", help="fake OpenAI speed-up per model")
+    parser.add_argument("--jwt-secret", default="benchmark-secret")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="show output of the spawned servers")
+    args = parser.parse_args()
+    # Settings the shared Services runner expects
+    args.__dict__.update(
+        db_latency=0.0, error_rate=0.0, stall_rate=0.0, stall_latency=10.0,
+        auth_mode="local", app_workers=1, app_url=None, fake_url=None
+    )
+    asyncio.run(main(args))
@@ -0,0 +1,71 @@
+"""
+Cold start cost of the API: the time to import main in a fresh interpreter,
+and the time from launching uvicorn until /health and /ready answer 200.
+Clients are built from placeholder settings and never contact anything.
+
+Usage (from backend/):
+    python -m benchmarks.startup_time --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.suite import free_port
+
+ENV = {
+    "OPENAI_API_KEY": "sk-benchmark",
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_KEY": "benchmark",
+    "LOG_TO_FILE": "false",
+    "LOG_TO_CONSOLE": "false"
+}
+
+def import_time(env: dict) -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+def wait_for(http: httpx.Client, url: str, start: float, timeout: float = 30) -> float:
+    while time.perf_counter() - start < timeout:
+        try:
+            if http.get(url).status_code == 200:
+                return time.perf_counter() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer 200 within {timeout}s")
+
+def serve_times(env: dict) -> tuple:
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1) as http:
+            health = wait_for(http, "/health", start)
+            ready = wait_for(http, "/ready", start)
+        return health, ready
+    finally:
+        process.terminate()
+        process.wait()
+
+def run(runs: int):
+    env = {**os.environ, **ENV}
+    imports = [import_time(env) for _ in range(runs)]
+    serves = [serve_times(env) for _ in range(runs)]
+    print(f"{'import main':>16} {statistics.median(imports) * 1000:>8.0f} ms (median of {runs})")
+    print(f"{'/health up':>16} {statistics.median(s[0] for s in serves) * 1000:>8.0f} ms")
+    print(f"{'/ready up':>16} {statistics.median(s[1] for s in serves) * 1000:>8.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
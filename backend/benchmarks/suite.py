@@ -0,0 +1,334 @@
+"""
+End-to-end load test of the API against the local fakes in benchmarks.fakes.
+
+Starts the fake OpenAI/PostgREST/GoTrue server and the FastAPI app from
+main.py as separate processes, seeds itineraries for a pool of users, then
+drives each scenario at every concurrency level and writes latency
+percentiles, throughput and error rates to a JSON file. Results from two
+commits can be compared with benchmarks.compare.
+
+Usage (from backend/):
+    python -m benchmarks.suite --concurrency 1,8,32 --requests 200 --output bench.json
+    python -m benchmarks.suite --app-url http://127.0.0.1:8000 --fake-url http://127.0.0.1:54321
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+import jwt
+
+SCENARIOS = ["generate", "refine", "itineraries", "history", "favorite", "revert"]
+MOODS = ["relaxed", "adventurous", "romantic", "curious", "nostalgic"]
+PREFERENCES = ["beach, seafood", "museums, coffee", "hiking", None, "street food, nightlife"]
+REFINEMENTS = ["Make it cheaper", "Add more outdoor activities", "Swap dinner for something vegetarian"]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def make_token(user_id: str, secret: str, ttl: int = 3600) -> str:
+    claims = {
+        "sub": user_id,
+        "email": f"{user_id}@example.com",
+        "aud": "authenticated",
+        "role": "authenticated",
+        "exp": int(time.time()) + ttl
+    }
+    return jwt.encode(claims, secret, algorithm="HS256")
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def summarize(scenario: str, concurrency: int, latencies: List[float], errors: int, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    total = len(latencies)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "throughput_rps": total / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(ordered, 0.50) * 1000,
+            "p95": percentile(ordered, 0.95) * 1000,
+            "p99": percentile(ordered, 0.99) * 1000,
+            "mean": sum(ordered) / total * 1000 if total else 0.0,
+            "max": ordered[-1] * 1000 if ordered else 0.0
+        }
+    }
+
+def git_revision() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+class Services:
+    """The fake upstream and the API, each in its own process."""
+
+    def __init__(self, args):
+        self.args = args
+        self.processes: List[subprocess.Popen] = []
+        self.fake_url = args.fake_url
+        self.app_url = args.app_url
+
+    def spawn(self, command: List[str], env: Dict[str, str]) -> None:
+        log = open(os.devnull, "w") if not self.args.verbose else None
+        self.processes.append(subprocess.Popen(command, env=env, stdout=log, stderr=log))
+
+    async def wait_until_up(self, url: str, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as http:
+            while True:
+                try:
+                    if (await http.get(url)).status_code < 500:
+                        return
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout}s")
+                await asyncio.sleep(0.1)
+
+    async def start(self) -> None:
+        env = dict(os.environ)
+        if self.fake_url is None:
+            port = free_port()
+            self.fake_url = f"http://127.0.0.1:{port}"
+            self.spawn([
+                sys.executable, "-m", "benchmarks.fakes",
+                "--port", str(port),
+                "--latency", str(self.args.latency),
+                "--tokens-per-second", str(self.args.tokens_per_second),
+                "--db-latency", str(self.args.db_latency),
+                "--error-rate", str(self.args.error_rate),
+                "--stall-rate", str(self.args.stall_rate),
+                "--stall-latency", str(self.args.stall_latency),
+                "--model-speed", self.args.model_speed,
+                "--jwt-secret", self.args.jwt_secret
+            ], env)
+            await self.wait_until_up(f"{self.fake_url}/stats")
+
+        if self.app_url is None:
+            port = free_port()
+            self.app_url = f"http://127.0.0.1:{port}"
+            env.update({
+                "OPENAI_API_KEY": "sk-benchmark",
+                "OPENAI_BASE_URL": f"{self.fake_url}/v1",
+                "SUPABASE_URL": self.fake_url,
+                "SUPABASE_KEY": "benchmark",
+                "SUPABASE_JWT_SECRET": self.args.jwt_secret,
+                "AUTH_VERIFY_MODE": self.args.auth_mode,
+                # The fake PostgREST has no full-text search function
+                "SEARCH_BACKEND": "memory"
+            })
+            self.spawn([
+                sys.executable, "-m", "uvicorn", "main:app",
+                "--host", "127.0.0.1", "--port", str(port),
+                "--workers", str(self.args.app_workers),
+                "--log-level", "warning"
+            ], env)
+            await self.wait_until_up(f"{self.app_url}/health")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+class LoadTest:
+    """Seeds data through the API and runs each scenario against it."""
+
+    def __init__(self, http: httpx.AsyncClient, users: List[str], secret: str, use_cache: bool, seed: int):
+        self.http = http
+        self.rng = random.Random(seed)
+        self.use_cache = use_cache
+        self.headers = {user: {"Authorization": f"Bearer {make_token(user, secret)}"} for user in users}
+        self.users = users
+        self.itineraries: Dict[str, List[int]] = {user: [] for user in users}
+
+    def pick_user(self) -> str:
+        return self.rng.choice(self.users)
+
+    def pick_itinerary(self):
+        user = self.rng.choice([user for user in self.users if self.itineraries[user]])
+        return user, self.rng.choice(self.itineraries[user])
+
+    async def generate(self) -> httpx.Response:
+        user = self.pick_user()
+        payload = {
+            "mood": self.rng.choice(MOODS),
+            "preferences": self.rng.choice(PREFERENCES),
+            "cache": "default" if self.use_cache else "bypass"
+        }
+        response = await self.http.post("/generate", json=payload, headers=self.headers[user])
+        if response.status_code == 200:
+            self.itineraries[user].append(response.json()["id"])
+        return response
+
+    async def refine(self) -> httpx.Response:
+        user, itinerary_id = self.pick_itinerary()
+        payload = {"itinerary_id": itinerary_id, "refinement_request": self.rng.choice(REFINEMENTS)}
+        return await self.http.post("/refine", json=payload, headers=self.headers[user])
+
+    async def itineraries_page(self) -> httpx.Response:
+        user = self.pick_user()
+        return await self.http.get("/itineraries", params={"limit": 20}, headers=self.headers[user])
+
+    async def history(self) -> httpx.Response:
+        user, itinerary_id = self.pick_itinerary()
+        return await self.http.get(f"/history/{itinerary_id}", headers=self.headers[user])
+
+    async def favorite(self) -> httpx.Response:
+        user, itinerary_id = self.pick_itinerary()
+        payload = {"is_favorite": self.rng.random() < 0.5}
+        return await self.http.post(f"/itineraries/{itinerary_id}/favorite", json=payload, headers=self.headers[user])
+
+    async def revert(self) -> httpx.Response:
+        user, itinerary_id = self.pick_itinerary()
+        return await self.http.post(f"/revert/{itinerary_id}", headers=self.headers[user])
+
+    def scenario(self, name: str) -> Callable[[], Awaitable[httpx.Response]]:
+        return {
+            "generate": self.generate,
+            "refine": self.refine,
+            "itineraries": self.itineraries_page,
+            "history": self.history,
+            "favorite": self.favorite,
+            "revert": self.revert
+        }[name]
+
+    async def seed(self, per_user: int, refinements: int, concurrency: int) -> None:
+        """Give every user itineraries to list, and some of them history."""
+        await self.run("seed", self.generate, len(self.users) * per_user, concurrency)
+        if not any(self.itineraries.values()):
+            raise RuntimeError("Seeding failed, no itineraries were created")
+        await self.run("seed", self.refine, refinements, concurrency)
+
+    async def run(self, name: str, call: Callable[[], Awaitable[httpx.Response]],
+                  total: int, concurrency: int) -> dict:
+        latencies: List[float] = []
+        errors = 0
+        remaining = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for _ in remaining:
+                start = time.perf_counter()
+                try:
+                    response = await call()
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return summarize(name, concurrency, latencies, errors, time.perf_counter() - start)
+
+async def run(args) -> dict:
+    services = Services(args)
+    try:
+        await services.start()
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=services.app_url, timeout=args.timeout, limits=limits) as http:
+            users = [f"00000000-0000-4000-8000-{index:012d}" for index in range(args.users)]
+            load = LoadTest(http, users, args.jwt_secret, args.use_cache, args.seed)
+            await load.seed(args.seed_itineraries, args.seed_refinements, max(args.concurrency))
+
+            results = []
+            for name in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = await load.run(name, load.scenario(name), args.requests, concurrency)
+                    results.append(result)
+                    print(
+                        f"{name:>12} c={concurrency:<4} {result['throughput_rps']:>8.1f} req/s  "
+                        f"p50 {result['latency_ms']['p50']:>8.1f}ms  p95 {result['latency_ms']['p95']:>8.1f}ms  "
+                        f"p99 {result['latency_ms']['p99']:>8.1f}ms  errors {result['error_rate']:.1%}"
+                    )
+
+            async with httpx.AsyncClient(base_url=services.fake_url) as fake:
+                upstream = (await fake.get("/stats")).json()
+    finally:
+        services.stop()
+
+    return {
+        **git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "db_latency": args.db_latency,
+            "error_rate": args.error_rate,
+            "stall_rate": args.stall_rate,
+            "model_speed": args.model_speed,
+            "users": args.users,
+            "requests": args.requests,
+            "use_cache": args.use_cache,
+            "auth_mode": args.auth_mode,
+            "app_workers": args.app_workers
+        },
+        "upstream": upstream,
+        "results": results
+    }
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--seed-itineraries", type=int, default=5, help="itineraries generated per user before measuring")
+    parser.add_argument("--seed-refinements", type=int, default=50, help="refinements made before measuring")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake OpenAI seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="fake OpenAI output token rate")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="added fake PostgREST latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of fake OpenAI calls failing")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="share of fake OpenAI calls stalling before the first token")
+    parser.add_argument("--stall-latency", type=float, default=10.0, help="seconds a stalled fake OpenAI call waits")
+    parser.add_argument("--model-speed", default="gpt-4o-mini=3", help="fake OpenAI speed-up per model")
+    parser.add_argument("--use-cache", action="store_true", help="let /generate use the generation cache")
+    parser.add_argument("--auth-mode", default="local", choices=["local", "remote"])
+    parser.add_argument("--app-workers", type=int, default=1, help="uvicorn worker processes for the API")
+    parser.add_argument("--app-url", help="benchmark an already running API instead of starting one")
+    parser.add_argument("--fake-url", help="use an already running benchmarks.fakes server")
+    parser.add_argument("--jwt-secret", default="benchmark-secret")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--verbose", action="store_true", help="show output of the spawned servers")
+    args = parser.parse_args(argv)
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(level) for level in args.concurrency.split(",")]
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import random
+import time
+from collections import OrderedDict
+from typing import List, Optional
+from dotenv import load_dotenv
+from logger import setup_logger
+
+# Setup logger
+logger = setup_logger("cache")
+
+# Load environment variables
+load_dotenv()
+
+GENERATION_CACHE_SIZE = int(os.getenv("GENERATION_CACHE_SIZE", "1024"))
+GENERATION_CACHE_TTL = float(os.getenv("GENERATION_CACHE_TTL", "3600"))
+GENERATION_CACHE_VARIANTS = int(os.getenv("GENERATION_CACHE_VARIANTS", "3"))
+GENERATION_CACHE_REDIS_URL = os.getenv("GENERATION_CACHE_REDIS_URL")
+
+def normalize_text(value: Optional[str]) -> str:
+    return " ".join(value.lower().split()) if value else ""
+
+def normalize_preferences(preferences: Optional[str]) -> str:
+    """
+    Lowercase, trim, de-duplicate and sort comma separated preferences so
+    "Seafood, beach" and "beach,seafood" share a cache entry.
+    """
+    items = {normalize_text(item) for item in (preferences or "").split(",")}
+    return ", ".join(sorted(item for item in items if item))
+
+def generation_cache_key(mood: str, preferences: Optional[str], params: dict) -> str:
+    """
+    Build a cache key from the normalized prompt inputs and the model parameters.
+    """
+    payload = {
+        "mood": normalize_text(mood),
+        "preferences": normalize_preferences(preferences),
+        "params": params
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class CacheTier:
+    """Storage backend holding a bounded pool of variants per key."""
+
+    async def get_variants(self, key: str) -> List[str]:
+        raise NotImplementedError
+
+    async def add_variant(self, key: str, value: str, max_variants: int, ttl: float) -> None:
+        raise NotImplementedError
+
+class LRUCacheTier(CacheTier):
+    """In-process tier with a bound on the number of keys and per-entry expiry."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get_variants(self, key: str) -> List[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return []
+
+        now = time.monotonic()
+        live = [(value, expires_at) for value, expires_at in entry if expires_at > now]
+        if not live:
+            del self._entries[key]
+            return []
+
+        self._entries[key] = live
+        self._entries.move_to_end(key)
+        return [value for value, _ in live]
+
+    async def add_variant(self, key: str, value: str, max_variants: int, ttl: float) -> None:
+        now = time.monotonic()
+        entry = [(v, expires_at) for v, expires_at in self._entries.get(key, []) if expires_at > now]
+        entry.append((value, now + ttl))
+        self._entries[key] = entry[-max_variants:]
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+class RedisCacheTier(CacheTier):
+    """
+    Shared tier backed by any Redis-compatible server (Redis, Valkey, KeyDB),
+    so that workers and replicas reuse each other's generations.
+    """
+
+    def __init__(self, url: str, prefix: str = "wandergen:generation:"):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise ValueError("The redis package is required when GENERATION_CACHE_REDIS_URL is set") from e
+        self._redis = redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    async def get_variants(self, key: str) -> List[str]:
+        return await self._redis.lrange(self.prefix + key, 0, -1)
+
+    async def add_variant(self, key: str, value: str, max_variants: int, ttl: float) -> None:
+        name = self.prefix + key
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(name, value)
+            pipe.ltrim(name, -max_variants, -1)
+            pipe.expire(name, int(ttl))
+            await pipe.execute()
+
+class GenerationCache:
+    """
+    Two-tier cache of generated itineraries. A key is only served once its
+    pool holds max_variants generations; until then requests miss
+    and their results are added, so users still see some variety.
+    """
+
+    def __init__(self, local: CacheTier, shared: Optional[CacheTier] = None,
+                 max_variants: int = 3, ttl: float = 3600):
+        self.local = local
+        self.shared = shared
+        self.max_variants = max(1, max_variants)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    async def lookup(self, key: str) -> Optional[str]:
+        variants = await self.local.get_variants(key)
+        if len(variants) < self.max_variants and self.shared is not None:
+            try:
+                shared = await self.shared.get_variants(key)
+            except Exception as e:
+                logger.error(f"Shared generation cache lookup failed: {str(e)}")
+                shared = []
+            if len(shared) >= self.max_variants:
+                for value in shared:
+                    await self.local.add_variant(key, value, self.max_variants, self.ttl)
+                variants = shared
+
+        if len(variants) < self.max_variants:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return random.choice(variants)
+
+    async def store(self, key: str, value: str) -> None:
+        await self.local.add_variant(key, value, self.max_variants, self.ttl)
+        if self.shared is not None:
+            try:
+                await self.shared.add_variant(key, value, self.max_variants, self.ttl)
+            except Exception as e:
+                logger.error(f"Shared generation cache store failed: {str(e)}")
+
+generation_cache = GenerationCache(
+    LRUCacheTier(GENERATION_CACHE_SIZE),
+    RedisCacheTier(GENERATION_CACHE_REDIS_URL) if GENERATION_CACHE_REDIS_URL else None,
+    max_variants=GENERATION_CACHE_VARIANTS,
+    ttl=GENERATION_CACHE_TTL
+)
@@ -0,0 +1,61 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict
+from dotenv import load_dotenv
+from logger import setup_logger
+
+# Setup logger
+logger = setup_logger("coalesce")
+
+# Load environment variables
+load_dotenv()
+
+# Seconds a finished call stays joinable by identical requests
+GENERATION_COALESCE_WINDOW = float(os.getenv("GENERATION_COALESCE_WINDOW", "1.0"))
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key into a single upstream call.
+    The first caller starts the call; callers arriving while it is in flight,
+    or within `window` seconds of it finishing, receive the same result.
+    Failed calls are forgotten immediately so the next caller retries.
+    """
+
+    def __init__(self, window: float = 0.0):
+        self.window = window
+        self.calls = 0
+        self.coalesced = 0
+        self._flights: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._flights.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"Coalesced request onto in-flight call ({self.coalesced} calls saved)")
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._flights[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # Shield the shared call so one disconnecting client does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if task.cancelled() or task.exception() is not None or self.window <= 0:
+            self._forget(key, task)
+        else:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            "upstream_calls": self.calls,
+            "calls_saved": self.coalesced,
+            "in_flight": sum(1 for task in self._flights.values() if not task.done())
+        }
+
+generation_flight = SingleFlight(window=GENERATION_COALESCE_WINDOW)
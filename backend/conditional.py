@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import json
+import os
+from typing import List, Optional
+from dotenv import load_dotenv
+from fastapi import Response
+from metrics import http_response_bytes
+
+try:
+    import brotli
+except ImportError:  # Optional, only needed when COMPRESSION_ENCODINGS includes br
+    brotli = None
+
+# Load environment variables
+load_dotenv()
+
+# Response bodies smaller than this many bytes are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Content codings offered, in order of preference; "br" requires the brotli package
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "gzip")
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
+# Per-user data: clients may keep a copy but must revalidate it, shared caches must not store it
+CACHE_CONTROL = "private, no-cache"
+
+# Media types worth compressing; event streams are never buffered
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
+
+def version_etag(*parts) -> str:
+    """
+    Strong ETag built from whatever identifies a representation, such as
+    row ids and updated_at values, without serializing the response body.
+    """
+    payload = json.dumps(parts, default=str, separators=(",", ":")).encode("utf-8")
+    return f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of a compressed variant: a strong tag must differ per content coding."""
+    return f'{etag[:-1]}-{encoding}"'
+
+def matching_etag(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    The entity tag from an If-None-Match header that matches `etag` or one
+    of its compressed variants, or None. Comparison is weak, as RFC 9110
+    asks for If-None-Match.
+    """
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    variants = {etag} | {encoded_etag(etag, encoding) for encoding in ("gzip", "br")}
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.removeprefix("W/") in variants:
+            return tag
+    return None
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+
+def parse_encodings(value: str) -> List[str]:
+    encodings = [encoding.strip().lower() for encoding in value.split(",") if encoding.strip()]
+    unknown = set(encodings) - {"gzip", "br"}
+    if unknown:
+        raise ValueError(f"Unknown COMPRESSION_ENCODINGS: {', '.join(sorted(unknown))}")
+    if "br" in encodings and brotli is None:
+        raise ValueError("The brotli package is required when COMPRESSION_ENCODINGS includes br")
+    return encodings
+
+def accepted_encodings(header: str) -> dict:
+    """Content coding -> q-value from an Accept-Encoding header."""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+def negotiate_encoding(header: Optional[str], offered: List[str]) -> Optional[str]:
+    """The first offered coding the client accepts with a non-zero q-value, or None."""
+    if not header:
+        return None
+    accepted = accepted_encodings(header)
+    for encoding in offered:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete JSON and text responses of at
+    least `min_size` bytes with the best coding the client accepts. Streamed
+    responses (more than one body message) pass through untouched, so SSE
+    is never buffered. A strong ETag gets the coding appended, e.g.
+    "abc-gzip", and matching_etag() accepts either form.
+    """
+
+    def __init__(self, app, min_size: int = COMPRESSION_MIN_SIZE, encodings: str = COMPRESSION_ENCODINGS):
+        self.app = app
+        self.min_size = min_size
+        self.encodings = parse_encodings(encodings)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        header = dict(scope.get("headers", [])).get(b"accept-encoding")
+        encoding = negotiate_encoding(header.decode("latin-1") if header else None, self.encodings)
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                headers = {key.lower(): value for key, value in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1")
+                if message["status"] != 200 or b"content-encoding" in headers \
+                        or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    await send(message)
+                    return
+                # Hold the headers until the body shows whether it is worth compressing
+                start_message = message
+                return
+
+            if start_message is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            held, start_message = start_message, None
+            headers = [(key, value) for key, value in held.get("headers", []) if key.lower() != b"vary"]
+            vary = [value for key, value in held.get("headers", []) if key.lower() == b"vary"]
+            headers.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+            body = message.get("body", b"")
+            if encoding is None or message.get("more_body", False) or len(body) < self.min_size:
+                await send({**held, "headers": headers})
+                await send(message)
+                return
+
+            compressed = compress(body, encoding)
+            http_response_bytes.inc(len(body), (encoding, "original"))
+            http_response_bytes.inc(len(compressed), (encoding, "sent"))
+            rewritten = []
+            for key, value in headers:
+                name = key.lower()
+                if name == b"content-length":
+                    value = str(len(compressed)).encode("latin-1")
+                elif name == b"etag" and value.startswith(b'"'):
+                    value = encoded_etag(value.decode("latin-1"), encoding).encode("latin-1")
+                rewritten.append((key, value))
+            rewritten.append((b"content-encoding", encoding.encode("latin-1")))
+            await send({**held, "headers": rewritten})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,7 +1,9 @@
-from supabase import create_client
+import asyncio
 import os
 from dotenv import load_dotenv
 from logger import setup_logger
+from providers import ConfigurationError, Provider
+from transport import pooled_client
 
 # Setup logger
 logger = setup_logger("database")
@@ -13,23 +15,67 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    error_msg = "SUPABASE_URL and SUPABASE_KEY must be set in environment variables"
-    logger.error(error_msg)
-    raise ValueError(error_msg)
+def supabase_headers() -> dict:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        error_msg = "SUPABASE_URL and SUPABASE_KEY must be set in environment variables"
+        logger.error(error_msg)
+        raise ConfigurationError(error_msg)
+    return {
+        "apiKey": SUPABASE_KEY,
+        "Authorization": f"Bearer {SUPABASE_KEY}"
+    }
 
-try:
-    # Create Supabase client
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    logger.info("Supabase client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize Supabase client: {str(e)}")
-    raise
+def create_db():
+    """
+    Build the async PostgREST (database) client. The library is imported
+    here rather than at module level to keep app startup fast.
+    """
+    from postgrest import AsyncPostgrestClient
+    from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
 
-def test_connection():
+    class PooledPostgrestClient(AsyncPostgrestClient):
+        """PostgREST client whose session draws from the shared connection pool."""
+
+        def create_session(self, base_url, headers, timeout, verify=True, proxy=None):
+            return pooled_client(
+                base_url=base_url,
+                headers=headers,
+                timeout=timeout,
+                follow_redirects=True
+            )
+
+    return PooledPostgrestClient(
+        f"{SUPABASE_URL}/rest/v1",
+        headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, **supabase_headers()}
+    )
+
+def create_auth_client():
+    """
+    Build the async GoTrue (auth) client.
+    """
+    from gotrue import AsyncGoTrueClient
+
+    return AsyncGoTrueClient(
+        url=f"{SUPABASE_URL}/auth/v1",
+        headers=supabase_headers(),
+        auto_refresh_token=False,
+        persist_session=False,
+        http_client=pooled_client(follow_redirects=True)
+    )
+
+db_provider = Provider("postgrest", create_db)
+auth_client_provider = Provider("gotrue", create_auth_client)
+
+def get_db():
+    return db_provider.get()
+
+def get_auth_client():
+    return auth_client_provider.get()
+
+async def test_connection():
     try:
         # Try to fetch a single row from itineraries table
-        result = supabase.table("itineraries").select("*").limit(1).execute()
+        result = await get_db().table("itineraries").select("*").limit(1).execute()
         logger.info("Successfully connected to Supabase!")
         return True
     except Exception as e:
@@ -37,4 +83,4 @@ def test_connection():
         return False
 
 if __name__ == "__main__":
-    test_connection() 
\ No newline at end of file
+    asyncio.run(test_connection())
@@ -0,0 +1,117 @@
+import copy
+import json
+from typing import Optional, Tuple
+
+# JSON schemas for structured output. Strict mode requires every property to
+# be listed as required, so optional values are nullable instead.
+SLOT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "time": {"type": "string"},
+        "activity": {"type": "string"},
+        "location": {"type": "string"},
+        "cuisine": {"type": ["string", "null"]},
+        "notes": {"type": ["string", "null"]}
+    },
+    "required": ["time", "activity", "location", "cuisine", "notes"],
+    "additionalProperties": False
+}
+
+DAY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "day": {"type": "integer"},
+        "title": {"type": "string"},
+        "slots": {"type": "array", "items": SLOT_SCHEMA}
+    },
+    "required": ["day", "title", "slots"],
+    "additionalProperties": False
+}
+
+ITINERARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "days": {"type": "array", "items": DAY_SCHEMA}
+    },
+    "required": ["title", "days"],
+    "additionalProperties": False
+}
+
+class SectionError(ValueError):
+    """Raised when a requested day or slot is not in the itinerary."""
+
+def json_output_format(name: str, schema: dict) -> dict:
+    """
+    The Responses API `text` parameter requesting output matching schema.
+    """
+    return {"format": {"type": "json_schema", "name": name, "schema": schema, "strict": True}}
+
+def render_itinerary(structured: dict) -> str:
+    """
+    Render a structured itinerary as the plain text stored in `content`.
+    """
+    lines = [structured["title"], ""]
+    for day in structured["days"]:
+        lines.append(f"Day {day['day']}: {day['title']}")
+        for slot in day["slots"]:
+            line = f"- {slot['time']}: {slot['activity']} ({slot['location']})"
+            if slot.get("cuisine"):
+                line += f". Cuisine: {slot['cuisine']}"
+            if slot.get("notes"):
+                line += f". {slot['notes']}"
+            lines.append(line)
+        lines.append("")
+    return "\n".join(lines).rstrip() + "\n"
+
+def summarize_itinerary(structured: dict) -> str:
+    """
+    A compact outline giving a model enough context to edit one section.
+    """
+    return "\n".join(
+        f"Day {day['day']}: {day['title']} - " + "; ".join(
+            f"{slot['time']} {slot['activity']}" for slot in day["slots"]
+        )
+        for day in structured["days"]
+    )
+
+def parse_itinerary_output(output: str) -> Tuple[str, Optional[dict]]:
+    """
+    Return (content, structured) for model output. Structured JSON is
+    rendered to text; anything else is treated as a free text itinerary.
+    """
+    try:
+        structured = json.loads(output)
+    except ValueError:
+        return output, None
+    if not isinstance(structured, dict) or not isinstance(structured.get("days"), list):
+        return output, None
+    return render_itinerary(structured), structured
+
+def section_label(day: int, slot: Optional[int] = None) -> str:
+    return f"day {day}" if slot is None else f"day {day}, slot {slot}"
+
+def get_section(structured: dict, day: int, slot: Optional[int] = None) -> dict:
+    """
+    Return a day, or a slot within a day. Both are 1-based.
+    """
+    if not 1 <= day <= len(structured["days"]):
+        raise SectionError(f"Itinerary has no day {day}")
+    section = structured["days"][day - 1]
+    if slot is None:
+        return section
+    if not 1 <= slot <= len(section["slots"]):
+        raise SectionError(f"Day {day} has no slot {slot}")
+    return section["slots"][slot - 1]
+
+def splice_section(structured: dict, section: dict, day: int, slot: Optional[int] = None) -> dict:
+    """
+    Return a copy of the itinerary with one day or slot replaced.
+    """
+    get_section(structured, day, slot)
+    updated = copy.deepcopy(structured)
+    if slot is None:
+        updated["days"][day - 1] = {**section, "day": day}
+    else:
+        updated["days"][day - 1]["slots"][slot - 1] = section
+    return updated
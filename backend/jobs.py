@@ -0,0 +1,408 @@
+import asyncio
+import itertools
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from multiprocessing.managers import BaseManager, BaseProxy, DictProxy
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from logger import setup_logger
+from providers import ConfigurationError
+
+# Setup logger
+logger = setup_logger("jobs")
+
+# Load environment variables
+load_dotenv()
+
+# "memory" keeps jobs in this process; "manager" shares them through a broker process
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "memory")
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_QUEUE_MAX_SIZE = int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+JOB_BROKER_ADDRESS = os.getenv("JOB_BROKER_ADDRESS", "127.0.0.1:50051")
+# Shared secret of the broker; required, with no default, whenever it is used
+JOB_BROKER_AUTHKEY = os.getenv("JOB_BROKER_AUTHKEY", "")
+# Broadcast events (e.g. cache invalidations) the broker keeps for polling workers
+JOB_BROKER_EVENT_LOG_SIZE = int(os.getenv("JOB_BROKER_EVENT_LOG_SIZE", "10000"))
+# Seconds between sweeps of finished jobs older than JOB_RESULT_TTL out of the broker
+JOB_BROKER_SWEEP_INTERVAL = float(os.getenv("JOB_BROKER_SWEEP_INTERVAL", "60"))
+# Seconds a worker waits after a broker error before taking the next job
+JOB_WORKER_RETRY_DELAY = float(os.getenv("JOB_WORKER_RETRY_DELAY", "1"))
+
+# Priority lanes, lower runs first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# Errors of a dropped or refused broker connection
+BROKER_CONNECTION_ERRORS = (OSError, EOFError)
+
+class JobQueueFull(Exception):
+    """Raised when the queue cannot accept more jobs."""
+
+def utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def is_expired(job: dict, ttl: float) -> bool:
+    finished_at = job.get("finished_at")
+    return finished_at is not None and time.time() - finished_at > ttl
+
+def purge_expired(jobs: Dict[str, dict], ttl: float) -> int:
+    """Remove finished jobs older than ttl seconds, returning how many went."""
+    expired = [job_id for job_id, job in list(jobs.items()) if is_expired(job, ttl)]
+    for job_id in expired:
+        jobs.pop(job_id, None)
+    return len(expired)
+
+class JobBroker:
+    """Storage and ordering for jobs. Jobs are plain dicts so any broker can hold them."""
+
+    async def put(self, job: dict) -> None:
+        raise NotImplementedError
+
+    async def take(self) -> dict:
+        raise NotImplementedError
+
+    async def save(self, job: dict) -> None:
+        raise NotImplementedError
+
+    async def load(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def wait(self, job_id: str, status: str, timeout: float) -> None:
+        """Return once the job may have left `status`, or after timeout seconds."""
+        raise NotImplementedError
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+class InProcessBroker(JobBroker):
+    """Priority queue and job table living in the current event loop."""
+
+    def __init__(self, max_size: int, result_ttl: float):
+        self.result_ttl = result_ttl
+        self._queue = asyncio.PriorityQueue(max_size)
+        self._jobs: Dict[str, dict] = {}
+        self._updated = asyncio.Condition()
+        self._sequence = itertools.count()
+
+    async def put(self, job: dict) -> None:
+        try:
+            self._queue.put_nowait((job["priority"], next(self._sequence), job["id"]))
+        except asyncio.QueueFull:
+            raise JobQueueFull("Job queue is full")
+        self._jobs[job["id"]] = job
+
+    async def take(self) -> dict:
+        _, _, job_id = await self._queue.get()
+        return self._jobs[job_id]
+
+    async def save(self, job: dict) -> None:
+        self._jobs[job["id"]] = job
+        if job["status"] in TERMINAL_STATUSES:
+            asyncio.get_running_loop().call_later(self.result_ttl, self._jobs.pop, job["id"], None)
+        async with self._updated:
+            self._updated.notify_all()
+
+    async def load(self, job_id: str) -> Optional[dict]:
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, status: str, timeout: float) -> None:
+        def changed():
+            job = self._jobs.get(job_id)
+            return job is None or job["status"] != status
+
+        async with self._updated:
+            try:
+                await asyncio.wait_for(self._updated.wait_for(changed), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+class EventLog:
+    """
+    Bounded broadcast log held by the broker process: every worker sees every
+    event by polling with the sequence number it has read up to. Readers that
+    fall more than `max_size` events behind miss the oldest ones.
+    """
+
+    def __init__(self, max_size: int):
+        self._events: deque = deque(maxlen=max_size)
+        self._next = 0
+
+    def publish(self, event: Any) -> int:
+        self._events.append((self._next, event))
+        self._next += 1
+        return self._next
+
+    def since(self, sequence: int) -> Tuple[int, List[Any]]:
+        """
+        Events from `sequence` on, and the sequence to poll from next.
+        A negative sequence only returns the current position.
+        """
+        if sequence < 0:
+            return self._next, []
+        return self._next, [event for number, event in self._events if number >= sequence]
+
+class BrokerManager(BaseManager):
+    pass
+
+BrokerManager.register("get_queue")
+BrokerManager.register("get_jobs", proxytype=DictProxy)
+BrokerManager.register("get_events")
+
+def parse_address(address: str) -> tuple:
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+def broker_authkey(authkey: str) -> bytes:
+    """
+    The broker's authkey as bytes. The broker exchanges pickles, so anyone
+    holding the key can run code in its clients; an unset key is refused
+    rather than replaced by a guessable default.
+    """
+    if not authkey:
+        error_msg = "JOB_BROKER_AUTHKEY must be set to use the job broker"
+        logger.error(error_msg)
+        raise ConfigurationError(error_msg)
+    return authkey.encode("utf-8")
+
+def serve_broker(address: str, authkey: str, max_size: int, result_ttl: float) -> None:
+    """
+    Run a standalone broker process that several API workers can share.
+    A local stand-in for a shared broker such as Redis or RabbitMQ.
+    Finished jobs are swept out once they are older than result_ttl, whether
+    or not anyone polls them again.
+    """
+    jobs_queue = queue.PriorityQueue(max_size)
+    jobs: Dict[str, dict] = {}
+    events = EventLog(JOB_BROKER_EVENT_LOG_SIZE)
+
+    def sweep() -> None:
+        while True:
+            time.sleep(JOB_BROKER_SWEEP_INTERVAL)
+            purged = purge_expired(jobs, result_ttl)
+            if purged:
+                logger.info(f"Purged {purged} expired jobs")
+
+    threading.Thread(target=sweep, name="job-sweeper", daemon=True).start()
+
+    class ServerManager(BaseManager):
+        pass
+
+    ServerManager.register("get_queue", callable=lambda: jobs_queue)
+    ServerManager.register("get_jobs", callable=lambda: jobs, proxytype=DictProxy)
+    ServerManager.register("get_events", callable=lambda: events)
+    manager = ServerManager(address=parse_address(address), authkey=broker_authkey(authkey))
+    logger.info(f"Job broker listening on {address}")
+    manager.get_server().serve_forever()
+
+class ManagerBroker(JobBroker):
+    """
+    Client for the broker process started by serve_broker(). Blocking proxy
+    calls run in worker threads so they never stall the event loop. The
+    queue depth is read there too, on every put and every poll for a job,
+    and depth() returns that last reading. A dropped connection (e.g. the
+    broker restarted) is reopened on the next call.
+    """
+
+    def __init__(self, address: str, authkey: str, result_ttl: float, poll_interval: float = 0.5):
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._manager = BrokerManager(address=parse_address(address), authkey=broker_authkey(authkey))
+        self._connected = False
+        self._depth = 0
+
+    def _ensure_connected(self) -> None:
+        if not self._connected:
+            # Proxies reuse one connection per thread and address; drop any left from before
+            BaseProxy._address_to_local.pop(self._manager.address, None)
+            self._manager.connect()
+            self._connected = True
+
+    def _call(self, method: Callable, *args):
+        try:
+            return method(*args)
+        except BROKER_CONNECTION_ERRORS:
+            self._connected = False
+            raise
+
+    def _put(self, job: dict) -> None:
+        self._ensure_connected()
+        self._manager.get_jobs()[job["id"]] = job
+        jobs_queue = self._manager.get_queue()
+        try:
+            jobs_queue.put_nowait((job["priority"], time.time(), job["id"]))
+        except queue.Full:
+            self._manager.get_jobs().pop(job["id"], None)
+            raise JobQueueFull("Job queue is full")
+        finally:
+            self._depth = jobs_queue.qsize()
+
+    def _take(self) -> Optional[dict]:
+        self._ensure_connected()
+        jobs_queue = self._manager.get_queue()
+        try:
+            _, _, job_id = jobs_queue.get(True, 1.0)
+        except queue.Empty:
+            return None
+        finally:
+            self._depth = jobs_queue.qsize()
+        return self._manager.get_jobs().get(job_id)
+
+    def _save(self, job: dict) -> None:
+        self._ensure_connected()
+        self._manager.get_jobs()[job["id"]] = job
+
+    def _load(self, job_id: str) -> Optional[dict]:
+        self._ensure_connected()
+        jobs = self._manager.get_jobs()
+        job = jobs.get(job_id)
+        if job is not None and is_expired(job, self.result_ttl):
+            jobs.pop(job_id, None)
+            return None
+        return job
+
+    async def put(self, job: dict) -> None:
+        await asyncio.to_thread(self._call, self._put, job)
+
+    async def take(self) -> dict:
+        while True:
+            job = await asyncio.to_thread(self._call, self._take)
+            if job is not None:
+                return job
+
+    async def save(self, job: dict) -> None:
+        await asyncio.to_thread(self._call, self._save, job)
+
+    async def load(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._call, self._load, job_id)
+
+    async def wait(self, job_id: str, status: str, timeout: float) -> None:
+        # Other processes may finish the job, so poll rather than wait on a local event
+        await asyncio.sleep(min(timeout, self.poll_interval))
+
+    def depth(self) -> int:
+        return self._depth
+
+class JobQueue:
+    """
+    Runs registered job handlers on a bounded pool of worker tasks. Each job
+    calls handler(**payload) and stores the return value as its result.
+    """
+
+    def __init__(self, broker: JobBroker, concurrency: int):
+        self.broker = broker
+        self.concurrency = concurrency
+        self._handlers: Dict[str, Callable[..., Awaitable[Any]]] = {}
+        self._workers: List[asyncio.Task] = []
+
+    def register(self, kind: str, handler: Callable[..., Awaitable[Any]]) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+            logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, kind: str, payload: dict, user_id: str, priority: int = PRIORITY_BULK) -> dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        now = utc_now()
+        job = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "priority": priority,
+            "user_id": user_id,
+            "payload": payload,
+            "status": "queued",
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None
+        }
+        await self.broker.put(job)
+        logger.info(f"Queued {kind} job {job['id']} (priority {priority})")
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.broker.load(job_id)
+
+    async def watch(self, job_id: str, timeout: float = 15.0) -> AsyncIterator[dict]:
+        """
+        Yield the job every time its status changes until it finishes.
+        Also yields at least every `timeout` seconds so callers can send keep-alives.
+        """
+        last_status = None
+        while True:
+            job = await self.broker.load(job_id)
+            if job is None:
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield job
+            elif job["status"] not in TERMINAL_STATUSES:
+                yield None
+            if job["status"] in TERMINAL_STATUSES:
+                return
+            await self.broker.wait(job_id, job["status"], timeout)
+
+    async def _work(self) -> None:
+        while True:
+            try:
+                await self._run(await self.broker.take())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A broker error must not end the worker; back off and carry on
+                logger.error(f"Job worker error: {str(e)}")
+                await asyncio.sleep(JOB_WORKER_RETRY_DELAY)
+
+    async def _run(self, job: dict) -> None:
+        job = {**job, "status": "running", "updated_at": utc_now()}
+        await self.broker.save(job)
+        try:
+            result = await self._handlers[job["kind"]](**job["payload"])
+            job = {**job, "status": "succeeded", "result": result}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            job = {**job, "status": "failed", "error": str(e)}
+        job["updated_at"] = utc_now()
+        job["finished_at"] = time.time()
+        try:
+            await self.broker.save(job)
+        except Exception as e:
+            # Don't leave the job "running": the result may not be storable, or the connection dropped
+            logger.error(f"Failed to store the result of job {job['id']}: {str(e)}")
+            await self.broker.save({**job, "status": "failed", "result": None, "error": "Failed to store the job result"})
+
+def create_broker() -> JobBroker:
+    if JOB_QUEUE_BACKEND == "manager":
+        return ManagerBroker(JOB_BROKER_ADDRESS, JOB_BROKER_AUTHKEY, JOB_RESULT_TTL)
+    return InProcessBroker(JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL)
+
+job_queue = JobQueue(create_broker(), JOB_CONCURRENCY)
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve"]:
+        serve_broker(JOB_BROKER_ADDRESS, JOB_BROKER_AUTHKEY, JOB_QUEUE_MAX_SIZE, JOB_RESULT_TTL)
+    else:
+        print("Usage: python jobs.py serve")
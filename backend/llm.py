@@ -0,0 +1,355 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from admission import Overloaded
+from logger import setup_logger
+from metrics import (
+    llm_attempts, llm_call_seconds, llm_calls, llm_cost, llm_first_token_seconds, llm_hedge_wins, record_llm_usage
+)
+from providers import ConfigurationError, Provider
+from router import usage_cost
+from transport import pooled_client
+
+# Setup logger
+logger = setup_logger("llm")
+
+# Load environment variables
+load_dotenv()
+
+# Get OpenAI API key from environment
+api_key = os.getenv("OPENAI_API_KEY")
+
+# Seconds a request may spend on model calls, unless its route sets a deadline
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Send a second request when the first has no token after LLM_HEDGE_DELAY
+# seconds, or by default after the LLM_HEDGE_QUANTILE of recent first-token times
+LLM_HEDGE = os.getenv("LLM_HEDGE", "true").lower() == "true"
+LLM_HEDGE_DELAY = os.getenv("LLM_HEDGE_DELAY")
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_INITIAL_DELAY = float(os.getenv("LLM_HEDGE_INITIAL_DELAY", "5"))
+# Retries of failed attempts, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "4"))
+# Consecutive upstream failures that open the circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# First-token samples kept per model for the hedge threshold
+FIRST_TOKEN_WINDOW = 200
+FIRST_TOKEN_MIN_SAMPLES = 20
+
+RETRIABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+# response.failed error codes worth another attempt; anything else, and every
+# response.incomplete (output limit, content filter), fails the same way again
+RETRIABLE_RESPONSE_ERRORS = {"server_error", "rate_limit_exceeded"}
+
+def create_openai_client():
+    """
+    Build the OpenAI client. The SDK is imported here rather than at module
+    level because importing it dominates app startup time. Retries are done
+    by this module, so the SDK's own are turned off.
+    """
+    if not api_key:
+        error_msg = "OPENAI_API_KEY not found in environment variables"
+        logger.error(error_msg)
+        raise ConfigurationError(error_msg)
+
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=api_key, http_client=pooled_client(), max_retries=0)
+
+openai_provider = Provider("openai", create_openai_client)
+
+def get_openai_client():
+    return openai_provider.get()
+
+class DeadlineExceeded(Exception):
+    """Raised when a model call cannot finish within the request's deadline."""
+
+class ResponseFailed(Exception):
+    """
+    Raised when a streamed response ends with response.failed or
+    response.incomplete, or without output. Only `retriable` ones are retried.
+    """
+
+    def __init__(self, message: str, retriable: bool = False):
+        super().__init__(message)
+        self.retriable = retriable
+
+def response_failure(event: Any, prefix: str = "Response") -> ResponseFailed:
+    """The ResponseFailed for a response.failed or response.incomplete event."""
+    response = getattr(event, "response", None)
+    if event.type == "response.incomplete":
+        details = getattr(response, "incomplete_details", None)
+        reason = getattr(details, "reason", None) or "unknown reason"
+        return ResponseFailed(f"{prefix} ended with {event.type} ({reason})")
+    code = getattr(getattr(response, "error", None), "code", None)
+    return ResponseFailed(
+        f"{prefix} ended with {event.type} ({code or 'no error code'})", retriable=code in RETRIABLE_RESPONSE_ERRORS
+    )
+
+class CircuitOpen(Overloaded):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(503, "The model provider is unavailable, please retry later", retry_after)
+
+# Absolute time.monotonic() by which the current request's model calls must finish
+call_deadline: ContextVar[Optional[float]] = ContextVar("call_deadline", default=None)
+
+def set_deadline(seconds: float = LLM_DEADLINE) -> float:
+    """
+    Give the rest of the current request `seconds` for its model calls.
+    Routes call this on entry; every call made for the request shares it.
+    """
+    deadline = time.monotonic() + seconds
+    call_deadline.set(deadline)
+    return deadline
+
+def is_retriable(error: BaseException) -> bool:
+    if isinstance(error, ResponseFailed):
+        return error.retriable
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRIABLE_STATUS_CODES
+    import openai
+    return isinstance(error, (openai.APIConnectionError, asyncio.TimeoutError))
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive upstream failures and fails
+    calls fast for `cooldown` seconds. Then one trial call is let through:
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.cooldown:
+            return "open"
+        return "half_open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+        if state == "open":
+            raise CircuitOpen(self.cooldown - (time.monotonic() - self.opened_at))
+        if self.trial_in_flight:
+            raise CircuitOpen(1)
+        self.trial_in_flight = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        was_trial = self.trial_in_flight
+        self.trial_in_flight = False
+        if was_trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or was_trial:
+                logger.error(f"Opening LLM circuit breaker after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        self.trial_in_flight = False
+
+class FirstTokenTracker:
+    """Recent time-to-first-token samples per model, for the hedge threshold."""
+
+    def __init__(self, window: int = FIRST_TOKEN_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def observe(self, model: str, seconds: float) -> None:
+        self._samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+        llm_first_token_seconds.observe(seconds, (model,))
+
+    def hedge_delay(self, model: str) -> float:
+        if LLM_HEDGE_DELAY is not None:
+            return float(LLM_HEDGE_DELAY)
+        samples = self._samples.get(model)
+        if not samples or len(samples) < FIRST_TOKEN_MIN_SAMPLES:
+            return LLM_HEDGE_INITIAL_DELAY
+        ordered = sorted(samples)
+        return max(LLM_HEDGE_MIN_DELAY, ordered[min(len(ordered) - 1, int(len(ordered) * LLM_HEDGE_QUANTILE))])
+
+breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN)
+first_tokens = FirstTokenTracker()
+
+class Attempt:
+    """An open response stream and the events read up to its first token."""
+
+    def __init__(self, stream, events: AsyncIterator, buffered: List[Any], deadline: float):
+        self.stream = stream
+        self.events = events
+        self.buffered = buffered
+        self.deadline = deadline
+
+    async def replay(self) -> AsyncIterator[Any]:
+        """The events read so far, then the rest of the stream."""
+        for event in self.buffered:
+            yield event
+        async for event in self.events:
+            yield event
+
+async def start_attempt(prompt: str, params: dict, deadline: float) -> Attempt:
+    """
+    Open a streamed call and read until the first text delta (or the final
+    event), so the caller can tell a responsive upstream from a stalled one.
+    """
+    start = time.monotonic()
+    stream = await get_openai_client().responses.create(
+        input = prompt, stream = True, timeout = max(deadline - start, 0.001), **params
+    )
+    try:
+        events = stream.__aiter__()
+        buffered = []
+        async for event in events:
+            buffered.append(event)
+            if event.type in ("response.output_text.delta", "response.completed"):
+                first_tokens.observe(params["model"], time.monotonic() - start)
+                return Attempt(stream, events, buffered, deadline)
+            if event.type in ("response.failed", "response.incomplete"):
+                raise response_failure(event, "Streaming response")
+        # The stream was cut short, not refused
+        raise ResponseFailed("Streaming response ended without output", retriable=True)
+    except BaseException:
+        await stream.close()
+        raise
+
+async def race(prompt: str, params: dict, deadline: float) -> Attempt:
+    """
+    Start one attempt and, if it has no first token by the hedge delay,
+    a second one. The first to produce a token wins and the other is cancelled.
+    """
+    model = params["model"]
+    started = time.monotonic()
+    hedge_at = started + first_tokens.hedge_delay(model) if LLM_HEDGE else None
+    primary = asyncio.create_task(start_attempt(prompt, params, deadline))
+    pending = {primary}
+    hedge = None
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            now = time.monotonic()
+            wake_at = min(deadline, hedge_at) if hedge is None and hedge_at is not None else deadline
+            done, pending = await asyncio.wait(pending, timeout=max(wake_at - now, 0), return_when=asyncio.FIRST_COMPLETED)
+            succeeded = [task for task in done if task.exception() is None]
+            if succeeded:
+                winner = primary if primary in succeeded else succeeded[0]
+                for task in succeeded:
+                    if task is not winner:
+                        await task.result().stream.close()
+                if winner is hedge:
+                    llm_hedge_wins.inc(1, (model,))
+                return winner.result()
+            for task in done:
+                error = task.exception()
+            if done:
+                continue
+            if time.monotonic() >= deadline:
+                raise DeadlineExceeded(f"No response from {model} within the deadline")
+            # Hedging only while the circuit is closed, so a struggling upstream gets no extra load
+            if hedge is None and breaker.state == "closed":
+                logger.info(f"Hedging {model} call after {time.monotonic() - started:.2f}s without a token")
+                llm_attempts.inc(1, (model, "hedge"))
+                hedge = asyncio.create_task(start_attempt(prompt, params, deadline))
+                pending.add(hedge)
+            else:
+                hedge_at = None
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def open_response(prompt: str, params: dict) -> Attempt:
+    """
+    Open a response stream within the request's deadline, hedging slow
+    attempts and retrying retriable failures with jittered backoff.
+    """
+    model = params["model"]
+    deadline = call_deadline.get() or time.monotonic() + LLM_DEADLINE
+    for attempt_number in range(LLM_MAX_RETRIES + 1):
+        try:
+            breaker.before_call()
+        except CircuitOpen:
+            llm_calls.inc(1, (model, "circuit_open"))
+            raise
+        llm_attempts.inc(1, (model, "first" if attempt_number == 0 else "retry"))
+        try:
+            attempt = await race(prompt, params, deadline)
+            breaker.record_success()
+            return attempt
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        except DeadlineExceeded:
+            breaker.record_failure()
+            llm_calls.inc(1, (model, "deadline_exceeded"))
+            raise
+        except Exception as e:
+            retriable = is_retriable(e)
+            if retriable:
+                breaker.record_failure()
+            else:
+                breaker.record_cancelled()
+            delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * 2 ** attempt_number))
+            if not retriable or attempt_number == LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                llm_calls.inc(1, (model, "error"))
+                raise
+            logger.error(f"Retrying {model} call in {delay:.2f}s after error: {str(e)}")
+            await asyncio.sleep(delay)
+
+async def response_events(prompt: str, params: dict) -> AsyncIterator[Any]:
+    """
+    Stream Responses API events through the resilient call layer. Token
+    usage, cost and call latency are recorded per model from the completed event.
+    """
+    model = params["model"]
+    started = time.monotonic()
+    attempt = await open_response(prompt, params)
+    try:
+        async for event in attempt.replay():
+            if time.monotonic() > attempt.deadline:
+                llm_calls.inc(1, (model, "deadline_exceeded"))
+                raise DeadlineExceeded(f"{model} response did not finish within the deadline")
+            if event.type == "response.completed":
+                llm_calls.inc(1, (model, "ok"))
+                record_llm_usage(model, event.response.usage)
+                llm_cost.inc(usage_cost(model, event.response.usage), (model,))
+                llm_call_seconds.observe(time.monotonic() - started, (model,))
+            yield event
+    finally:
+        await attempt.stream.close()
+
+async def create_response(prompt: str, params: dict):
+    """
+    Make a model call and return the completed response object.
+    """
+    events = response_events(prompt, params)
+    try:
+        async for event in events:
+            if event.type == "response.completed":
+                return event.response
+            if event.type in ("response.failed", "response.incomplete"):
+                raise response_failure(event)
+        raise ResponseFailed("Response ended without a completed event")
+    finally:
+        await events.aclose()
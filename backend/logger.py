@@ -1,39 +1,217 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
 import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Optional
+from dotenv import load_dotenv
 
-# Create logs directory if it doesn't exist
-logs_dir = Path("logs")
-logs_dir.mkdir(exist_ok=True)
+# Load environment variables
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for people, "json" for log pipelines
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FILE_NAME = os.getenv("LOG_FILE_NAME", "wandergen.log")
+LOG_TO_FILE = os.getenv("LOG_TO_FILE", "true").lower() == "true"
+LOG_TO_CONSOLE = os.getenv("LOG_TO_CONSOLE", "true").lower() == "true"
+# Rotate by size, or by time when LOG_ROTATE_WHEN is set (e.g. "midnight", "H")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")
+# Share of INFO lines kept, overridable per logger as "model=0.1,cache=0.01"
+LOG_INFO_SAMPLE_RATE = float(os.getenv("LOG_INFO_SAMPLE_RATE", "1.0"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+# Skip collecting caller file/line, thread and process for every record. This
+# is process-wide: it also blanks %(filename)s, %(lineno)d, %(thread)d and the
+# like in uvicorn's and other libraries' formats, so it is off by default
+LOG_SKIP_RECORD_FIELDS = os.getenv("LOG_SKIP_RECORD_FIELDS", "false").lower() == "true"
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+CONSOLE_FORMAT = '%(levelname)s: %(message)s'
+
+# Id of the request being served, attached to every log line it produces
+request_id: ContextVar[str] = ContextVar("request_id", default="-")
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+class RequestIdFilter(logging.Filter):
+    """Stamp records with the current request id, in the caller's context before they are queued."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a fraction of INFO (and DEBUG) records so chatty per-request lines
+    cannot dominate log volume. Warnings and errors are always kept.
+    """
+
+    def __init__(self, default_rate: float = 1.0, rates: Optional[Dict[str, float]] = None):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = rates or {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        rate = self.rates.get(record.name, self.default_rate)
+        return rate >= 1.0 or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-")
+        }
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry)
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records without the copy and full format the stock QueueHandler
+    does on the caller's thread. Safe because these loggers have no other handler.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def skip_unused_record_fields() -> None:
+    """
+    Stop the logging module collecting the caller's file and line, thread
+    and process for every record. None of our formats print them, but the
+    switches are module globals, so every logger in the process loses them.
+    """
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+def build_queue_handler(sample_rate: float = 1.0, sample_rates: Optional[Dict[str, float]] = None) -> RecordQueueHandler:
+    queue_handler = RecordQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter(sample_rate, sample_rates))
+    queue_handler.addFilter(RequestIdFilter())
+    return queue_handler
+
+def build_file_handler(path: Path) -> logging.Handler:
+    if LOG_ROTATE_WHEN:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+
+class LoggingSystem:
+    """
+    Process-wide logging set up once. Loggers only put records on a queue;
+    a QueueListener thread formats them and does the file and console I/O,
+    so logging never blocks the event loop on disk.
+    """
+
+    def __init__(self):
+        self.queue_handler: Optional[RecordQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def configure(self) -> RecordQueueHandler:
+        if self.queue_handler is not None:
+            return self.queue_handler
+
+        json_output = LOG_FORMAT == "json"
+        handlers = []
+        if LOG_TO_FILE:
+            logs_dir = Path(LOG_DIR)
+            logs_dir.mkdir(exist_ok=True)
+            file_handler = build_file_handler(logs_dir / LOG_FILE_NAME)
+            file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+            handlers.append(file_handler)
+        if LOG_TO_CONSOLE:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(CONSOLE_FORMAT))
+            handlers.append(console_handler)
+
+        if LOG_SKIP_RECORD_FIELDS:
+            skip_unused_record_fields()
+        self.queue_handler = build_queue_handler(LOG_INFO_SAMPLE_RATE, parse_sample_rates(LOG_SAMPLE_RATES))
+        self.listener = logging.handlers.QueueListener(self.queue_handler.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.shutdown)
+        return self.queue_handler
+
+    def shutdown(self) -> None:
+        """Flush queued records and stop the listener thread."""
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+logging_system = LoggingSystem()
 
 # Configure logging
 def setup_logger(name: str) -> logging.Logger:
+    """
+    Return the named logger, attached to the shared queue. Safe to call
+    any number of times for the same name.
+    """
+    queue_handler = logging_system.configure()
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
+    if queue_handler not in logger.handlers:
+        logger.addHandler(queue_handler)
+    # Handlers live on the queue, so records must not also reach the root logger
+    logger.propagate = False
+    return logger
 
-    # Create formatters
-    file_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    console_formatter = logging.Formatter(
-        '%(levelname)s: %(message)s'
-    )
+class RequestIdMiddleware:
+    """
+    ASGI middleware giving each request an id, taken from an incoming
+    X-Request-ID header or generated, and echoing it on the response.
+    """
 
-    # File handler
-    file_handler = logging.FileHandler(
-        logs_dir / f"{name}.log",
-        encoding='utf-8'
-    )
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(file_formatter)
+    def __init__(self, app, header: str = "x-request-id"):
+        self.app = app
+        self.header = header.encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
-    console_handler.setFormatter(console_formatter)
+        incoming = dict(scope.get("headers", [])).get(self.header)
+        value = incoming.decode("latin-1")[:128] if incoming else uuid.uuid4().hex
+        token = request_id.set(value)
 
-    # Add handlers to logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(self.header, value.encode("latin-1"))]
+            await send(message)
 
-    return logger 
\ No newline at end of file
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -1,36 +1,354 @@
-from fastapi import FastAPI, Depends, HTTPException
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from admission import Admission, Overloaded, llm_admission
+from llm import DeadlineExceeded, breaker, set_deadline
 from auth.router import router as auth_router
 from auth.dependencies import get_current_user
+from auth.verifier import token_verifier
+from database import SUPABASE_URL, auth_client_provider, db_provider
 from model import (
     generate_itinerary, 
     refine_itinerary, 
+    upgrade_itinerary,
     revert_to_original, 
     get_refinement_history, 
+    get_refinement_history_etag,
+    get_refinement_version,
+    history_etag,
     toggle_favorite_itinerary, 
     get_favorite_itineraries,
-    get_user_itineraries
+    get_user_itineraries,
+    itinerary_page_etag,
+    search_itineraries,
+    export_itineraries,
+    import_itineraries,
+    list_itineraries_etag,
+    get_itinerary,
+    generate_itineraries_batch,
+    stream_generate_itinerary,
+    stream_refine_itinerary,
+    estimate_generation_tokens,
+    estimate_refinement_tokens,
+    create_refinement,
+    NotStructured,
+    RefinementConflict,
+    SectionError,
+    UPGRADE_REQUEST,
+    openai_provider
 )
-from logger import setup_logger
+from jobs import job_queue, JobQueueFull, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from cache import generation_cache
+from coalesce import generation_flight
+from speculate import SPECULATION_ENABLED, speculator
+from semantic import semantic_cache
+from rowcache import itinerary_cache
+from search import search_index
+from conditional import CompressionMiddleware, matching_etag, not_modified, set_etag
+from logger import RequestIdMiddleware, setup_logger
+from metrics import MetricsMiddleware, registry
 from schemas import (
     ItineraryRequest,
     RefinementRequest,
     ItineraryResponse,
     RefinedItineraryResponse,
     HealthResponse,
+    ReadinessResponse,
     RefinementHistoryResponse,
+    ItineraryVersionResponse,
     FavoriteUpdate,
-    ItineraryList
+    ItineraryList,
+    ItinerarySearchResults,
+    ImportResult,
+    JobResponse,
+    BatchItineraryRequest,
+    BatchItineraryResponse
 )
-from supabase import create_client
+from transport import transport
 
 # Setup logger
 logger = setup_logger("api")
 
+# Upstream clients are built after the server starts accepting connections
+CLIENT_PROVIDERS = [db_provider, auth_client_provider, openai_provider]
+
+async def warm_clients():
+    """
+    Build every upstream client in the background. /health answers while
+    this runs; /ready reports 503 until it has finished.
+    """
+    for provider in CLIENT_PROVIDERS:
+        try:
+            await provider.warm()
+        except Exception as e:
+            logger.error(f"Failed to initialize {provider.name} client: {str(e)}")
+    await transport.warm(upstream_urls())
+
+def upstream_urls() -> list:
+    """
+    Endpoints used to open pooled connections to each configured upstream.
+    """
+    urls = []
+    if openai_provider.ready:
+        urls.append(str(openai_provider.get().base_url))
+    if db_provider.ready:
+        urls.append(f"{SUPABASE_URL}/rest/v1/")
+    if auth_client_provider.ready:
+        urls.append(f"{SUPABASE_URL}/auth/v1/health")
+    return urls
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_queue.register("generate", admitted_job(
+        generate_itinerary,
+        lambda payload: estimate_generation_tokens(payload["mood"], payload["preferences"])
+    ))
+    job_queue.register("refine", admitted_job(
+        refine_itinerary,
+        lambda payload: estimate_refinement_tokens(payload["refinement_request"], day=payload["day"])
+    ))
+    await job_queue.start()
+    itinerary_cache.start()
+    if SPECULATION_ENABLED:
+        speculator.start(
+            create_refinement,
+            lambda itinerary, request: estimate_refinement_tokens(request, itinerary["content"])
+        )
+    warm_task = asyncio.create_task(warm_clients())
+    try:
+        yield
+    finally:
+        warm_task.cancel()
+        await speculator.stop()
+        await itinerary_cache.stop()
+        if semantic_cache is not None:
+            semantic_cache.close()
+        await job_queue.stop()
+        await token_verifier.stop()
+        await transport.close()
+
 app = FastAPI(
     title="WanderGen API",
     description="API for generating and refining travel itineraries using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
+registry.callback(
+    "wandergen_generation_cache_requests_total", "Generation cache lookups by result.", "counter",
+    lambda: {("hit",): generation_cache.hits, ("miss",): generation_cache.misses}, ("result",)
+)
+registry.callback(
+    "wandergen_generation_coalesce_total", "Generations started versus joined onto an in-flight call.", "counter",
+    lambda: {("started",): generation_flight.calls, ("coalesced",): generation_flight.coalesced}, ("result",)
+)
+registry.callback(
+    "wandergen_itinerary_cache_requests_total", "Itinerary row and list cache lookups by result.", "counter",
+    lambda: {
+        ("row", "hit"): itinerary_cache.hits,
+        ("row", "miss"): itinerary_cache.misses,
+        ("list", "hit"): itinerary_cache.list_hits,
+        ("list", "miss"): itinerary_cache.list_misses
+    },
+    ("kind", "result")
+)
+registry.callback(
+    "wandergen_itinerary_cache_entries", "Itinerary rows and user lists held in memory.", "gauge",
+    lambda: {("row",): itinerary_cache.stats()["rows"], ("list",): itinerary_cache.stats()["lists"]}, ("kind",)
+)
+registry.callback(
+    "wandergen_search_index_entries", "Users and itineraries in the in-process search index (SEARCH_BACKEND=memory).", "gauge",
+    lambda: {("user",): search_index.stats()["users"], ("itinerary",): search_index.stats()["itineraries"]}, ("kind",)
+)
+registry.callback(
+    "wandergen_semantic_cache_requests_total", "Semantic cache lookups by result.", "counter",
+    lambda: {("hit",): semantic_cache.hits, ("miss",): semantic_cache.misses} if semantic_cache is not None else {},
+    ("result",)
 )
+registry.callback(
+    "wandergen_semantic_cache_entries", "Itineraries held in the semantic cache.", "gauge",
+    lambda: {(): len(semantic_cache.index)} if semantic_cache is not None else {}
+)
+registry.callback(
+    "wandergen_semantic_cache_evictions_total", "Semantic cache entries replaced to make room.", "counter",
+    lambda: {(): semantic_cache.index.evictions} if semantic_cache is not None else {}
+)
+registry.callback(
+    "wandergen_speculation_requests_total", "Full refinements served from speculation versus not.", "counter",
+    lambda: {("hit",): speculator.hits, ("miss",): speculator.misses}, ("result",)
+)
+registry.callback(
+    "wandergen_speculation_refinements_total", "Speculative refinements by outcome.", "counter",
+    lambda: {
+        ("completed",): speculator.speculated,
+        ("cancelled",): speculator.cancelled,
+        ("skipped_for_budget",): speculator.skipped
+    },
+    ("outcome",)
+)
+registry.callback(
+    "wandergen_speculation_tokens_total", "Tokens of completed speculative refinements, and of those never served (wasted).", "counter",
+    lambda: {("used",): speculator.tokens_used, ("wasted",): speculator.tokens_wasted}, ("kind",)
+)
+registry.callback(
+    "wandergen_job_queue_depth", "Jobs waiting to run.", "gauge",
+    lambda: {(): job_queue.broker.depth()}
+)
+registry.callback(
+    "wandergen_llm_circuit_open", "1 while the LLM circuit breaker is open or half-open.", "gauge",
+    lambda: {(): 0 if breaker.state == "closed" else 1}
+)
+registry.callback(
+    "wandergen_admission_in_flight", "Model calls admitted and running.", "gauge",
+    lambda: {(): llm_admission.in_flight}
+)
+registry.callback(
+    "wandergen_admission_queue_depth", "Requests waiting for a model call slot.", "gauge",
+    lambda: {(): llm_admission.queued}
+)
+registry.callback(
+    "wandergen_admission_admitted_total", "Requests admitted to the LLM routes.", "counter",
+    lambda: {(): llm_admission.admitted}
+)
+registry.callback(
+    "wandergen_admission_shed_total", "Requests shed by admission control, by reason.", "counter",
+    lambda: {(reason,): count for reason, count in llm_admission.shed.items()}, ("reason",)
+)
+registry.callback(
+    "wandergen_admission_tokens_available", "Estimated tokens left in the per-minute model budget.", "gauge",
+    lambda: {(): llm_admission.budget.available} if llm_admission.budget is not None else {}
+)
+
+def pool_stat(name: str):
+    return lambda: {(upstream,): stats[name] for upstream, stats in transport.pool_stats().items()}
+
+registry.callback(
+    "wandergen_http_pool_connections", "Open upstream connections per pool.", "gauge",
+    pool_stat("connections"), ("upstream",)
+)
+registry.callback(
+    "wandergen_http_pool_idle_connections", "Idle keep-alive connections per pool.", "gauge",
+    pool_stat("idle"), ("upstream",)
+)
+registry.callback(
+    "wandergen_http_pool_queued_requests", "Requests waiting for a pooled connection; non-zero means the pool is saturated.", "gauge",
+    pool_stat("queued_requests"), ("upstream",)
+)
+registry.callback(
+    "wandergen_http_pool_max_connections", "Connection limit per pool.", "gauge",
+    pool_stat("max_connections"), ("upstream",)
+)
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Stop reverse proxies from buffering the stream
+}
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+async def release_after(admission: Admission, events):
+    """
+    Hold an admission until a streamed response has finished.
+    """
+    try:
+        async for event in events:
+            yield event
+    finally:
+        admission.release()
+
+def admitted_stream(admission: Admission, events) -> StreamingResponse:
+    # The background task covers clients that disconnect before the stream starts
+    return StreamingResponse(
+        sse_stream(release_after(admission, events)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+        background=BackgroundTask(admission.release)
+    )
+
+async def sse_stream(events):
+    """
+    Format (event, data) pairs as server-sent events. Errors raised after the
+    response has started are reported as a final "error" event.
+    """
+    try:
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    except Exception as e:
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+async def ndjson_stream(pages):
+    """
+    Format pages of rows as newline-delimited JSON, one write per page.
+    Errors raised after the response has started end it with an
+    {"error": ...} line.
+    """
+    try:
+        async for page in pages:
+            yield "".join(json.dumps(row) + "\n" for row in page)
+    except Exception as e:
+        yield json.dumps({"error": str(e)}) + "\n"
+
+async def ndjson_lines(chunks):
+    """Split a streamed request body into lines without reading all of it."""
+    pending = b""
+    async for chunk in chunks:
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+def admitted_job(handler, estimate):
+    """
+    Wrap a job handler so each job takes an admission slot, like the
+    synchronous routes, and gets a fresh model deadline once admitted.
+    Nobody is waiting on the response, so a shed job waits Retry-After and
+    tries again instead of failing.
+    """
+    async def run(**payload):
+        while True:
+            try:
+                admission = await llm_admission.acquire(payload["user_id"], estimate(payload))
+                break
+            except Overloaded as e:
+                logger.warning(f"Job deferred for {e.retry_after}s: {e.detail}")
+                await asyncio.sleep(e.retry_after)
+        try:
+            set_deadline()
+            return await handler(**payload)
+        finally:
+            admission.release()
+    return run
+
+async def enqueue_job(kind: str, payload: dict, user_id: str, priority: int) -> JSONResponse:
+    """
+    Queue a job and answer 202 Accepted with its status URL.
+    """
+    try:
+        job = await job_queue.submit(kind, payload, user_id, priority)
+    except JobQueueFull as e:
+        logger.error(f"Rejected {kind} job: {str(e)}")
+        raise HTTPException(status_code=503, detail=str(e))
+    return JSONResponse(
+        status_code=202,
+        content=JobResponse(**job).model_dump(mode="json"),
+        headers={"Location": f"/jobs/{job['id']}"}
+    )
 
 # Public routes
 app.include_router(auth_router)
@@ -39,23 +357,146 @@ app.include_router(auth_router)
 @app.post("/generate", response_model=ItineraryResponse)
 async def create_itinerary(
     request: ItineraryRequest,
+    run_async: bool = Query(False, alias="async"),
     user = Depends(get_current_user)
 ):
-    try:
-        itinerary = generate_itinerary(request.mood, request.preferences, user.id)
-        return itinerary
-    except Exception as e:
-        logger.error(f"Failed to generate itinerary: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    if run_async:
+        payload = {
+            "mood": request.mood,
+            "preferences": request.preferences,
+            "user_id": user.id,
+            "use_cache": request.cache != "bypass"
+        }
+        return await enqueue_job("generate", payload, user.id, PRIORITY_BULK)
+
+    set_deadline()
+    async with llm_admission.admit(user.id, estimate_generation_tokens(request.mood, request.preferences)):
+        try:
+            itinerary = await generate_itinerary(
+                request.mood, request.preferences, user.id, use_cache=request.cache != "bypass"
+            )
+            return itinerary
+        except Overloaded:
+            raise
+        except DeadlineExceeded as e:
+            logger.error(f"Failed to generate itinerary: {str(e)}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except Exception as e:
+            logger.error(f"Failed to generate itinerary: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/refine", response_model=RefinedItineraryResponse)
 async def refine_existing_itinerary(
     request: RefinementRequest,
+    run_async: bool = Query(False, alias="async"),
     user = Depends(get_current_user)  # Add authentication
 ):
+    if run_async:
+        # Refinements come from users waiting on the result, so they skip ahead of bulk generations
+        payload = {
+            "itinerary_id": request.itinerary_id,
+            "refinement_request": request.refinement_request,
+            "user_id": user.id,
+            "day": request.day,
+            "slot": request.slot
+        }
+        return await enqueue_job("refine", payload, user.id, PRIORITY_INTERACTIVE)
+
+    set_deadline()
+    async with llm_admission.admit(user.id, estimate_refinement_tokens(request.refinement_request, day=request.day)):
+        try:
+            refined = await refine_itinerary(
+                request.itinerary_id, request.refinement_request, user.id, request.day, request.slot
+            )
+            return RefinedItineraryResponse(refined_itinerary=refined)
+        except Overloaded:
+            raise
+        except DeadlineExceeded as e:
+            logger.error(f"Failed to refine itinerary: {str(e)}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except RefinementConflict as e:
+            logger.error(f"Refinement conflict: {str(e)}")
+            raise HTTPException(status_code=409, detail=str(e))
+        except SectionError as e:
+            logger.error(f"Invalid request: {str(e)}")
+            raise HTTPException(status_code=400, detail=str(e))
+        except NotStructured as e:
+            logger.error(f"Invalid request: {str(e)}")
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            logger.error(f"Invalid request: {str(e)}")
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.error(f"Failed to refine itinerary: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/upgrade/{itinerary_id}", response_model=RefinedItineraryResponse)
+async def upgrade_existing_itinerary(itinerary_id: int, user = Depends(get_current_user)):
+    set_deadline()
+    async with llm_admission.admit(user.id, estimate_refinement_tokens(UPGRADE_REQUEST)):
+        try:
+            upgraded = await upgrade_itinerary(itinerary_id, user.id)
+            return RefinedItineraryResponse(refined_itinerary=upgraded)
+        except Overloaded:
+            raise
+        except DeadlineExceeded as e:
+            logger.error(f"Failed to upgrade itinerary: {str(e)}")
+            raise HTTPException(status_code=504, detail=str(e))
+        except RefinementConflict as e:
+            logger.error(f"Refinement conflict: {str(e)}")
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            logger.error(f"Invalid request: {str(e)}")
+            raise HTTPException(status_code=404, detail=str(e))
+        except Exception as e:
+            logger.error(f"Failed to upgrade itinerary: {str(e)}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate/batch", response_model=BatchItineraryResponse)
+async def create_itineraries_batch(
+    request: BatchItineraryRequest,
+    user = Depends(get_current_user)
+):
+    # Each model call in the batch takes its own admission slot
+    set_deadline()
+    try:
+        items = [
+            {
+                "mood": item.mood,
+                "preferences": item.preferences,
+                "use_cache": item.cache != "bypass"
+            }
+            for item in request.requests
+        ]
+        results = await generate_itineraries_batch(items, user.id)
+        return BatchItineraryResponse(results=results)
+    except Exception as e:
+        logger.error(f"Failed to generate itinerary batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/generate/stream")
+async def stream_itinerary(
+    request: ItineraryRequest,
+    user = Depends(get_current_user)
+):
+    set_deadline()
+    admission = await llm_admission.acquire(user.id, estimate_generation_tokens(request.mood, request.preferences))
+    events = stream_generate_itinerary(
+        request.mood, request.preferences, user.id, use_cache=request.cache != "bypass"
+    )
+    return admitted_stream(admission, events)
+
+@app.post("/refine/stream")
+async def stream_refined_itinerary(
+    request: RefinementRequest,
+    user = Depends(get_current_user)
+):
+    if request.day is not None:
+        raise HTTPException(status_code=400, detail="Section refinements are not streamed, use POST /refine")
+
+    set_deadline()
     try:
-        refined = refine_itinerary(request.itinerary_id, request.refinement_request)
-        return RefinedItineraryResponse(refined_itinerary=refined)
+        itinerary = await get_itinerary(request.itinerary_id, user.id)
     except ValueError as e:
         logger.error(f"Invalid request: {str(e)}")
         raise HTTPException(status_code=404, detail=str(e))
@@ -63,11 +504,40 @@ async def refine_existing_itinerary(
         logger.error(f"Failed to refine itinerary: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+    admission = await llm_admission.acquire(
+        user.id, estimate_refinement_tokens(request.refinement_request, itinerary['content'])
+    )
+    events = stream_refine_itinerary(itinerary, request.refinement_request, user.id)
+    return admitted_stream(admission, events)
+
+async def get_user_job(job_id: str, user_id: str) -> dict:
+    job = await job_queue.get(job_id)
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, user = Depends(get_current_user)):
+    return await get_user_job(job_id, user.id)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, user = Depends(get_current_user)):
+    await get_user_job(job_id, user.id)
+
+    async def events():
+        async for job in job_queue.watch(job_id):
+            if job is None:
+                yield ": keep-alive\n\n"
+            else:
+                data = JobResponse(**job).model_dump_json()
+                yield f"event: {job['status']}\ndata: {data}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/revert/{itinerary_id}", response_model=ItineraryResponse)
 async def revert_itinerary(itinerary_id: int, user = Depends(get_current_user)):
     try:
-        original = revert_to_original(itinerary_id)
-        return ItineraryResponse(itinerary=original)
+        return await revert_to_original(itinerary_id, user.id)
     except ValueError as e:
         logger.error(f"Invalid request: {str(e)}")
         raise HTTPException(status_code=404, detail=str(e))
@@ -76,9 +546,19 @@ async def revert_itinerary(itinerary_id: int, user = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/history/{itinerary_id}", response_model=RefinementHistoryResponse)
-async def get_history(itinerary_id: int, user = Depends(get_current_user)):
+async def get_history(
+    itinerary_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(get_current_user)
+):
     try:
-        history = get_refinement_history(itinerary_id)
+        if if_none_match:
+            matched = matching_etag(if_none_match, await get_refinement_history_etag(itinerary_id, user.id))
+            if matched:
+                return not_modified(matched)
+        history = await get_refinement_history(itinerary_id, user.id)
+        set_etag(response, history_etag(itinerary_id, history[0]["version"] if history else 0))
         return RefinementHistoryResponse(history=history)
     except ValueError as e:
         logger.error(f"Invalid request: {str(e)}")
@@ -87,10 +567,33 @@ async def get_history(itinerary_id: int, user = Depends(get_current_user)):
         logger.error(f"Failed to fetch refinement history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/history/{itinerary_id}/versions/{version}", response_model=ItineraryVersionResponse)
+async def get_history_version(itinerary_id: int, version: int, user = Depends(get_current_user)):
+    try:
+        content = await get_refinement_version(itinerary_id, version, user.id)
+        return ItineraryVersionResponse(itinerary_id=itinerary_id, version=version, content=content)
+    except ValueError as e:
+        logger.error(f"Invalid request: {str(e)}")
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Failed to fetch itinerary version: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     return HealthResponse(status="healthy")
 
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    clients = {provider.name: provider.ready for provider in CLIENT_PROVIDERS}
+    ready = all(clients.values())
+    response = ReadinessResponse(status="ready" if ready else "starting", clients=clients)
+    return JSONResponse(status_code=200 if ready else 503, content=response.model_dump())
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/itineraries/{itinerary_id}/favorite", response_model=ItineraryResponse)
 async def toggle_favorite(
     itinerary_id: int,
@@ -98,25 +601,87 @@ async def toggle_favorite(
     user = Depends(get_current_user)
 ):
     try:
-        updated = toggle_favorite_itinerary(itinerary_id, user.id, favorite.is_favorite)
+        updated = await toggle_favorite_itinerary(itinerary_id, user.id, favorite.is_favorite)
         return updated
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/itineraries/favorites", response_model=ItineraryList)
-async def get_favorite_itineraries_endpoint(user = Depends(get_current_user)):
+@app.get("/itineraries/export")
+async def export_user_itineraries(user = Depends(get_current_user)):
+    return StreamingResponse(
+        ndjson_stream(export_itineraries(user.id)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="itineraries.ndjson"'}
+    )
+
+@app.post("/itineraries/import", response_model=ImportResult)
+async def import_user_itineraries(request: Request, user = Depends(get_current_user)):
     try:
-        favorites = await get_favorite_itineraries(user.id)
-        return ItineraryList(itineraries=favorites)
+        result = await import_itineraries(user.id, ndjson_lines(request.stream()))
+        return ImportResult(**result)
     except Exception as e:
+        logger.error(f"Failed to import itineraries: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/itineraries", response_model=ItineraryList)
-async def get_user_itineraries_endpoint(user = Depends(get_current_user)):
+@app.get("/itineraries/search", response_model=ItinerarySearchResults, response_model_exclude_unset=True)
+async def search_user_itineraries_endpoint(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user = Depends(get_current_user)
+):
     try:
-        itineraries = get_user_itineraries(user.id)
-        return ItineraryList(itineraries=itineraries)
+        results, next_cursor = await search_itineraries(user.id, q, limit, cursor, fields)
+        return ItinerarySearchResults(results=results, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/itineraries/favorites", response_model=ItineraryList, response_model_exclude_unset=True)
+async def get_favorite_itineraries_endpoint(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(get_current_user)
+):
+    try:
+        if if_none_match:
+            etag = await list_itineraries_etag(user.id, limit, cursor, fields, favorites_only=True)
+            matched = matching_etag(if_none_match, etag)
+            if matched:
+                return not_modified(matched)
+        favorites, next_cursor = await get_favorite_itineraries(user.id, limit, cursor, fields)
+        set_etag(response, itinerary_page_etag(favorites, next_cursor, fields))
+        return ItineraryList(itineraries=favorites, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/itineraries", response_model=ItineraryList, response_model_exclude_unset=True)
+async def get_user_itineraries_endpoint(
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    user = Depends(get_current_user)
+):
+    try:
+        if if_none_match:
+            matched = matching_etag(if_none_match, await list_itineraries_etag(user.id, limit, cursor, fields))
+            if matched:
+                return not_modified(matched)
+        itineraries, next_cursor = await get_user_itineraries(user.id, limit, cursor, fields)
+        set_etag(response, itinerary_page_etag(itineraries, next_cursor, fields))
+        return ItineraryList(itineraries=itineraries, next_cursor=next_cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
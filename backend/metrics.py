@@ -0,0 +1,284 @@
+import bisect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Send a Server-Timing header with the spans recorded for each request
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "true").lower() == "true"
+
+# Seconds, from a cached JWT check up to a long generation
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    """A named metric with a fixed set of label names."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Labels = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, labels: Labels = ()) -> None:
+        self.inc(-amount, labels)
+
+    def set(self, value: float, labels: Labels = ()) -> None:
+        self._values[labels] = value
+
+class Histogram(Metric):
+    """
+    Cumulative histogram with fixed upper bounds. Observing is a bisect and
+    two additions, cheap enough for every request.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [bucket counts..., +Inf count], sum
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, labels: Labels = ()) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = format_labels(self.labelnames, labels, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class CallbackMetric(Metric):
+    """
+    A counter or gauge read from existing state, e.g. a cache's hit count,
+    when the metrics page is rendered.
+    """
+
+    def __init__(self, name: str, documentation: str, type: str,
+                 callback: Callable[[], Dict[Labels, float]], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+            for labels, value in self.callback().items()
+        ]
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, type: str,
+                 callback: Callable[[], Dict[Labels, float]], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, type, callback, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "wandergen_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")
+)
+http_request_seconds = registry.histogram(
+    "wandergen_http_request_duration_seconds", "HTTP request latency by route.", ("method", "route")
+)
+http_in_flight = registry.gauge(
+    "wandergen_http_requests_in_flight", "HTTP requests currently being served.", ("method",)
+)
+span_seconds = registry.histogram(
+    "wandergen_span_duration_seconds", "Time spent in instrumented steps such as auth and upstream calls.", ("span",)
+)
+http_response_bytes = registry.counter(
+    "wandergen_http_response_bytes_total", "Bytes of compressed response bodies before and after compression.", ("encoding", "stage")
+)
+upstream_in_flight = registry.gauge(
+    "wandergen_upstream_requests_in_flight", "Requests currently waiting on an upstream service.", ("upstream",)
+)
+upstream_requests = registry.counter(
+    "wandergen_upstream_requests_total", "Upstream requests by service and status.", ("upstream", "status")
+)
+llm_tokens = registry.counter(
+    "wandergen_llm_tokens_total", "LLM tokens reported in response usage.", ("model", "kind")
+)
+llm_first_token_seconds = registry.histogram(
+    "wandergen_llm_first_token_seconds", "Time to the first streamed LLM token.", ("model",)
+)
+llm_calls = registry.counter(
+    "wandergen_llm_calls_total", "LLM calls by model and outcome.", ("model", "outcome")
+)
+llm_attempts = registry.counter(
+    "wandergen_llm_attempts_total", "Upstream LLM requests by kind: first try, hedge or retry.", ("model", "kind")
+)
+llm_hedge_wins = registry.counter(
+    "wandergen_llm_hedge_wins_total", "Hedged calls won by the second request.", ("model",)
+)
+llm_call_seconds = registry.histogram(
+    "wandergen_llm_call_seconds", "Time from starting an LLM call to its completed response.", ("model",)
+)
+llm_cost = registry.counter(
+    "wandergen_llm_cost_usd_total", "Estimated LLM spend in USD, from response usage and MODEL_PRICES.", ("model",)
+)
+
+# Span durations of the current request, in seconds, for the Server-Timing header
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time a block. The duration goes to the span histogram and, inside a
+    request, to that request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        span_seconds.observe(elapsed, (name,))
+        timings = request_timings.get()
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+def record_llm_usage(model: str, usage) -> None:
+    """Count the tokens from a Responses API usage object, if present."""
+    if usage is None:
+        return
+    llm_tokens.inc(usage.input_tokens, (model, "input"))
+    llm_tokens.inc(usage.output_tokens, (model, "output"))
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording per-route latency, status counts and in-flight
+    requests, and adding a Server-Timing header built from the request's spans.
+    Routes are labelled by their path template so ids do not multiply series.
+    """
+
+    def __init__(self, app, server_timing: bool = METRICS_SERVER_TIMING):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        token = request_timings.set(timings)
+        method = scope["method"]
+        status = "500"
+        http_in_flight.inc(1, (method,))
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if self.server_timing:
+                    header = server_timing(timings, time.perf_counter() - start)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", header.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            http_in_flight.dec(1, (method,))
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            http_requests.inc(1, (method, route, status))
+            http_request_seconds.observe(time.perf_counter() - start, (method, route))
+            request_timings.reset(token)
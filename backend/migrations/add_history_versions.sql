@@ -0,0 +1,58 @@
+-- Versioned refinement history: each refinement_history row stores either the
+-- full content (a snapshot) or a line delta against base_version. Version 0 is
+-- itineraries.original_content. See backend/versioning.py for the delta format.
+
+-- Track the newest stored version and the version currently shown
+ALTER TABLE itineraries ADD COLUMN IF NOT EXISTS history_version INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE itineraries ADD COLUMN IF NOT EXISTS current_version INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE refinement_history ADD COLUMN IF NOT EXISTS version INTEGER;
+ALTER TABLE refinement_history ADD COLUMN IF NOT EXISTS base_version INTEGER;
+ALTER TABLE refinement_history ADD COLUMN IF NOT EXISTS delta TEXT;
+ALTER TABLE refinement_history ALTER COLUMN content DROP NOT NULL;
+
+-- Number existing rows per itinerary in creation order. They remain full
+-- snapshots; run `python -m migrations.compact_refinement_history` from
+-- backend/ afterwards to convert them to deltas.
+WITH numbered AS (
+    SELECT id, row_number() OVER (PARTITION BY itinerary_id ORDER BY created_at, id) AS version
+    FROM refinement_history
+    WHERE version IS NULL
+)
+UPDATE refinement_history h
+SET version = numbered.version,
+    base_version = numbered.version - 1
+FROM numbered
+WHERE h.id = numbered.id;
+
+UPDATE itineraries i
+SET history_version = latest.version,
+    current_version = CASE WHEN i.content IS NOT DISTINCT FROM latest.content THEN latest.version ELSE 0 END
+FROM (
+    SELECT DISTINCT ON (itinerary_id) itinerary_id, version, content
+    FROM refinement_history
+    ORDER BY itinerary_id, version DESC
+) latest
+WHERE i.id = latest.itinerary_id
+AND i.history_version = 0;
+
+ALTER TABLE refinement_history ALTER COLUMN version SET NOT NULL;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_indexes
+        WHERE indexname = 'refinement_history_itinerary_version_idx'
+    ) THEN
+        CREATE UNIQUE INDEX refinement_history_itinerary_version_idx
+            ON refinement_history(itinerary_id, version);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'refinement_history_content_or_delta'
+    ) THEN
+        ALTER TABLE refinement_history ADD CONSTRAINT refinement_history_content_or_delta
+            CHECK (content IS NOT NULL OR delta IS NOT NULL);
+    END IF;
+END $$;
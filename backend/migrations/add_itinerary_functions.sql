@@ -0,0 +1,78 @@
+-- Single round-trip writes for refine, revert and favorite, called from
+-- model.py through PostgREST (POST /rest/v1/rpc/<function>). Each call runs in
+-- one transaction and only touches itineraries owned by p_user_id; an empty
+-- result means the itinerary does not exist or belongs to someone else.
+-- Run migrations/check_itinerary_functions.sql afterwards to verify them.
+
+-- Record a refinement: bump the itinerary to p_version and insert its history
+-- row (full content or a delta against p_base_version, built by versioning.py).
+-- p_version must follow the itinerary's newest version, so a refinement that
+-- raced another one fails instead of overwriting it.
+CREATE OR REPLACE FUNCTION save_refinement(
+    p_itinerary_id BIGINT,
+    p_user_id itineraries.user_id%TYPE,
+    p_version INTEGER,
+    p_base_version INTEGER,
+    p_refinement_request TEXT,
+    p_content TEXT,
+    p_structured JSONB,
+    p_history_content TEXT,
+    p_history_delta TEXT
+)
+RETURNS SETOF refinement_history AS $$
+BEGIN
+    UPDATE itineraries
+    SET content = p_content,
+        structured = p_structured,
+        history_version = p_version,
+        current_version = p_version
+    WHERE id = p_itinerary_id
+    AND user_id = p_user_id
+    AND history_version = p_version - 1;
+
+    IF NOT FOUND THEN
+        IF EXISTS (SELECT 1 FROM itineraries WHERE id = p_itinerary_id AND user_id = p_user_id) THEN
+            RAISE EXCEPTION 'Itinerary % was refined concurrently', p_itinerary_id
+                USING ERRCODE = 'serialization_failure';
+        END IF;
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    INSERT INTO refinement_history (itinerary_id, version, base_version, refinement_request, content, delta)
+    VALUES (p_itinerary_id, p_version, p_base_version, p_refinement_request, p_history_content, p_history_delta)
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Show the original content again. History is kept; version 0 is the original.
+CREATE OR REPLACE FUNCTION revert_itinerary(
+    p_itinerary_id BIGINT,
+    p_user_id itineraries.user_id%TYPE
+)
+RETURNS SETOF itineraries AS $$
+    UPDATE itineraries
+    SET content = original_content,
+        refined = FALSE,
+        refinement_request = NULL,
+        refinement_count = 0,
+        structured = original_structured,
+        current_version = 0
+    WHERE id = p_itinerary_id
+    AND user_id = p_user_id
+    AND original_content IS NOT NULL
+    RETURNING *;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION set_itinerary_favorite(
+    p_itinerary_id BIGINT,
+    p_user_id itineraries.user_id%TYPE,
+    p_is_favorite BOOLEAN
+)
+RETURNS SETOF itineraries AS $$
+    UPDATE itineraries
+    SET is_favorite = p_is_favorite
+    WHERE id = p_itinerary_id
+    AND user_id = p_user_id
+    RETURNING *;
+$$ LANGUAGE sql;
@@ -0,0 +1,56 @@
+-- Bulk import for POST /itineraries/import, called once per chunk from
+-- model.py. p_itineraries is a JSON array of itineraries as written by
+-- GET /itineraries/export, each with its refinement_history rows under
+-- "history". A chunk is one transaction of two set-based inserts; ids,
+-- owners and updated_at are assigned here, created_at is kept. Returns the
+-- new itinerary rows in input order.
+CREATE OR REPLACE FUNCTION import_itineraries(
+    p_user_id itineraries.user_id%TYPE,
+    p_itineraries JSONB
+)
+RETURNS SETOF itineraries AS $$
+DECLARE
+    ids BIGINT[];
+BEGIN
+    -- Ids are drawn in insertion order, so the n-th smallest belongs to the n-th item
+    WITH inserted AS (
+        INSERT INTO itineraries (
+            user_id, mood, preferences, content, original_content, structured, original_structured,
+            is_favorite, refined, refinement_request, refinement_count, history_version, current_version, created_at
+        )
+        SELECT p_user_id,
+               item->>'mood',
+               item->>'preferences',
+               item->>'content',
+               item->>'original_content',
+               item->'structured',
+               item->'original_structured',
+               coalesce((item->>'is_favorite')::BOOLEAN, FALSE),
+               coalesce((item->>'refined')::BOOLEAN, FALSE),
+               item->>'refinement_request',
+               coalesce((item->>'refinement_count')::INTEGER, 0),
+               coalesce((item->>'history_version')::INTEGER, 0),
+               coalesce((item->>'current_version')::INTEGER, 0),
+               coalesce((item->>'created_at')::TIMESTAMPTZ, now())
+        FROM jsonb_array_elements(p_itineraries) WITH ORDINALITY AS items(item, ordinal)
+        ORDER BY ordinal
+        RETURNING id
+    )
+    SELECT array_agg(id ORDER BY id) INTO ids FROM inserted;
+
+    -- A separate statement, so the itineraries' search triggers have run first
+    INSERT INTO refinement_history (itinerary_id, version, base_version, refinement_request, content, delta, created_at)
+    SELECT ids[items.ordinal::INTEGER],
+           (entry->>'version')::INTEGER,
+           (entry->>'base_version')::INTEGER,
+           entry->>'refinement_request',
+           entry->>'content',
+           entry->>'delta',
+           coalesce((entry->>'created_at')::TIMESTAMPTZ, now())
+    FROM jsonb_array_elements(p_itineraries) WITH ORDINALITY AS items(item, ordinal),
+         jsonb_array_elements(coalesce(items.item->'history', '[]'::JSONB)) AS entry;
+
+    RETURN QUERY
+    SELECT * FROM itineraries WHERE id = ANY(ids) ORDER BY id;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,9 @@
+-- Keyset pagination indexes for the itinerary listing endpoints.
+-- Both match the (created_at DESC, id DESC) ordering used by the API, so a
+-- page is a short index range scan regardless of how many rows a user has.
+CREATE INDEX IF NOT EXISTS itineraries_user_created_idx
+    ON itineraries(user_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS itineraries_user_favorites_created_idx
+    ON itineraries(user_id, created_at DESC, id DESC)
+    WHERE is_favorite;
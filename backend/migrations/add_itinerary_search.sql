@@ -0,0 +1,134 @@
+-- Full-text search over a user's itineraries and the refinement requests
+-- made of them, for GET /itineraries/search (SEARCH_BACKEND=postgres).
+-- The vectors live in their own table so `select *` on itineraries does not
+-- carry them. Triggers keep it current: inserts and content changes on
+-- itineraries (generate, refine, revert, import) rebuild the document part,
+-- and each refinement_history insert appends its request.
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+-- Mood and preferences weigh most (A), then the content (B)
+CREATE OR REPLACE FUNCTION itinerary_document_vector(p_mood TEXT, p_preferences TEXT, p_content TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('english', coalesce(p_mood, '') || ' ' || coalesce(p_preferences, '')), 'A') ||
+           setweight(to_tsvector('english', coalesce(p_content, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- user_id takes the type of itineraries.user_id. refinement_vector holds the
+-- refinement requests (C) and is only ever appended to.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.tables
+        WHERE table_name = 'itinerary_search'
+    ) THEN
+        EXECUTE format(
+            'CREATE TABLE itinerary_search (
+                itinerary_id BIGINT PRIMARY KEY REFERENCES itineraries(id) ON DELETE CASCADE,
+                user_id %s NOT NULL,
+                document_vector tsvector NOT NULL,
+                refinement_vector tsvector NOT NULL DEFAULT ''''::tsvector,
+                search_vector tsvector GENERATED ALWAYS AS (document_vector || refinement_vector) STORED
+            )',
+            (SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+             WHERE attrelid = 'itineraries'::regclass AND attname = 'user_id')
+        );
+    END IF;
+END $$;
+
+-- user_id first, so a search only visits the user's own entries (needs btree_gin)
+CREATE INDEX IF NOT EXISTS itinerary_search_user_vector_idx
+    ON itinerary_search USING GIN (user_id, search_vector);
+
+CREATE OR REPLACE FUNCTION index_itinerary_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO itinerary_search (itinerary_id, user_id, document_vector)
+    VALUES (NEW.id, NEW.user_id, itinerary_document_vector(NEW.mood, NEW.preferences, NEW.content))
+    ON CONFLICT (itinerary_id) DO UPDATE
+    SET user_id = EXCLUDED.user_id,
+        document_vector = EXCLUDED.document_vector;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Favorite toggles do not touch the listed columns, so they skip the rebuild
+DROP TRIGGER IF EXISTS itineraries_index_document ON itineraries;
+CREATE TRIGGER itineraries_index_document
+    AFTER INSERT OR UPDATE OF mood, preferences, content, user_id ON itineraries
+    FOR EACH ROW EXECUTE FUNCTION index_itinerary_document();
+
+CREATE OR REPLACE FUNCTION index_refinement_request()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE itinerary_search
+    SET refinement_vector = refinement_vector || setweight(to_tsvector('english', coalesce(NEW.refinement_request, '')), 'C')
+    WHERE itinerary_id = NEW.itinerary_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS refinement_history_index_request ON refinement_history;
+CREATE TRIGGER refinement_history_index_request
+    AFTER INSERT ON refinement_history
+    FOR EACH ROW EXECUTE FUNCTION index_refinement_request();
+
+-- Index the existing itineraries and their history
+INSERT INTO itinerary_search (itinerary_id, user_id, document_vector, refinement_vector)
+SELECT i.id,
+       i.user_id,
+       itinerary_document_vector(i.mood, i.preferences, i.content),
+       coalesce((
+           SELECT setweight(to_tsvector('english', string_agg(h.refinement_request, ' ')), 'C')
+           FROM refinement_history h
+           WHERE h.itinerary_id = i.id
+       ), ''::tsvector)
+FROM itineraries i
+ON CONFLICT (itinerary_id) DO NOTHING;
+
+-- One page of a user's matching itineraries, best first, ordered by
+-- (rank, id) descending. Pass the rank and id of the previous page's last
+-- row to continue after it. websearch_to_tsquery accepts "quoted phrases",
+-- `or` and -exclusions. The snippet is built for the returned rows only.
+CREATE OR REPLACE FUNCTION search_itineraries(
+    p_user_id itineraries.user_id%TYPE,
+    p_query TEXT,
+    p_limit INTEGER,
+    p_rank REAL DEFAULT NULL,
+    p_id BIGINT DEFAULT NULL
+)
+RETURNS TABLE (
+    id itineraries.id%TYPE,
+    mood itineraries.mood%TYPE,
+    preferences itineraries.preferences%TYPE,
+    user_id itineraries.user_id%TYPE,
+    is_favorite itineraries.is_favorite%TYPE,
+    created_at itineraries.created_at%TYPE,
+    updated_at itineraries.updated_at%TYPE,
+    content itineraries.content%TYPE,
+    original_content itineraries.original_content%TYPE,
+    structured itineraries.structured%TYPE,
+    rank REAL,
+    snippet TEXT
+) AS $$
+    WITH query AS (
+        SELECT websearch_to_tsquery('english', p_query) AS q
+    ),
+    page AS (
+        SELECT s.itinerary_id, ts_rank(s.search_vector, query.q) AS rank
+        FROM itinerary_search s, query
+        WHERE s.user_id = p_user_id
+        AND s.search_vector @@ query.q
+        AND (p_rank IS NULL OR (ts_rank(s.search_vector, query.q), s.itinerary_id) < (p_rank, p_id))
+        ORDER BY rank DESC, s.itinerary_id DESC
+        LIMIT p_limit
+    )
+    SELECT i.id, i.mood, i.preferences, i.user_id, i.is_favorite, i.created_at, i.updated_at,
+           i.content, i.original_content, i.structured, page.rank,
+           ts_headline('english', coalesce(i.content, ''), query.q,
+                       'StartSel="**", StopSel="**", MinWords=15, MaxWords=30, MaxFragments=2')
+    FROM page
+    JOIN itineraries i ON i.id = page.itinerary_id
+    CROSS JOIN query
+    ORDER BY page.rank DESC, i.id DESC;
+$$ LANGUAGE sql STABLE;
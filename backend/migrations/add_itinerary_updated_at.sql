@@ -0,0 +1,19 @@
+-- Keep itineraries.updated_at current on every update, including the ones
+-- made by the functions in add_itinerary_functions.sql. The listing endpoints
+-- build their ETags from (id, updated_at), so any change to a row must move it.
+ALTER TABLE itineraries ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT timezone('utc'::text, now()) NOT NULL;
+
+-- clock_timestamp() rather than now(), so two updates of a row in one
+-- transaction still get different values
+CREATE OR REPLACE FUNCTION touch_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = clock_timestamp();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS itineraries_touch_updated_at ON itineraries;
+CREATE TRIGGER itineraries_touch_updated_at
+    BEFORE UPDATE ON itineraries
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
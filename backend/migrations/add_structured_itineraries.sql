@@ -0,0 +1,5 @@
+-- Structured itineraries (days -> slots) from structured model output.
+-- `content` keeps the rendered text for existing clients; free text
+-- itineraries have NULL structure.
+ALTER TABLE itineraries ADD COLUMN IF NOT EXISTS structured JSONB;
+ALTER TABLE itineraries ADD COLUMN IF NOT EXISTS original_structured JSONB;
@@ -0,0 +1,77 @@
+-- Checks for add_itinerary_functions.sql against a local Postgres with the
+-- schema migrations applied. Everything runs in one transaction that is
+-- rolled back, so no rows are left behind. A failed ASSERT aborts the run:
+--     psql "$DATABASE_URL" -v ON_ERROR_STOP=1 -f migrations/check_itinerary_functions.sql
+BEGIN;
+
+-- The fixture users do not exist in auth.users; skip foreign key triggers
+SET LOCAL session_replication_role = replica;
+
+DO $$
+DECLARE
+    owner CONSTANT itineraries.user_id%TYPE := '00000000-0000-0000-0000-000000000001';
+    stranger CONSTANT itineraries.user_id%TYPE := '00000000-0000-0000-0000-000000000002';
+    itinerary itineraries;
+    history refinement_history;
+    affected INTEGER;
+BEGIN
+    INSERT INTO itineraries (mood, preferences, content, original_content, structured, original_structured, user_id)
+    VALUES ('relaxed', 'beaches', 'Day 1: beach', 'Day 1: beach', '{"days": []}', '{"days": []}', owner)
+    RETURNING * INTO itinerary;
+
+    -- save_refinement writes the itinerary and its history row together
+    SELECT * INTO history FROM save_refinement(
+        itinerary.id, owner, 1, 0, 'add a museum', 'Day 1: beach, museum', NULL, NULL, '[1]'
+    );
+    ASSERT history.version = 1 AND history.base_version = 0 AND history.delta = '[1]',
+        'save_refinement did not return the history row';
+    SELECT * INTO itinerary FROM itineraries WHERE id = itinerary.id;
+    ASSERT itinerary.content = 'Day 1: beach, museum'
+        AND itinerary.structured IS NULL
+        AND itinerary.history_version = 1
+        AND itinerary.current_version = 1,
+        'save_refinement did not update the itinerary';
+
+    -- Another user's itinerary is neither found nor changed
+    SELECT count(*) INTO affected FROM save_refinement(
+        itinerary.id, stranger, 2, 1, 'steal it', 'mine now', NULL, 'mine now', NULL
+    );
+    ASSERT affected = 0, 'save_refinement refined another user''s itinerary';
+    ASSERT (SELECT history_version FROM itineraries WHERE id = itinerary.id) = 1,
+        'save_refinement changed another user''s itinerary';
+
+    -- A stale version is a conflict, not a silent overwrite
+    BEGIN
+        PERFORM save_refinement(itinerary.id, owner, 1, 0, 'stale', 'stale', NULL, 'stale', NULL);
+        RAISE EXCEPTION 'save_refinement accepted a stale version';
+    EXCEPTION WHEN serialization_failure THEN
+        NULL;
+    END;
+    ASSERT (SELECT count(*) FROM refinement_history WHERE itinerary_id = itinerary.id) = 1,
+        'a rejected refinement left a history row behind';
+
+    -- revert_itinerary restores the original and keeps the history
+    SELECT count(*) INTO affected FROM revert_itinerary(itinerary.id, stranger);
+    ASSERT affected = 0, 'revert_itinerary reverted another user''s itinerary';
+    SELECT * INTO itinerary FROM revert_itinerary(itinerary.id, owner);
+    ASSERT itinerary.content = 'Day 1: beach'
+        AND itinerary.structured = '{"days": []}'
+        AND itinerary.current_version = 0
+        AND itinerary.history_version = 1
+        AND NOT itinerary.refined,
+        'revert_itinerary did not restore the original';
+
+    -- set_itinerary_favorite only touches the owner's row
+    SELECT count(*) INTO affected FROM set_itinerary_favorite(itinerary.id, stranger, TRUE);
+    ASSERT affected = 0, 'set_itinerary_favorite changed another user''s itinerary';
+    SELECT * INTO itinerary FROM set_itinerary_favorite(itinerary.id, owner, TRUE);
+    ASSERT itinerary.is_favorite, 'set_itinerary_favorite did not set the flag';
+
+    -- Unknown itineraries come back empty
+    SELECT count(*) INTO affected FROM set_itinerary_favorite(-1, owner, TRUE);
+    ASSERT affected = 0, 'set_itinerary_favorite returned a row for a missing itinerary';
+
+    RAISE NOTICE 'itinerary functions: all checks passed';
+END $$;
+
+ROLLBACK;
@@ -0,0 +1,64 @@
+"""
+Convert full-copy refinement_history rows into deltas.
+
+Run after add_history_versions.sql, from backend/:
+    python -m migrations.compact_refinement_history
+"""
+import asyncio
+from database import get_db
+from logger import setup_logger
+from versioning import build_history_entry, rebuild_versions
+
+logger = setup_logger("migrations")
+
+PAGE_SIZE = 500
+
+async def compact_itinerary(itinerary: dict) -> int:
+    result = await get_db().table("refinement_history")\
+        .select("*")\
+        .eq("itinerary_id", itinerary["id"])\
+        .order("version")\
+        .execute()
+    contents = rebuild_versions(itinerary["original_content"], result.data)
+
+    compacted = 0
+    for row in result.data:
+        if row.get("delta") is not None or row["base_version"] not in contents:
+            continue
+        entry = build_history_entry(
+            itinerary["id"],
+            row["version"],
+            row["base_version"],
+            contents[row["base_version"]],
+            contents[row["version"]],
+            row["refinement_request"]
+        )
+        if entry["delta"] is not None:
+            await get_db().table("refinement_history")\
+                .update({"content": None, "delta": entry["delta"]})\
+                .eq("id", row["id"])\
+                .execute()
+            compacted += 1
+    return compacted
+
+async def main():
+    last_id = 0
+    total = 0
+    while True:
+        page = await get_db().table("itineraries")\
+            .select("id,original_content")\
+            .gt("id", last_id)\
+            .gt("history_version", 0)\
+            .order("id")\
+            .limit(PAGE_SIZE)\
+            .execute()
+        if not page.data:
+            break
+        for itinerary in page.data:
+            total += await compact_itinerary(itinerary)
+        last_id = page.data[-1]["id"]
+        logger.info(f"Compacted {total} history rows (through itinerary {last_id})")
+    logger.info(f"Done, {total} history rows converted to deltas")
+
+if __name__ == "__main__":
+    asyncio.run(main())
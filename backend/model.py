@@ -1,9 +1,38 @@
-from openai import OpenAI
+import asyncio
+import base64
+import json
 import os
+from contextlib import asynccontextmanager
+from datetime import datetime
 from dotenv import load_dotenv
-from database import supabase
+from database import get_db
+from cache import generation_cache, generation_cache_key
+from coalesce import generation_flight
+from semantic import semantic_cache, tokenize
+from conditional import version_etag
+from rowcache import ITINERARY_CACHE_LIST_MAX, ITINERARY_LIST_COLUMNS, TOO_LONG, itinerary_cache
+from search import SEARCH_BACKEND, UserIndex, search_index, snippet
+from admission import llm_admission
+from ratelimit import TokenBucket, estimate_tokens
+from versioning import build_history_entry, rebuild_versions, snapshot_floor
+from itinerary_format import (
+    DAY_SCHEMA,
+    ITINERARY_SCHEMA,
+    SLOT_SCHEMA,
+    SectionError,
+    get_section,
+    json_output_format,
+    parse_itinerary_output,
+    render_itinerary,
+    section_label,
+    splice_section,
+    summarize_itinerary
+)
+from llm import create_response, openai_provider, response_events, response_failure
 from logger import setup_logger
-from typing import List, Dict, Any
+from router import model_router
+from speculate import speculator
+from typing import List, Dict, Any, AsyncContextManager, AsyncIterator, Callable, Optional, Tuple
 
 # Setup logger
 logger = setup_logger("model")
@@ -11,262 +40,1126 @@ logger = setup_logger("model")
 # Load environment variables from .env file
 load_dotenv()
 
-# Get OpenAI API key from environment
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    error_msg = "OPENAI_API_KEY not found in environment variables"
-    logger.error(error_msg)
-    raise ValueError(error_msg)
+# Batch generation limits
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_TOKENS_PER_MINUTE = int(os.getenv("BATCH_TOKENS_PER_MINUTE", "200000"))
 
-try:
-    client = OpenAI(api_key=api_key)
-    logger.info("OpenAI client initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-    raise
+batch_token_budget = TokenBucket(BATCH_TOKENS_PER_MINUTE)
 
-def generate_itinerary(mood: str, preferences: str = None, user_id: str = None) -> dict:
+# Itineraries read per query by the export, and written per import_itineraries call
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "200"))
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "200"))
+# Invalid import lines reported back; the rest are only counted
+IMPORT_MAX_ERRORS = 20
+
+# SQLSTATE raised by save_refinement when another refinement got there first
+SERIALIZATION_FAILURE = "40001"
+
+class RefinementConflict(Exception):
+    """Raised when an itinerary was refined by another request since it was read."""
+
+class NotStructured(ValueError):
+    """Raised when a day or slot refinement targets an itinerary stored as text only."""
+
+# Days asked for by the generation prompt
+ITINERARY_DAYS = 3
+# Strict JSON output repeats every key of every slot, so a day of 4-6 slots
+# takes about this many output tokens; the title and braces take the rest
+STRUCTURED_TOKENS_PER_DAY = 600
+STRUCTURED_OVERHEAD_TOKENS = 200
+
+def structured_output_tokens(days: int) -> int:
+    return STRUCTURED_OVERHEAD_TOKENS + days * STRUCTURED_TOKENS_PER_DAY
+
+# Sampling parameters for the Responses API. The model is picked per call by model_router.
+GENERATION_PARAMS = {
+    "temperature": 0.8,  # Higher temperature for more randomness
+    "max_output_tokens": 1000,  # Limit response length
+    "top_p": 0.9  # Nucleus sampling for more diverse outputs
+}
+
+REFINEMENT_PARAMS = {
+    "temperature": 0.7,  # Slightly lower temperature for refinements
+    "max_output_tokens": 1000,
+    "top_p": 0.9
+}
+
+# Non-streamed generations and refinements return structured JSON (days -> slots),
+# which needs more output tokens than the same itinerary as text
+STRUCTURED_GENERATION_PARAMS = {
+    **GENERATION_PARAMS,
+    "max_output_tokens": structured_output_tokens(ITINERARY_DAYS),
+    "text": json_output_format("itinerary", ITINERARY_SCHEMA)
+}
+# Refinements get room for one more day, as a request may add one
+STRUCTURED_REFINEMENT_PARAMS = {
+    **REFINEMENT_PARAMS,
+    "max_output_tokens": structured_output_tokens(ITINERARY_DAYS + 1),
+    "text": json_output_format("itinerary", ITINERARY_SCHEMA)
+}
+
+# Refining a single day or slot needs at most one day's worth
+SECTION_REFINEMENT_PARAMS = {**REFINEMENT_PARAMS, "max_output_tokens": STRUCTURED_TOKENS_PER_DAY}
+
+# Refinement request recorded in the history when a draft is upgraded
+UPGRADE_REQUEST = "Upgrade this draft to a complete, detailed itinerary"
+
+def structured_refinement_params(itinerary: dict) -> dict:
+    """
+    STRUCTURED_REFINEMENT_PARAMS with the output limit sized for the
+    itinerary's own days, plus one, when it has more than ITINERARY_DAYS.
+    """
+    days = len((itinerary.get("structured") or {}).get("days") or [])
+    if days <= ITINERARY_DAYS:
+        return STRUCTURED_REFINEMENT_PARAMS
+    return {**STRUCTURED_REFINEMENT_PARAMS, "max_output_tokens": structured_output_tokens(days + 1)}
+
+def build_generation_prompt(mood: str, preferences: str = None) -> str:
+    return (
+        f"Generate a detailed {ITINERARY_DAYS}-day travel itinerary for a person feeling '{mood}'. "
+        f"Consider these preferences: {preferences if preferences else 'none'}.\n\n"
+        "The itinerary should include suggestions for destinations, activities, and local cuisine."
+    )
+
+def build_refinement_prompt(content: str, refinement_request: str) -> str:
+    return (
+        f"Here's the current itinerary:\n\n{content}\n\n"
+        f"Please refine it according to this request: {refinement_request}\n\n"
+        "Provide a complete refined version of the itinerary."
+    )
+
+def build_upgrade_prompt(content: str) -> str:
+    return (
+        f"Here's a draft travel itinerary:\n\n{content}\n\n"
+        "Rewrite it as a complete, detailed itinerary. Keep its destinations and plans, "
+        "and add specific suggestions for activities and local cuisine."
+    )
+
+def build_section_refinement_prompt(summary: str, section: dict, label: str, refinement_request: str) -> str:
+    return (
+        f"Here's an outline of a travel itinerary:\n\n{summary}\n\n"
+        f"Here's {label} of it as JSON:\n\n{json.dumps(section)}\n\n"
+        f"Please rewrite only {label} according to this request: {refinement_request}\n\n"
+        "Keep it consistent with the rest of the itinerary."
+    )
+
+def estimate_generation_tokens(mood: str, preferences: str = None) -> int:
+    """
+    Upper bound on the tokens a generation uses, for admission control.
+    """
+    return estimate_tokens(build_generation_prompt(mood, preferences)) + STRUCTURED_GENERATION_PARAMS["max_output_tokens"]
+
+def estimate_refinement_tokens(refinement_request: str, content: str = None, day: int = None) -> int:
+    """
+    Upper bound on the tokens a refinement uses. Without the current content
+    it is assumed to be as long as a full generation.
+    """
+    params = SECTION_REFINEMENT_PARAMS if day is not None else STRUCTURED_REFINEMENT_PARAMS
+    if content is None:
+        prompt_tokens = estimate_tokens(refinement_request) + STRUCTURED_GENERATION_PARAMS["max_output_tokens"]
+    else:
+        prompt_tokens = estimate_tokens(build_refinement_prompt(content, refinement_request))
+    return prompt_tokens + params["max_output_tokens"]
+
+async def get_itinerary(itinerary_id: int, user_id: str) -> dict:
+    """
+    Fetch a single itinerary row owned by `user_id`, raising ValueError if
+    it does not exist or belongs to someone else. Served from the itinerary
+    cache when possible.
+    """
+    cached = itinerary_cache.get(itinerary_id, user_id)
+    if cached is not None:
+        return cached
+    stamp = itinerary_cache.stamp()
+    result = await get_db().table("itineraries")\
+        .select("*")\
+        .eq("id", itinerary_id)\
+        .eq("user_id", user_id)\
+        .execute()
+    if not result.data:
+        raise ValueError("Itinerary not found")
+    itinerary_cache.put(result.data[0], stamp)
+    return result.data[0]
+
+def build_itinerary_row(mood: str, preferences: str, output: str, user_id: str) -> dict:
+    """
+    Build an itineraries row from model output. Structured output is kept in
+    `structured` and rendered to text for `content`.
+    """
+    content, structured = parse_itinerary_output(output)
+    return {
+        "mood": mood,
+        "preferences": preferences,
+        "content": content,
+        "user_id": user_id,
+        "original_content": content,
+        "structured": structured,
+        "original_structured": structured,
+        "is_favorite": False
+    }
+
+async def save_itinerary(mood: str, preferences: str, itinerary: str, user_id: str) -> dict:
+    """
+    Insert a freshly generated itinerary and return the stored row.
+    """
+    try:
+        data = build_itinerary_row(mood, preferences, itinerary, user_id)
+        result = await get_db().table("itineraries").insert(data).execute()
+        logger.info("Successfully saved itinerary to database")
+        itinerary_cache.add(result.data[0])
+        search_index.add(result.data[0])
+        return result.data[0]
+    except Exception as e:
+        logger.error(f"Failed to save itinerary to database: {str(e)}")
+        raise
+
+async def save_refinement(
+    itinerary: dict, user_id: str, refinement_request: str, refined_itinerary: str, structured: dict = None
+) -> dict:
+    """
+    Record a refinement in the history table and update the main itinerary
+    in a single save_refinement RPC call (one transaction, ownership checked
+    in SQL; see migrations/add_itinerary_functions.sql).
+    The history row stores a delta against the itinerary's current version,
+    or a full snapshot every HISTORY_SNAPSHOT_INTERVAL versions.
+    `structured` replaces the itinerary's sections; free text refinements clear them.
+    Returns the inserted history row.
+    """
+    try:
+        itinerary_id = itinerary['id']
+        version = (itinerary.get('history_version') or 0) + 1
+        history_data = build_history_entry(
+            itinerary_id,
+            version,
+            itinerary.get('current_version') or 0,
+            itinerary['content'],
+            refined_itinerary,
+            refinement_request
+        )
+        history = await get_db().rpc("save_refinement", {
+            "p_itinerary_id": itinerary_id,
+            "p_user_id": user_id,
+            "p_version": version,
+            "p_base_version": history_data["base_version"],
+            "p_refinement_request": refinement_request,
+            "p_content": refined_itinerary,
+            "p_structured": structured,
+            "p_history_content": history_data["content"],
+            "p_history_delta": history_data["delta"]
+        }).execute()
+        if not history.data:
+            raise ValueError("Itinerary not found")
+        speculator.invalidate(itinerary_id)
+        search_index.refine(itinerary_id, user_id, refined_itinerary, refinement_request)
+        logger.info(f"Successfully saved refinement version {version} of itinerary {itinerary_id}")
+        return history.data[0]
+    except Exception as e:
+        logger.error(f"Failed to save refinement: {str(e)}")
+        if getattr(e, "code", None) == SERIALIZATION_FAILURE:
+            raise RefinementConflict(f"Itinerary {itinerary['id']} was refined by another request, please retry") from e
+        raise
+    finally:
+        # The row has changed, or a conflict showed that our copy was stale
+        itinerary_cache.invalidate(itinerary['id'], user_id)
+
+async def stream_response_text(prompt: str, params: dict) -> AsyncIterator[str]:
+    """
+    Stream a completion from the Responses API, yielding text deltas as they arrive.
+    """
+    events = response_events(prompt, params)
+    try:
+        async for event in events:
+            if event.type == "response.output_text.delta":
+                yield event.delta
+            elif event.type in ("response.failed", "response.incomplete"):
+                raise response_failure(event, "Streaming response")
+    finally:
+        await events.aclose()
+
+async def create_itinerary_text(mood: str, preferences: str = None, cache_key: str = None) -> str:
+    """
+    Call the model for a new itinerary and, when a cache key is given,
+    add the result to the generation and semantic caches.
+    """
+    prompt = build_generation_prompt(mood, preferences)
+    params = model_router.route("generate", STRUCTURED_GENERATION_PARAMS)
+    response = await create_response(prompt, params)
+    
+    # Extract the content from the response structure
+    itinerary = response.output[0].content[0].text
+    logger.info("Successfully generated itinerary")
+    if cache_key is not None:
+        await generation_cache.store(cache_key, itinerary)
+        if semantic_cache is not None:
+            semantic_cache.store(mood, preferences, params, itinerary)
+    return itinerary
+
+async def resolve_itinerary_text(
+    mood: str, preferences: str = None, use_cache: bool = True, use_semantic_cache: bool = True,
+    admit: Callable[[], AsyncContextManager] = None
+) -> str:
+    """
+    Return structured itinerary output from the generation cache, the
+    semantic cache, a coalesced in-flight call, or a fresh model call, in
+    that order. `admit`, if given, is entered around the model call only,
+    so cache hits and coalesced followers take no admission slot.
+    """
+    # The key includes the model, so drafts and full generations are cached apart
+    params = model_router.route("generate", STRUCTURED_GENERATION_PARAMS)
+    cache_key = generation_cache_key(mood, preferences, params)
+    itinerary = await generation_cache.lookup(cache_key) if use_cache else None
+    if itinerary is not None:
+        logger.info("Serving itinerary from generation cache")
+        return itinerary
+    if use_cache and use_semantic_cache and semantic_cache is not None:
+        itinerary = semantic_cache.lookup(mood, preferences, params)
+        if itinerary is not None:
+            return itinerary
+
+    async def call_model() -> str:
+        if admit is None:
+            return await create_itinerary_text(mood, preferences, cache_key if use_cache else None)
+        async with admit():
+            return await create_itinerary_text(mood, preferences, cache_key if use_cache else None)
+
+    if use_cache:
+        # Identical concurrent requests share one upstream call
+        return await generation_flight.do(cache_key, call_model)
+    return await call_model()
+
+async def generate_itinerary(
+    mood: str, preferences: str = None, user_id: str = None, use_cache: bool = True
+) -> dict:
     """
     Generate a travel itinerary based on the given mood and preferences.
+    Identical requests may be served from the generation cache or share
+    an in-flight model call.
     Saves the itinerary to Supabase database.
     """
     try:
         logger.info(f"Generating itinerary for user {user_id}, mood: {mood}")
-        
-        prompt = (
-            f"Generate a detailed 3-day travel itinerary for a person feeling '{mood}'. "
-            f"Consider these preferences: {preferences if preferences else 'none'}.\n\n"
-            "The itinerary should include suggestions for destinations, activities, and local cuisine."
-        )
-        
-        response = client.responses.create(
-            model = "gpt-4o",
-            input = prompt,
-            temperature = 0.8,  # Higher temperature for more randomness
-            max_tokens = 1000,  # Limit response length
-            top_p = 0.9,  # Nucleus sampling for more diverse outputs
-            frequency_penalty = 0.5,  # Reduce repetition
-            presence_penalty = 0.5,  # Encourage new topics
-            stop = None  # No specific stop sequence
-        )
-        
-        # Extract the content from the response structure
-        itinerary = response.output[0].content[0].text
-        logger.info("Successfully generated itinerary")
+
+        itinerary = await resolve_itinerary_text(mood, preferences, use_cache)
 
         # Save to Supabase
-        try:
-            data = {
-                "mood": mood,
-                "preferences": preferences,
-                "content": itinerary,
-                "user_id": user_id,
-                "original_content": itinerary,
-                "is_favorite": False
-            }
-            result = supabase.table("itineraries").insert(data).execute()
-            logger.info("Successfully saved itinerary to database")
-            return result.data[0]
-        except Exception as e:
-            logger.error(f"Failed to save itinerary to database: {str(e)}")
-            raise
+        saved = await save_itinerary(mood, preferences, itinerary, user_id)
+        speculator.schedule(saved)
+        return saved
 
     except Exception as e:
         logger.error(f"Failed to generate itinerary: {str(e)}")
         raise
 
-def refine_itinerary(itinerary_id: int, refinement_request: str) -> str:
+async def generate_itineraries_batch(requests: List[dict], user_id: str) -> List[dict]:
+    """
+    Generate many itineraries concurrently, bounded by BATCH_CONCURRENCY and
+    the batch tokens-per-minute budget, then store them with one bulk insert.
+    Each model call takes its own admission slot as `user_id`, so a batch is
+    held to the same global limit and per-user fairness as single requests;
+    items shed by admission control fail on their own.
+    Returns one {"index", "success", "itinerary", "error"} result per request.
+    """
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    # Check the whole batch against the semantic cache in one pass
+    similar = {}
+    if semantic_cache is not None:
+        cacheable = [index for index, request in enumerate(requests) if request.get("use_cache", True)]
+        found = semantic_cache.lookup_batch(
+            [(requests[index]["mood"], requests[index].get("preferences")) for index in cacheable],
+            model_router.route("generate", STRUCTURED_GENERATION_PARAMS)
+        )
+        similar = {index: itinerary for index, itinerary in zip(cacheable, found) if itinerary is not None}
+
+    async def generate_one(index: int, request: dict) -> str:
+        if index in similar:
+            return similar[index]
+        async with semaphore:
+            prompt = build_generation_prompt(request["mood"], request.get("preferences"))
+            tokens = estimate_tokens(prompt) + STRUCTURED_GENERATION_PARAMS["max_output_tokens"]
+
+            # Only a real model call spends the batch budget, not a generation cache hit
+            @asynccontextmanager
+            async def admit():
+                await batch_token_budget.acquire(tokens)
+                async with llm_admission.admit(user_id, tokens):
+                    yield
+
+            return await resolve_itinerary_text(
+                request["mood"], request.get("preferences"), request.get("use_cache", True), use_semantic_cache=False,
+                admit=admit
+            )
+
+    logger.info(f"Generating batch of {len(requests)} itineraries for user {user_id}")
+    texts = await asyncio.gather(
+        *(generate_one(index, request) for index, request in enumerate(requests)), return_exceptions=True
+    )
+
+    results = []
+    rows = []
+    for index, (request, text) in enumerate(zip(requests, texts)):
+        # CancelledError is a BaseException, and must not be taken for itinerary text
+        if isinstance(text, BaseException):
+            logger.error(f"Batch item {index} failed: {str(text)}")
+            results.append({"index": index, "success": False, "itinerary": None, "error": str(text)})
+            continue
+        results.append({"index": index, "success": True, "itinerary": None, "error": None})
+        rows.append(build_itinerary_row(request["mood"], request.get("preferences"), text, user_id))
+
+    succeeded = [result for result in results if result["success"]]
+    if rows:
+        try:
+            inserted = await get_db().table("itineraries").insert(rows).execute()
+            logger.info(f"Saved {len(inserted.data)} batch itineraries to database")
+            # PostgREST returns inserted rows in request order
+            for result, row in zip(succeeded, inserted.data):
+                result["itinerary"] = row
+                itinerary_cache.add(row)
+                search_index.add(row)
+        except Exception as e:
+            logger.error(f"Failed to save batch itineraries: {str(e)}")
+            for result in succeeded:
+                result.update(success=False, error=f"Failed to save itinerary: {str(e)}")
+
+    return results
+
+async def refine_section(itinerary: dict, refinement_request: str, day: int, slot: int = None) -> Tuple[str, dict]:
+    """
+    Regenerate one day or slot of a structured itinerary, sending only that
+    section and an outline, and splice the result back in.
+    Returns the rendered content and the updated structure.
+    """
+    structured = itinerary.get('structured')
+    if not structured:
+        raise NotStructured("Itinerary has no structured sections to refine")
+
+    label = section_label(day, slot)
+    section = get_section(structured, day, slot)
+    prompt = build_section_refinement_prompt(summarize_itinerary(structured), section, label, refinement_request)
+    params = {
+        **model_router.route("refine_section", SECTION_REFINEMENT_PARAMS),
+        "text": json_output_format("slot" if slot is not None else "day", SLOT_SCHEMA if slot is not None else DAY_SCHEMA)
+    }
+    response = await create_response(prompt, params)
+    logger.info(f"Successfully refined {label}")
+
+    updated = splice_section(structured, json.loads(response.output[0].content[0].text), day, slot)
+    return render_itinerary(updated), updated
+
+async def create_refinement(itinerary: dict, refinement_request: str) -> Tuple[str, Optional[dict], int]:
+    """
+    Call the model for a full refinement of an itinerary row without saving it.
+    Returns the rendered content, the structure and the tokens used.
+    """
+    prompt = build_refinement_prompt(itinerary['content'], refinement_request)
+    params = model_router.route(model_router.refinement_kind(refinement_request), structured_refinement_params(itinerary))
+    response = await create_response(prompt, params)
+
+    refined_itinerary, structured = parse_itinerary_output(response.output[0].content[0].text)
+    logger.info("Successfully generated refined itinerary")
+    usage = response.usage
+    tokens = usage.total_tokens if usage is not None else estimate_refinement_tokens(refinement_request, itinerary['content'])
+    return refined_itinerary, structured, tokens
+
+async def refine_itinerary(
+    itinerary_id: int, refinement_request: str, user_id: str, day: int = None, slot: int = None
+) -> str:
     """
     Refine an existing itinerary based on the refinement request.
+    With `day` (and optionally `slot`) only that section is regenerated.
     """
     try:
+        if slot is not None and day is None:
+            raise SectionError("A slot refinement needs a day")
+
         # Get the current itinerary
-        result = supabase.table("itineraries").select("*").eq("id", itinerary_id).execute()
-        if not result.data:
-            raise ValueError("Itinerary not found")
-        
-        current_itinerary = result.data[0]
+        current_itinerary = await get_itinerary(itinerary_id, user_id)
         logger.info(f"Refining itinerary {itinerary_id}")
 
-        # Create the prompt for refinement
-        prompt = (
-            f"Here's the current itinerary:\n\n{current_itinerary['content']}\n\n"
-            f"Please refine it according to this request: {refinement_request}\n\n"
-            "Provide a complete refined version of the itinerary."
-        )
-        
-        # Generate refined version
-        response = client.responses.create(
-            model = "gpt-4o",
-            input = prompt,
-            temperature = 0.7,  # Slightly lower temperature for refinements
-            max_tokens = 1000,
-            top_p = 0.9,
-            frequency_penalty = 0.3,
-            presence_penalty = 0.3,
-            stop = None
-        )
-        
-        refined_itinerary = response.output[0].content[0].text
-        logger.info("Successfully generated refined itinerary")
+        if day is not None:
+            refined_itinerary, structured = await refine_section(current_itinerary, refinement_request, day, slot)
+        else:
+            speculator.record_request(refinement_request)
+            speculated = await speculator.take(current_itinerary, refinement_request)
+            if speculated is not None:
+                refined_itinerary, structured, _ = speculated
+            else:
+                refined_itinerary, structured, _ = await create_refinement(current_itinerary, refinement_request)
 
-        # Save the refinement to history
-        try:
-            history_data = {
-                "itinerary_id": itinerary_id,
-                "content": refined_itinerary,
-                "refinement_request": refinement_request
-            }
-            supabase.table("refinement_history").insert(history_data).execute()
-            logger.info("Successfully saved refinement to history")
-
-            # Update the main itinerary
-            supabase.table("itineraries")\
-                .update({"content": refined_itinerary})\
-                .eq("id", itinerary_id)\
-                .execute()
-            logger.info("Successfully updated main itinerary")
-        except Exception as e:
-            logger.error(f"Failed to save refinement: {str(e)}")
-            raise
+        # Save the refinement to history and update the main itinerary
+        await save_refinement(current_itinerary, user_id, refinement_request, refined_itinerary, structured)
 
         return refined_itinerary
     except Exception as e:
         logger.error(f"Failed to refine itinerary: {str(e)}")
         raise
 
-def revert_to_original(itinerary_id: int) -> str:
+async def upgrade_itinerary(itinerary_id: int, user_id: str) -> str:
+    """
+    Rewrite an itinerary with the "upgrade" model, normally the large one,
+    e.g. after drafting it with the small model. Saved like any refinement,
+    so the draft stays in the history.
+    """
+    try:
+        current_itinerary = await get_itinerary(itinerary_id, user_id)
+        logger.info(f"Upgrading itinerary {itinerary_id}")
+
+        prompt = build_upgrade_prompt(current_itinerary['content'])
+        response = await create_response(prompt, model_router.route("upgrade", structured_refinement_params(current_itinerary)))
+        upgraded_itinerary, structured = parse_itinerary_output(response.output[0].content[0].text)
+        logger.info("Successfully upgraded itinerary")
+
+        await save_refinement(current_itinerary, user_id, UPGRADE_REQUEST, upgraded_itinerary, structured)
+        return upgraded_itinerary
+    except Exception as e:
+        logger.error(f"Failed to upgrade itinerary: {str(e)}")
+        raise
+
+async def stream_generate_itinerary(
+    mood: str, preferences: str = None, user_id: str = None, use_cache: bool = True
+) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Stream a new itinerary as ("token", ...) events, then save it and
+    finish with a ("done", ...) event carrying the new row id.
+    A cached itinerary is sent as a single token event.
+    """
+    try:
+        logger.info(f"Streaming itinerary for user {user_id}, mood: {mood}")
+
+        params = model_router.route("generate", GENERATION_PARAMS)
+        cache_key = generation_cache_key(mood, preferences, params)
+        itinerary = await generation_cache.lookup(cache_key) if use_cache else None
+        if itinerary is not None:
+            logger.info("Serving itinerary from generation cache")
+            yield "token", {"delta": itinerary}
+        else:
+            chunks = []
+            async for delta in stream_response_text(build_generation_prompt(mood, preferences), params):
+                chunks.append(delta)
+                yield "token", {"delta": delta}
+            itinerary = "".join(chunks)
+            logger.info("Successfully streamed itinerary")
+            if use_cache:
+                await generation_cache.store(cache_key, itinerary)
+
+        saved = await save_itinerary(mood, preferences, itinerary, user_id)
+        speculator.schedule(saved)
+        yield "done", {"id": saved["id"]}
+    except Exception as e:
+        logger.error(f"Failed to stream itinerary: {str(e)}")
+        raise
+
+async def stream_refine_itinerary(
+    itinerary: dict, refinement_request: str, user_id: str
+) -> AsyncIterator[Tuple[str, dict]]:
     """
-    Revert an itinerary back to its original version.
+    Stream a refinement of an already fetched itinerary row. The history
+    and itinerary rows are written once the stream completes. Streamed
+    refinements are free text, so the itinerary's structured sections are
+    cleared, unless a speculated refinement is served instead.
+    """
+    try:
+        logger.info(f"Streaming refinement of itinerary {itinerary['id']}")
+
+        speculator.record_request(refinement_request)
+        speculated = await speculator.take(itinerary, refinement_request)
+        if speculated is not None:
+            # A speculated refinement is sent as a single token event, and keeps its sections
+            refined_itinerary, structured, _ = speculated
+            yield "token", {"delta": refined_itinerary}
+        else:
+            chunks = []
+            prompt = build_refinement_prompt(itinerary['content'], refinement_request)
+            params = model_router.route(model_router.refinement_kind(refinement_request), REFINEMENT_PARAMS)
+            async for delta in stream_response_text(prompt, params):
+                chunks.append(delta)
+                yield "token", {"delta": delta}
+            refined_itinerary, structured = "".join(chunks), None
+            logger.info("Successfully streamed refined itinerary")
+
+        history = await save_refinement(itinerary, user_id, refinement_request, refined_itinerary, structured)
+        yield "done", {"id": itinerary['id'], "history_id": history["id"]}
+    except Exception as e:
+        logger.error(f"Failed to stream refinement: {str(e)}")
+        raise
+
+async def revert_to_original(itinerary_id: int, user_id: str) -> dict:
+    """
+    Revert an itinerary back to its original version with a single
+    revert_itinerary RPC call. History is kept; version 0 is the original.
+    Returns the updated itinerary.
     """
     try:
         logger.info(f"Reverting itinerary with ID: {itinerary_id} to original version")
-        
-        # Fetch the original itinerary from Supabase
-        try:
-            result = supabase.table("itineraries").select("*").eq("id", itinerary_id).execute()
-            if not result.data:
-                raise ValueError(f"Itinerary with ID {itinerary_id} not found")
-            itinerary = result.data[0]
-            
-            if not itinerary.get('original_content'):
-                raise ValueError("No original content found for this itinerary")
-        except Exception as e:
-            logger.error(f"Failed to fetch itinerary from database: {str(e)}")
-            raise
 
-        # Update the itinerary to revert to original content
-        try:
-            update_data = {
-                "content": itinerary['original_content'],
-                "refined": False,
-                "refinement_request": None,
-                "refinement_count": 0
-            }
-            
-            supabase.table("itineraries").update(update_data).eq("id", itinerary_id).execute()
-            logger.info("Successfully reverted itinerary to original version")
-        except Exception as e:
-            logger.error(f"Failed to revert itinerary in database: {str(e)}")
-            raise
+        result = await get_db().rpc("revert_itinerary", {
+            "p_itinerary_id": itinerary_id,
+            "p_user_id": user_id
+        }).execute()
+        if not result.data:
+            raise ValueError(f"Itinerary with ID {itinerary_id} not found or has no original content")
+        logger.info("Successfully reverted itinerary to original version")
+        itinerary_cache.put(result.data[0])
+        search_index.refine(itinerary_id, user_id, result.data[0]["content"])
 
-        return itinerary['original_content']
+        return result.data[0]
     except Exception as e:
         logger.error(f"Failed to revert itinerary: {str(e)}")
         raise
 
-def get_refinement_history(itinerary_id: int) -> List[Dict[str, Any]]:
+async def get_refinement_history(itinerary_id: int, user_id: str) -> List[Dict[str, Any]]:
     """
-    Get the refinement history for an itinerary.
+    Get the refinement history for an itinerary owned by `user_id`, newest
+    first. Stored deltas are rebuilt into full content.
     """
     try:
         logger.info(f"Fetching refinement history for itinerary ID: {itinerary_id}")
-        
-        result = supabase.table("refinement_history")\
+
+        original = await get_db().table("itineraries")\
+            .select("original_content")\
+            .eq("id", itinerary_id)\
+            .eq("user_id", user_id)\
+            .execute()
+        if not original.data:
+            raise ValueError("Itinerary not found")
+
+        result = await get_db().table("refinement_history")\
             .select("*")\
             .eq("itinerary_id", itinerary_id)\
-            .order("created_at", desc=True)\
+            .order("version")\
             .execute()
-            
-        return result.data
+
+        contents = rebuild_versions(original.data[0]['original_content'], result.data)
+        history = [
+            {**{k: v for k, v in row.items() if k != "delta"}, "content": contents[row["version"]]}
+            for row in result.data
+        ]
+        return history[::-1]
     except Exception as e:
         logger.error(f"Failed to fetch refinement history: {str(e)}")
         raise
 
-def toggle_favorite_itinerary(itinerary_id: int, user_id: str, is_favorite: bool) -> dict:
+async def get_refinement_history_etag(itinerary_id: int, user_id: str) -> str:
     """
-    Toggle favorite status of an itinerary.
-    Returns the updated itinerary.
+    ETag of an itinerary's refinement history from its newest version
+    number alone. History rows are only ever appended, by save_refinement,
+    which moves history_version in the same transaction.
+    """
+    result = await get_db().table("itineraries")\
+        .select("history_version")\
+        .eq("id", itinerary_id)\
+        .eq("user_id", user_id)\
+        .execute()
+    if not result.data:
+        raise ValueError("Itinerary not found")
+    return history_etag(itinerary_id, result.data[0]["history_version"] or 0)
+
+def history_etag(itinerary_id: int, version: int) -> str:
+    return version_etag("history", itinerary_id, version)
+
+async def get_refinement_version(itinerary_id: int, version: int, user_id: str) -> str:
+    """
+    Rebuild a single version of an itinerary owned by `user_id`. Only the
+    rows back to the nearest snapshot are fetched, so the cost does not grow
+    with history length.
     """
     try:
-        # Verify ownership
-        result = supabase.table("itineraries")\
-            .select("*")\
+        floor = snapshot_floor(version)
+        owner = await get_db().table("itineraries")\
+            .select("id")\
             .eq("id", itinerary_id)\
             .eq("user_id", user_id)\
             .execute()
-            
-        if not result.data:
+        if not owner.data:
             raise ValueError("Itinerary not found")
-            
-        # Update favorite status
-        updated = supabase.table("itineraries")\
-            .update({"is_favorite": is_favorite})\
-            .eq("id", itinerary_id)\
+
+        result = await get_db().table("refinement_history")\
+            .select("*")\
+            .eq("itinerary_id", itinerary_id)\
+            .gte("version", max(floor, 1))\
+            .lte("version", version)\
+            .order("version")\
             .execute()
-            
+        if version > 0 and not any(row["version"] == version for row in result.data):
+            raise ValueError(f"Version {version} not found")
+
+        # Version 0 is needed when the chain starts there, e.g. the first edits after a revert
+        original_content = None
+        if floor == 0 or any(row.get("delta") is not None and row["base_version"] == 0 for row in result.data):
+            original = await get_db().table("itineraries")\
+                .select("original_content")\
+                .eq("id", itinerary_id)\
+                .eq("user_id", user_id)\
+                .execute()
+            if not original.data:
+                raise ValueError("Itinerary not found")
+            original_content = original.data[0]['original_content']
+
+        return rebuild_versions(original_content, result.data)[version]
+    except Exception as e:
+        logger.error(f"Failed to rebuild itinerary version: {str(e)}")
+        raise
+
+async def toggle_favorite_itinerary(itinerary_id: int, user_id: str, is_favorite: bool) -> dict:
+    """
+    Toggle favorite status of an itinerary. The ownership check and update
+    are one set_itinerary_favorite RPC call.
+    Returns the updated itinerary.
+    """
+    try:
+        updated = await get_db().rpc("set_itinerary_favorite", {
+            "p_itinerary_id": itinerary_id,
+            "p_user_id": user_id,
+            "p_is_favorite": is_favorite
+        }).execute()
+
+        if not updated.data:
+            raise ValueError("Itinerary not found")
+
+        itinerary_cache.put(updated.data[0])
         return updated.data[0]
     except Exception as e:
         logger.error(f"Failed to toggle favorite status: {str(e)}")
         raise
 
-async def get_favorite_itineraries(user_id: str) -> list:
+# Columns returned by the listing endpoints unless ?fields= asks for more
+ITINERARY_SUMMARY_COLUMNS = ITINERARY_LIST_COLUMNS
+ITINERARY_OPTIONAL_COLUMNS = ["content", "original_content", "structured"]
+# Enough to place a row in a page and tell whether it changed; updated_at moves
+# on every write (migrations/add_itinerary_updated_at.sql)
+ITINERARY_VERSION_COLUMNS = "id,created_at,updated_at"
+
+def encode_cursor(row: dict) -> str:
     """
-    Get all favorite itineraries for a user.
+    Encode the (created_at, id) keyset position of a row as an opaque cursor.
     """
+    payload = json.dumps([row["created_at"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
     try:
-        result = supabase.table("itineraries")\
-            .select("*")\
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def itinerary_columns(fields: Optional[str] = None) -> str:
+    """
+    Build the select list for a listing query from a comma separated ?fields= value.
+    """
+    extra = [field.strip() for field in (fields or "").split(",") if field.strip()]
+    unknown = set(extra) - set(ITINERARY_OPTIONAL_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return ",".join(ITINERARY_SUMMARY_COLUMNS + [c for c in ITINERARY_OPTIONAL_COLUMNS if c in extra])
+
+def cursor_position(created_at: str, row_id: int) -> Tuple[datetime, int]:
+    return datetime.fromisoformat(created_at), row_id
+
+def page_rows(
+    rows: List[Dict[str, Any]], columns: str, limit: int, cursor: str = None, favorites_only: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Apply the listing filters, keyset cursor and column projection to rows
+    already sorted newest first, like the database query does.
+    """
+    if favorites_only:
+        rows = [row for row in rows if row.get("is_favorite")]
+    if cursor:
+        position = cursor_position(*decode_cursor(cursor))
+        rows = [row for row in rows if cursor_position(row["created_at"], row["id"]) < position]
+    names = columns.split(",")
+    page = [{name: row.get(name) for name in names} for row in rows[:limit]]
+    next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+    return page, next_cursor
+
+async def cached_itinerary_list(user_id: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    A user's itineraries, newest first, with the summary columns only,
+    through the itinerary cache. A one-row probe past ITINERARY_CACHE_LIST_MAX
+    finds users with too many to cache before their list is read. None when
+    the cache is off or the list is too long.
+    """
+    if not itinerary_cache.enabled:
+        return None
+    listed = itinerary_cache.list_rows(user_id)
+    if listed is TOO_LONG:
+        return None
+    if listed is not None:
+        return listed
+
+    stamp = itinerary_cache.stamp()
+    probe = await get_db().table("itineraries")\
+        .select("id")\
+        .eq("user_id", user_id)\
+        .range(ITINERARY_CACHE_LIST_MAX, ITINERARY_CACHE_LIST_MAX)\
+        .execute()
+    if probe.data:
+        itinerary_cache.put_list(user_id, [], False, stamp)
+        return None
+
+    result = await get_db().table("itineraries")\
+        .select(",".join(ITINERARY_SUMMARY_COLUMNS))\
+        .eq("user_id", user_id)\
+        .order("created_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(ITINERARY_CACHE_LIST_MAX + 1)\
+        .execute()
+    complete = len(result.data) <= ITINERARY_CACHE_LIST_MAX
+    itinerary_cache.put_list(user_id, result.data, complete, stamp)
+    return result.data if complete else None
+
+async def add_page_columns(user_id: str, page: List[Dict[str, Any]], columns: str) -> List[Dict[str, Any]]:
+    """
+    Fill in the ?fields= columns of a page taken from a cached list: from
+    cached rows where possible, the rest in one query selecting `columns`.
+    """
+    names = columns.split(",")
+    found, missing = itinerary_cache.rows(user_id, [row["id"] for row in page])
+    if missing:
+        result = await get_db().table("itineraries")\
+            .select(columns)\
             .eq("user_id", user_id)\
-            .eq("is_favorite", True)\
+            .in_("id", missing)\
             .execute()
-        return result.data
+        found.update((row["id"], row) for row in result.data)
+    # Rows deleted since the list was read are left out
+    return [{**row, **{name: found[row["id"]].get(name) for name in names}} for row in page if row["id"] in found]
+
+async def list_itineraries(
+    user_id: str, limit: int = 20, cursor: str = None, fields: str = None, favorites_only: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of a user's itineraries, newest first, using keyset
+    pagination on (created_at, id). Returns the rows and the cursor for the
+    next page, or None on the last page. Pages come from memory when the
+    user's list is in the itinerary cache.
+    """
+    columns = itinerary_columns(fields)
+    listed = await cached_itinerary_list(user_id)
+    if listed is None:
+        return await query_itinerary_page(user_id, columns, limit, cursor, favorites_only)
+    summary = ",".join(ITINERARY_SUMMARY_COLUMNS)
+    page, next_cursor = page_rows(listed, summary, limit, cursor, favorites_only)
+    if columns != summary:
+        page = await add_page_columns(user_id, page, columns)
+    return page, next_cursor
+
+async def query_itinerary_page(
+    user_id: str, columns: str, limit: int, cursor: str = None, favorites_only: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    query = get_db().table("itineraries")\
+        .select(columns)\
+        .eq("user_id", user_id)
+    if favorites_only:
+        query = query.eq("is_favorite", True)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})')
+
+    # Fetch one extra row to learn whether another page exists
+    result = await query\
+        .order("created_at", desc=True)\
+        .order("id", desc=True)\
+        .limit(limit + 1)\
+        .execute()
+
+    rows = result.data[:limit]
+    next_cursor = encode_cursor(rows[-1]) if len(result.data) > limit else None
+    return rows, next_cursor
+
+def itinerary_page_etag(rows: List[Dict[str, Any]], next_cursor: Optional[str], fields: str = None) -> str:
+    """
+    ETag of a listing page from the ids and updated_at values of its rows,
+    so it can be computed from a page fetched with ITINERARY_VERSION_COLUMNS.
+    """
+    return version_etag(
+        "itineraries", itinerary_columns(fields), [[row["id"], row["updated_at"]] for row in rows], next_cursor
+    )
+
+async def list_itineraries_etag(
+    user_id: str, limit: int = 20, cursor: str = None, fields: str = None, favorites_only: bool = False
+) -> str:
+    """
+    The ETag list_itineraries would give the page, found without reading
+    its content: from memory when the user's list is cached, otherwise with
+    the same keyset query selecting ITINERARY_VERSION_COLUMNS only.
+    """
+    # Reject unknown fields before querying
+    itinerary_columns(fields)
+    listed = await cached_itinerary_list(user_id)
+    if listed is not None:
+        rows, next_cursor = page_rows(listed, ITINERARY_VERSION_COLUMNS, limit, cursor, favorites_only)
+    else:
+        rows, next_cursor = await query_itinerary_page(user_id, ITINERARY_VERSION_COLUMNS, limit, cursor, favorites_only)
+    return itinerary_page_etag(rows, next_cursor, fields)
+
+async def export_itineraries(user_id: str) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield a user's itineraries EXPORT_BATCH at a time, oldest first, each
+    with its refinement_history rows under "history" in version order.
+    Every page is one keyset query with the history embedded by PostgREST,
+    so memory use and the time spent in any one query stay bounded however
+    many itineraries there are. History rows are exported as stored, full
+    content or a delta against base_version (see versioning.py).
+    """
+    try:
+        last_id = 0
+        while True:
+            result = await get_db().table("itineraries")\
+                .select("*,refinement_history(*)")\
+                .eq("user_id", user_id)\
+                .gt("id", last_id)\
+                .order("id")\
+                .limit(EXPORT_BATCH)\
+                .execute()
+            page = []
+            for row in result.data:
+                history = sorted(row.pop("refinement_history") or [], key=lambda entry: entry["version"])
+                page.append({**row, "history": history})
+            if page:
+                yield page
+            if len(result.data) < EXPORT_BATCH:
+                return
+            last_id = result.data[-1]["id"]
     except Exception as e:
-        logger.error(f"Failed to get favorite itineraries: {str(e)}")
+        logger.error(f"Failed to export itineraries: {str(e)}")
         raise
 
-def get_user_itineraries(user_id: str) -> list:
+def validate_import(item: Any) -> dict:
     """
-    Get all itineraries for a specific user.
+    Check one line of an import, in the format written by export_itineraries.
+    Raises ValueError.
     """
+    if not isinstance(item, dict) or not isinstance(item.get("mood"), str) or not isinstance(item.get("content"), str):
+        raise ValueError("expected an itinerary object with mood and content")
+    history = item.get("history") or []
+    if not isinstance(history, list):
+        raise ValueError("history must be a list")
+    for entry in history:
+        if not isinstance(entry, dict) or not isinstance(entry.get("version"), int):
+            raise ValueError("every history entry needs a version")
+        if not isinstance(entry.get("content"), str) and not isinstance(entry.get("delta"), str):
+            raise ValueError(f"history version {entry['version']} has neither content nor delta")
+    return item
+
+async def import_itineraries(user_id: str, lines: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Import NDJSON itineraries, as written by export_itineraries, for a user.
+    Lines are read as they arrive and written IMPORT_BATCH at a time with
+    the import_itineraries RPC, one transaction per chunk (see
+    migrations/add_itinerary_import.sql). Invalid lines and failed chunks are
+    skipped and reported; the rest are kept.
+    """
+    imported, failed, errors = 0, 0, []
+
+    def report(error: str) -> None:
+        if len(errors) < IMPORT_MAX_ERRORS:
+            errors.append(error)
+
+    async def flush(chunk: List[Tuple[int, dict]]) -> None:
+        nonlocal imported, failed
+        try:
+            result = await get_db().rpc("import_itineraries", {
+                "p_user_id": user_id,
+                "p_itineraries": [item for _, item in chunk]
+            }).execute()
+            imported += len(result.data)
+        except Exception as e:
+            logger.error(f"Failed to import {len(chunk)} itineraries: {str(e)}")
+            failed += len(chunk)
+            report(f"lines {chunk[0][0]}-{chunk[-1][0]}: {str(e)}")
+
     try:
-        result = supabase.table("itineraries")\
-            .select("*")\
+        chunk: List[Tuple[int, dict]] = []
+        number = 0
+        async for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                chunk.append((number, validate_import(json.loads(line))))
+            except ValueError as e:
+                failed += 1
+                report(f"line {number}: {str(e)}")
+                continue
+            if len(chunk) >= IMPORT_BATCH:
+                await flush(chunk)
+                chunk = []
+        if chunk:
+            await flush(chunk)
+        logger.info(f"Imported {imported} itineraries, {failed} failed")
+        return {"imported": imported, "failed": failed, "errors": errors}
+    finally:
+        if imported:
+            itinerary_cache.invalidate_list(user_id)
+            search_index.invalidate(user_id)
+
+# Rows read per query while building a user's in-memory search index
+SEARCH_INDEX_BATCH = 1000
+# Itinerary ids per refinement_history query while building it
+SEARCH_HISTORY_BATCH = 200
+
+def encode_search_cursor(row: dict) -> str:
+    """
+    Encode the (rank, id) position of a search result as an opaque cursor.
+    """
+    payload = json.dumps([row["rank"], row["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(rank), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+async def build_search_index(user_id: str) -> UserIndex:
+    """
+    Index all of a user's itineraries and their refinement requests, reading
+    SEARCH_INDEX_BATCH rows at a time in id order.
+    """
+    index = UserIndex()
+    last_id = 0
+    while True:
+        result = await get_db().table("itineraries")\
+            .select("id,mood,preferences,content")\
             .eq("user_id", user_id)\
-            .order("created_at", desc=True)\
+            .gt("id", last_id)\
+            .order("id")\
+            .limit(SEARCH_INDEX_BATCH)\
             .execute()
-        return result.data
+        if not result.data:
+            break
+        ids = [row["id"] for row in result.data]
+        requests: Dict[int, List[str]] = {}
+        for offset in range(0, len(ids), SEARCH_HISTORY_BATCH):
+            history = await get_db().table("refinement_history")\
+                .select("itinerary_id,refinement_request")\
+                .in_("itinerary_id", ids[offset:offset + SEARCH_HISTORY_BATCH])\
+                .execute()
+            for entry in history.data:
+                requests.setdefault(entry["itinerary_id"], []).append(entry["refinement_request"])
+        for row in result.data:
+            index.put(row["id"], row["mood"], row.get("preferences"), row.get("content"), requests.get(row["id"], []))
+        if len(result.data) < SEARCH_INDEX_BATCH:
+            break
+        last_id = ids[-1]
+    return index
+
+async def search_in_memory(
+    user_id: str, query: str, columns: str, limit: int, after: Optional[Tuple[float, int]]
+) -> List[Dict[str, Any]]:
+    """
+    search_itineraries for SEARCH_BACKEND=memory: rank with the user's
+    in-process index, built on first use, then read only the page's rows.
+    """
+    index = search_index.get(user_id)
+    if index is None:
+        stamp = search_index.stamp()
+        index = await build_search_index(user_id)
+        search_index.put(user_id, index, stamp)
+
+    terms = tokenize(query)
+    hits = index.search(terms, limit, after) if terms else []
+    if not hits:
+        return []
+    names = columns.split(",")
+    result = await get_db().table("itineraries")\
+        .select(",".join(names + ([] if "content" in names else ["content"])))\
+        .eq("user_id", user_id)\
+        .in_("id", [itinerary_id for _, itinerary_id in hits])\
+        .execute()
+    rows = {row["id"]: row for row in result.data}
+    return [
+        {
+            **{name: rows[itinerary_id].get(name) for name in names},
+            "rank": rank,
+            "snippet": snippet(rows[itinerary_id].get("content"), terms)
+        }
+        for rank, itinerary_id in hits if itinerary_id in rows
+    ]
+
+async def search_itineraries(
+    user_id: str, query: str, limit: int = 20, cursor: str = None, fields: str = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Get a page of a user's itineraries matching `query`, best match first,
+    each with its `rank` and a `snippet` of its content around the matches.
+    Uses the search_itineraries function (see
+    migrations/add_itinerary_search.sql), or an in-process index with
+    SEARCH_BACKEND=memory.
+    """
+    try:
+        if not query.strip():
+            raise ValueError("Empty search query")
+        columns = itinerary_columns(fields)
+        after = decode_search_cursor(cursor) if cursor else None
+
+        # Fetch one extra row to learn whether another page exists
+        if SEARCH_BACKEND == "memory":
+            rows = await search_in_memory(user_id, query, columns, limit + 1, after)
+        else:
+            result = await get_db().rpc("search_itineraries", {
+                "p_user_id": user_id,
+                "p_query": query,
+                "p_limit": limit + 1,
+                "p_rank": after[0] if after else None,
+                "p_id": after[1] if after else None
+            }).select(f"{columns},rank,snippet").execute()
+            rows = result.data
+
+        page = rows[:limit]
+        next_cursor = encode_search_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+    except Exception as e:
+        logger.error(f"Failed to search itineraries: {str(e)}")
+        raise
+
+async def get_favorite_itineraries(
+    user_id: str, limit: int = 20, cursor: str = None, fields: str = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Get a page of favorite itineraries for a user.
+    """
+    try:
+        return await list_itineraries(user_id, limit, cursor, fields, favorites_only=True)
+    except Exception as e:
+        logger.error(f"Failed to get favorite itineraries: {str(e)}")
+        raise
+
+async def get_user_itineraries(
+    user_id: str, limit: int = 20, cursor: str = None, fields: str = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Get a page of itineraries for a specific user.
+    """
+    try:
+        return await list_itineraries(user_id, limit, cursor, fields)
     except Exception as e:
         logger.error(f"Failed to get user itineraries: {str(e)}")
         raise
 
 # Example usage
-if __name__ == "__main__":
+async def main():
     try:
         # Generate a new itinerary
-        result = generate_itinerary("want to do something fun", "entertaining, yummy food")
+        result = await generate_itinerary("want to do something fun", "entertaining, yummy food")
         print("Generated Itinerary:", result)
         
-        # Example of refining an itinerary (assuming ID 1 exists)
-        refined = refine_itinerary(1, "Add more budget-friendly options")
+        # Example of refining the new itinerary
+        refined = await refine_itinerary(result["id"], "Add more budget-friendly options", result["user_id"])
         print("\nRefined Itinerary:", refined)
         
         # Example of getting refinement history
-        history = get_refinement_history(1)
+        history = await get_refinement_history(result["id"], result["user_id"])
         print("\nRefinement History:", history)
         
         # Example of reverting to original
-        original = revert_to_original(1)
+        original = await revert_to_original(result["id"], result["user_id"])
         print("\nReverted to Original:", original)
     except Exception as e:
-        logger.error(f"Main execution failed: {str(e)}")
\ No newline at end of file
+        logger.error(f"Main execution failed: {str(e)}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
\ No newline at end of file
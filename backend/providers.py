@@ -0,0 +1,51 @@
+import asyncio
+import threading
+from typing import Any, Callable, Optional
+from logger import setup_logger
+
+# Setup logger
+logger = setup_logger("providers")
+
+class ConfigurationError(RuntimeError):
+    """Raised when a client cannot be built because settings are missing."""
+
+class Provider:
+    """
+    Builds a client on first use and hands the same instance to every
+    caller, so importing the app needs neither credentials nor the client
+    libraries. Calling the provider returns the client, which makes it
+    usable as a FastAPI dependency; override() swaps in a stand-in.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self._instance: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            # Warm-up may be building the client in a worker thread at the same time
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+                    logger.info(f"Initialized {self.name} client")
+                instance = self._instance
+        return instance
+
+    __call__ = get
+
+    async def warm(self) -> None:
+        """Build the client off the event loop so startup work does not stall requests."""
+        await asyncio.to_thread(self.get)
+
+    def override(self, instance: Any) -> None:
+        self._instance = instance
+
+    def reset(self) -> None:
+        self._instance = None
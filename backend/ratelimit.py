@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count for budgeting, at about four characters per token.
+    """
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """
+    Continuously refilling budget, e.g. an LLM tokens-per-minute limit.
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` would be available, counting tokens already reserved.
+        """
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self._tokens) / self.rate)
+
+    def reserve(self, amount: float) -> None:
+        """
+        Take `amount` now even if that leaves the balance negative; callers
+        wait out wait_time() first. Later requests queue behind the debt.
+        """
+        self._refill()
+        self._tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + min(amount, self.capacity))
+
+    def try_acquire(self, amount: float) -> bool:
+        self._refill()
+        if self._tokens >= amount:
+            self._tokens -= amount
+            return True
+        return False
+
+    async def acquire(self, amount: float) -> None:
+        # A request larger than the whole bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while not self.try_acquire(amount):
+                await asyncio.sleep((amount - self._tokens) / self.rate)
@@ -0,0 +1,101 @@
+import os
+from typing import Dict, Tuple
+from dotenv import load_dotenv
+from logger import setup_logger
+
+# Setup logger
+logger = setup_logger("router")
+
+# Load environment variables
+load_dotenv()
+
+# Model tiers
+MODEL_LARGE = os.getenv("MODEL_LARGE", "gpt-4o")
+MODEL_SMALL = os.getenv("MODEL_SMALL", "gpt-4o-mini")
+# Tier (or model name) per kind of call, e.g. "refine=small,refine_section=small"
+MODEL_ROUTES = os.getenv("MODEL_ROUTES", "")
+# Draft new itineraries with the small model; POST /upgrade/{itinerary_id} redoes them with the large one
+MODEL_DRAFT_MODE = os.getenv("MODEL_DRAFT_MODE", "false").lower() == "true"
+# Refinement requests longer than this are treated as substantial rewrites
+MODEL_SHORT_REFINEMENT_CHARS = int(os.getenv("MODEL_SHORT_REFINEMENT_CHARS", "200"))
+# USD per million input:output tokens, for the cost metric
+MODEL_PRICES = os.getenv("MODEL_PRICES", "gpt-4o=2.50:10.00,gpt-4o-mini=0.15:0.60")
+
+DEFAULT_ROUTES = {
+    "generate": "large",
+    "refine": "small",
+    "refine_long": "large",
+    "refine_section": "small",
+    "upgrade": "large"
+}
+
+def parse_routes(value: str) -> Dict[str, str]:
+    routes = {}
+    for item in value.split(","):
+        kind, _, target = item.partition("=")
+        if kind.strip() and target.strip():
+            routes[kind.strip()] = target.strip()
+    return routes
+
+def parse_prices(value: str) -> Dict[str, Tuple[float, float]]:
+    prices = {}
+    for item in value.split(","):
+        model, _, price = item.partition("=")
+        input_price, _, output_price = price.partition(":")
+        if model.strip() and input_price.strip() and output_price.strip():
+            prices[model.strip()] = (float(input_price), float(output_price))
+    return prices
+
+class ModelRouter:
+    """
+    Picks the model for each kind of call: "generate", "refine" (short
+    requests), "refine_long", "refine_section" and "upgrade". Routes name
+    a tier ("small"/"large") or a model directly.
+    """
+
+    def __init__(self, tiers: Dict[str, str], routes: Dict[str, str], short_refinement_chars: int):
+        self.tiers = tiers
+        self.routes = routes
+        self.short_refinement_chars = short_refinement_chars
+
+    def model_for(self, kind: str) -> str:
+        target = self.routes.get(kind, "large")
+        return self.tiers.get(target, target)
+
+    def refinement_kind(self, refinement_request: str, section: bool = False) -> str:
+        if section:
+            return "refine_section"
+        if len(refinement_request) > self.short_refinement_chars:
+            return "refine_long"
+        return "refine"
+
+    def route(self, kind: str, params: dict) -> dict:
+        """
+        Return a copy of the call parameters using the model for `kind`.
+        """
+        return {**params, "model": self.model_for(kind)}
+
+def build_routes() -> Dict[str, str]:
+    routes = dict(DEFAULT_ROUTES)
+    if MODEL_DRAFT_MODE:
+        routes["generate"] = "small"
+    routes.update(parse_routes(MODEL_ROUTES))
+    return routes
+
+def log_routes(router: ModelRouter) -> None:
+    resolved = ", ".join(f"{kind}={router.model_for(kind)}" for kind in sorted(set(DEFAULT_ROUTES) | set(router.routes)))
+    draft = " (draft mode: new itineraries use the small model)" if MODEL_DRAFT_MODE else ""
+    logger.info(f"Model routes: {resolved}{draft}")
+
+model_router = ModelRouter({"small": MODEL_SMALL, "large": MODEL_LARGE}, build_routes(), MODEL_SHORT_REFINEMENT_CHARS)
+log_routes(model_router)
+model_prices = parse_prices(MODEL_PRICES)
+
+def usage_cost(model: str, usage) -> float:
+    """
+    USD cost of a Responses API usage object; 0 for models without a price.
+    """
+    if usage is None or model not in model_prices:
+        return 0.0
+    input_price, output_price = model_prices[model]
+    return (usage.input_tokens * input_price + usage.output_tokens * output_price) / 1_000_000
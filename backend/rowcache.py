@@ -0,0 +1,325 @@
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from dotenv import load_dotenv
+from jobs import JOB_BROKER_ADDRESS, JOB_BROKER_AUTHKEY, BrokerManager, broker_authkey, parse_address
+from logger import setup_logger
+
+# Setup logger
+logger = setup_logger("rowcache")
+
+# Load environment variables
+load_dotenv()
+
+# Itinerary rows kept per process; 0 turns the cache off
+ITINERARY_CACHE_SIZE = int(os.getenv("ITINERARY_CACHE_SIZE", "10000"))
+# Seconds a cached row or list may be served without re-reading it
+ITINERARY_CACHE_TTL = float(os.getenv("ITINERARY_CACHE_TTL", "30"))
+# Users whose itinerary list is indexed, and the longest list that is cached
+ITINERARY_CACHE_USERS = int(os.getenv("ITINERARY_CACHE_USERS", "1000"))
+ITINERARY_CACHE_LIST_MAX = int(os.getenv("ITINERARY_CACHE_LIST_MAX", "200"))
+# "none", or "manager" to fan invalidations out to other workers through the job broker
+ITINERARY_CACHE_BUS = os.getenv("ITINERARY_CACHE_BUS", "none")
+ITINERARY_CACHE_BUS_INTERVAL = float(os.getenv("ITINERARY_CACHE_BUS_INTERVAL", "0.2"))
+
+# Columns of each itinerary kept in a user's cached list: the summary the
+# listing endpoints return, which holds no itinerary text
+ITINERARY_LIST_COLUMNS = ["id", "mood", "preferences", "user_id", "is_favorite", "created_at", "updated_at"]
+
+# Marks a user whose list is too long to cache, so it is not fetched again until expiry
+TOO_LONG = object()
+
+class InvalidationBus:
+    """Carries ("row", user_id, itinerary_id) and ("list", user_id, None) events between workers."""
+
+    def publish(self, event: Tuple[str, str, Optional[int]]) -> None:
+        pass
+
+    def start(self, handler: Callable[[Tuple[str, str, Optional[int]]], None]) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+class ManagerBus(InvalidationBus):
+    """
+    Pub/sub through the event log of the job broker (python jobs.py serve),
+    a local stand-in for e.g. Redis pub/sub. Workers poll for new events
+    every `interval` seconds and skip their own.
+    """
+
+    def __init__(self, address: str, authkey: str, interval: float):
+        self.interval = interval
+        self.origin = uuid.uuid4().hex
+        self._manager = BrokerManager(address=parse_address(address), authkey=broker_authkey(authkey))
+        self._connected = False
+        self._poller: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+
+    def _ensure_connected(self) -> None:
+        if not self._connected:
+            self._manager.connect()
+            self._connected = True
+
+    def _publish(self, event: tuple) -> None:
+        try:
+            self._ensure_connected()
+            self._manager.get_events().publish((self.origin, event))
+        except Exception as e:
+            logger.error(f"Failed to publish itinerary cache invalidation: {str(e)}")
+
+    def _since(self, sequence: int) -> Tuple[int, List[Any]]:
+        self._ensure_connected()
+        return self._manager.get_events().since(sequence)
+
+    def publish(self, event: Tuple[str, str, Optional[int]]) -> None:
+        self.published += 1
+        asyncio.get_running_loop().run_in_executor(None, self._publish, event)
+
+    def start(self, handler: Callable[[Tuple[str, str, Optional[int]]], None]) -> None:
+        self._poller = asyncio.create_task(self.poll(handler))
+
+    async def poll(self, handler: Callable[[Tuple[str, str, Optional[int]]], None]) -> None:
+        sequence = -1
+        while True:
+            try:
+                sequence, events = await asyncio.to_thread(self._since, sequence)
+                for origin, event in events:
+                    if origin != self.origin:
+                        self.received += 1
+                        handler(event)
+            except Exception as e:
+                logger.error(f"Failed to read itinerary cache invalidations: {str(e)}")
+                self._connected = False
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> None:
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+
+class ItineraryCache:
+    """
+    Per-process read-through cache of itinerary rows, keyed by (user id,
+    itinerary id), plus each user's list of itineraries, newest first, with
+    the `list_columns` of each only, so the listing endpoints can page and
+    compute ETags in memory without reading itinerary text.
+
+    Entries expire after `ttl` seconds. Every write bumps a version stamp
+    for its key; a read started before the write (stamp() taken earlier)
+    cannot store what it fetched, so a slow read never overwrites a newer
+    row. Writes and invalidations are published on the bus so other
+    workers drop their copies.
+    """
+
+    def __init__(
+        self, max_rows: int, max_users: int, ttl: float, list_max: int, list_columns: List[str], bus: InvalidationBus
+    ):
+        self.max_rows = max_rows
+        self.max_users = max_users
+        self.ttl = ttl
+        self.list_max = list_max
+        self.list_columns = list_columns
+        self.bus = bus
+        self._rows: "OrderedDict[Tuple[str, int], Tuple[dict, float]]" = OrderedDict()
+        self._lists: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._generation = 0
+        # Last stamp at which each key was written; the oldest are forgotten
+        # and `_floor` remembers the newest of those
+        self._written: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.list_hits = 0
+        self.list_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rows > 0
+
+    def start(self) -> None:
+        self.bus.start(self.apply)
+
+    async def stop(self) -> None:
+        await self.bus.stop()
+
+    def stamp(self) -> int:
+        """Take before reading from the database; pass to put()/put_list()."""
+        return self._generation
+
+    def _bump(self, key: Hashable) -> None:
+        self._generation += 1
+        self._written[key] = self._generation
+        self._written.move_to_end(key)
+        while len(self._written) > self.max_rows + self.max_users:
+            _, generation = self._written.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def _current(self, key: Hashable, stamp: int) -> bool:
+        return stamp >= self._floor and self._written.get(key, 0) <= stamp
+
+    def _store_row(self, row: dict) -> None:
+        key = (row["user_id"], row["id"])
+        self._rows[key] = (row, time.monotonic() + self.ttl)
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.max_rows:
+            self._rows.popitem(last=False)
+
+    def get(self, itinerary_id: int, user_id: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        entry = self._rows.get((user_id, itinerary_id))
+        if entry is None or entry[1] <= time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._rows.move_to_end((user_id, itinerary_id))
+        return dict(entry[0])
+
+    def put(self, row: dict, stamp: Optional[int] = None) -> None:
+        """
+        Cache a row. With a stamp it was read and is dropped if a write has
+        happened since; without one it is the result of a write.
+        """
+        if not self.enabled:
+            return
+        key = ("row", row["user_id"], row["id"])
+        if stamp is None:
+            self._bump(key)
+            self.bus.publish(key)
+        elif not self._current(key, stamp):
+            return
+        self._store_row(dict(row))
+        if stamp is None:
+            self._update_listed(row)
+
+    def _summary(self, row: dict) -> dict:
+        return {column: row.get(column) for column in self.list_columns}
+
+    def _update_listed(self, row: dict) -> None:
+        entry = self._lists.get(row["user_id"])
+        if entry is not None and entry[0] is not TOO_LONG:
+            summary = self._summary(row)
+            listed = [summary if listed["id"] == row["id"] else listed for listed in entry[0]]
+            self._lists[row["user_id"]] = (listed, entry[1])
+
+    def add(self, row: dict) -> None:
+        """Cache a newly created itinerary and put it first in its user's list."""
+        if not self.enabled:
+            return
+        self.put(row)
+        list_key = ("list", row["user_id"], None)
+        self._bump(list_key)
+        self.bus.publish(list_key)
+        entry = self._lists.get(row["user_id"])
+        if entry is not None and entry[0] is not TOO_LONG:
+            listed = [self._summary(row)] + entry[0]
+            if len(listed) > self.list_max:
+                del self._lists[row["user_id"]]
+            else:
+                self._lists[row["user_id"]] = (listed, entry[1])
+
+    def invalidate(self, itinerary_id: int, user_id: str) -> None:
+        """
+        Drop a row whose new contents are not known, here and on other
+        workers, with its user's list, whose updated_at for it is now stale.
+        """
+        if not self.enabled:
+            return
+        key = ("row", user_id, itinerary_id)
+        self._bump(key)
+        self.bus.publish(key)
+        self._rows.pop((user_id, itinerary_id), None)
+        self._lists.pop(user_id, None)
+
+    def invalidate_list(self, user_id: str) -> None:
+        """Drop a user's list after writes that do not fit add(), here and on other workers."""
+        if not self.enabled:
+            return
+        key = ("list", user_id, None)
+        self._bump(key)
+        self.bus.publish(key)
+        self._lists.pop(user_id, None)
+
+    def apply(self, event: Tuple[str, str, Optional[int]]) -> None:
+        """Handle an invalidation published by another worker."""
+        kind, user_id, itinerary_id = event
+        self._bump(event)
+        if kind == "row":
+            self._rows.pop((user_id, itinerary_id), None)
+        # A changed row also changes its summary in the list
+        self._lists.pop(user_id, None)
+
+    def list_rows(self, user_id: str) -> Any:
+        """
+        The user's itineraries, newest first, with the list columns only;
+        TOO_LONG if the list is not cached because it is too long, or None
+        when it is not in memory.
+        """
+        if not self.enabled:
+            return None
+        entry = self._lists.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            self.list_misses += 1
+            return None
+        self.list_hits += 1
+        self._lists.move_to_end(user_id)
+        return entry[0]
+
+    def put_list(self, user_id: str, rows: List[dict], complete: bool, stamp: int) -> None:
+        """
+        Keep a user's list as fetched newest first, with at least the list
+        columns. An incomplete list (more than list_max rows) is remembered
+        as TOO_LONG. Dropped if the list or any of its rows was written
+        since `stamp`.
+        """
+        if not self.enabled or not self._current(("list", user_id, None), stamp):
+            return
+        if not all(self._current(("row", user_id, row["id"]), stamp) for row in rows):
+            return
+        listed = [self._summary(row) for row in rows] if complete else TOO_LONG
+        self._lists[user_id] = (listed, time.monotonic() + self.ttl)
+        self._lists.move_to_end(user_id)
+        while len(self._lists) > self.max_users:
+            self._lists.popitem(last=False)
+
+    def rows(self, user_id: str, ids: List[int]) -> Tuple[Dict[int, dict], List[int]]:
+        """Cached rows among `ids`, and the ids that need fetching."""
+        now = time.monotonic()
+        found, missing = {}, []
+        for itinerary_id in ids:
+            entry = self._rows.get((user_id, itinerary_id))
+            if entry is None or entry[1] <= now:
+                missing.append(itinerary_id)
+            else:
+                found[itinerary_id] = entry[0]
+        return found, missing
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self._rows),
+            "lists": len(self._lists),
+            "hits": self.hits,
+            "misses": self.misses,
+            "list_hits": self.list_hits,
+            "list_misses": self.list_misses
+        }
+
+def create_bus() -> InvalidationBus:
+    if ITINERARY_CACHE_BUS == "manager":
+        return ManagerBus(JOB_BROKER_ADDRESS, JOB_BROKER_AUTHKEY, ITINERARY_CACHE_BUS_INTERVAL)
+    return InvalidationBus()
+
+itinerary_cache = ItineraryCache(
+    ITINERARY_CACHE_SIZE,
+    ITINERARY_CACHE_USERS,
+    ITINERARY_CACHE_TTL,
+    ITINERARY_CACHE_LIST_MAX,
+    ITINERARY_LIST_COLUMNS,
+    create_bus()
+)
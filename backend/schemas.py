@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
 from datetime import datetime
 
 class MoodInput(BaseModel):
@@ -9,10 +9,17 @@ class MoodInput(BaseModel):
 class ItineraryRequest(BaseModel):
     mood: str
     preferences: Optional[str] = None
+    cache: Literal["default", "bypass"] = "default"  # "bypass" forces a fresh generation
+
+class BatchItineraryRequest(BaseModel):
+    requests: List[ItineraryRequest] = Field(..., min_length=1, max_length=100)
 
 class RefinementRequest(BaseModel):
     itinerary_id: int
     refinement_request: str
+    # Refine only this day, or one slot within it (both 1-based)
+    day: Optional[int] = Field(None, ge=1)
+    slot: Optional[int] = Field(None, ge=1)
 
 class ItineraryBase(BaseModel):
     mood: str
@@ -24,13 +31,47 @@ class ItineraryCreate(ItineraryBase):
 class ItineraryResponse(ItineraryBase):
     id: int
     content: str
+    structured: Optional[Dict[str, Any]] = None  # Days -> slots, when generated as structured output
+    user_id: str
+    is_favorite: bool
+    created_at: datetime
+    updated_at: datetime
+
+class ItinerarySummary(ItineraryBase):
+    id: int
     user_id: str
     is_favorite: bool
     created_at: datetime
     updated_at: datetime
+    content: Optional[str] = None  # Only present when requested via ?fields=
+    original_content: Optional[str] = None
+    structured: Optional[Dict[str, Any]] = None
 
 class ItineraryList(BaseModel):
-    itineraries: List[ItineraryResponse]
+    itineraries: List[ItinerarySummary]
+    next_cursor: Optional[str] = None
+
+class ItinerarySearchResult(ItinerarySummary):
+    rank: float  # Higher is a better match; only comparable within one search
+    snippet: str  # Content around the matches, matched words in **bold**
+
+class ItinerarySearchResults(BaseModel):
+    results: List[ItinerarySearchResult]
+    next_cursor: Optional[str] = None
+
+class ImportResult(BaseModel):
+    imported: int
+    failed: int  # Invalid lines plus itineraries in chunks that could not be saved
+    errors: List[str]  # The first few problems, by line number
+
+class BatchItemResult(BaseModel):
+    index: int  # Position in the request list
+    success: bool
+    itinerary: Optional[ItineraryResponse] = None
+    error: Optional[str] = None
+
+class BatchItineraryResponse(BaseModel):
+    results: List[BatchItemResult]
 
 class FavoriteUpdate(BaseModel):
     is_favorite: bool
@@ -41,12 +82,31 @@ class RefinedItineraryResponse(BaseModel):
 class HealthResponse(BaseModel):
     status: str
 
+class ReadinessResponse(BaseModel):
+    status: str
+    clients: Dict[str, bool]  # Whether each upstream client has been built
+
 class RefinementHistoryItem(BaseModel):
     id: int
     itinerary_id: int
+    version: Optional[int] = None
     content: str
     refinement_request: str
     created_at: datetime
 
 class RefinementHistoryResponse(BaseModel):
     history: List[RefinementHistoryItem]
+
+class ItineraryVersionResponse(BaseModel):
+    itinerary_id: int
+    version: int  # 0 is the original itinerary
+    content: str
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued, running, succeeded or failed
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
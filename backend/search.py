@@ -0,0 +1,267 @@
+import heapq
+import math
+import os
+import re
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from semantic import tokenize
+
+# Load environment variables
+load_dotenv()
+
+# "postgres" uses the search_itineraries function (migrations/add_itinerary_search.sql);
+# "memory" keeps an inverted index per user in each worker, for the local fakes and tests
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "postgres")
+# Users whose index is kept in memory, and seconds before it is rebuilt from the database
+SEARCH_INDEX_USERS = int(os.getenv("SEARCH_INDEX_USERS", "1000"))
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+# Words of content shown around the matches in each result's snippet
+SEARCH_SNIPPET_WORDS = int(os.getenv("SEARCH_SNIPPET_WORDS", "30"))
+
+# Field weights, as setweight() A, B and C with ts_rank's default weights in the migration
+MOOD_WEIGHT = 1.0
+CONTENT_WEIGHT = 0.4
+REFINEMENT_WEIGHT = 0.2
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Matched words are wrapped in this, like StartSel/StopSel in the migration's ts_headline
+HIGHLIGHT = "**"
+
+WORD = re.compile(r"[\w']+")
+
+def document_terms(mood: str, preferences: Optional[str], content: Optional[str], requests: Iterable[str]) -> Counter:
+    """Weighted term frequencies of an itinerary and the refinement requests made of it."""
+    terms = Counter()
+    for text, weight in [(mood, MOOD_WEIGHT), (preferences, MOOD_WEIGHT), (content, CONTENT_WEIGHT)] + \
+            [(request, REFINEMENT_WEIGHT) for request in requests]:
+        for term in tokenize(text or ""):
+            terms[term] += weight
+    return terms
+
+class UserIndex:
+    """
+    Inverted index of one user's itineraries: term -> {itinerary id: weighted
+    term frequency}. Queries match itineraries containing every term and rank
+    them with BM25.
+
+    For each queried term the per-itinerary BM25 impacts are sorted once and
+    kept until an itinerary containing the term changes. A query walks these
+    lists from the top and stops as soon as no itinerary further down can
+    beat the best `limit` found (Fagin's threshold algorithm), so its cost
+    follows the page size rather than the number of matches.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.documents: Dict[int, Counter] = {}
+        self.lengths: Dict[int, float] = {}
+        # (mood, preferences, refinement requests), to rebuild a document when its content changes
+        self.fields: Dict[int, Tuple[str, Optional[str], List[str]]] = {}
+        self.total_length = 0.0
+        # term -> (impacts sorted best first, impact by itinerary id)
+        self._impacts: Dict[str, Tuple[List[Tuple[float, int]], Dict[int, float]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def put(self, itinerary_id: int, mood: str, preferences: Optional[str], content: Optional[str],
+            requests: List[str]) -> None:
+        self.remove(itinerary_id)
+        terms = document_terms(mood, preferences, content, requests)
+        self.fields[itinerary_id] = (mood, preferences, list(requests))
+        self.documents[itinerary_id] = terms
+        self.lengths[itinerary_id] = sum(terms.values())
+        self.total_length += self.lengths[itinerary_id]
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[itinerary_id] = frequency
+            self._impacts.pop(term, None)
+
+    def remove(self, itinerary_id: int) -> None:
+        terms = self.documents.pop(itinerary_id, None)
+        if terms is None:
+            return
+        self.fields.pop(itinerary_id, None)
+        self.total_length -= self.lengths.pop(itinerary_id)
+        for term in terms:
+            posting = self.postings[term]
+            del posting[itinerary_id]
+            if not posting:
+                del self.postings[term]
+            self._impacts.pop(term, None)
+
+    def refine(self, itinerary_id: int, content: str, request: Optional[str]) -> None:
+        """Reindex an itinerary with new content and, for a refinement, its request."""
+        if itinerary_id not in self.fields:
+            return
+        mood, preferences, requests = self.fields[itinerary_id]
+        self.put(itinerary_id, mood, preferences, content, requests + ([request] if request else []))
+
+    def impacts(self, term: str) -> Tuple[List[Tuple[float, int]], Dict[int, float]]:
+        cached = self._impacts.get(term)
+        if cached is None:
+            average_length = self.total_length / len(self.documents)
+            scores = {
+                itinerary_id: frequency * (BM25_K1 + 1) / (
+                    frequency + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[itinerary_id] / average_length)
+                )
+                for itinerary_id, frequency in self.postings[term].items()
+            }
+            ranked = sorted(((score, itinerary_id) for itinerary_id, score in scores.items()), reverse=True)
+            cached = self._impacts[term] = (ranked, scores)
+        return cached
+
+    def search(self, terms: List[str], limit: int, after: Optional[Tuple[float, int]] = None) -> List[Tuple[float, int]]:
+        """
+        The best `limit` (score, itinerary id) pairs, best first, optionally
+        only those ranked after the (score, id) of a previous page.
+        """
+        terms = list(dict.fromkeys(terms))
+        if not terms or any(term not in self.postings for term in terms):
+            return []
+        count = len(self.documents)
+        lists = []
+        for term in terms:
+            matches = len(self.postings[term])
+            idf = math.log(1 + (count - matches + 0.5) / (matches + 0.5))
+            lists.append((idf, *self.impacts(term)))
+
+        best: List[Tuple[float, int]] = []
+        seen = set()
+        for depth in range(min(len(ranked) for _, ranked, _ in lists)):
+            # No itinerary below this depth in every list can score above the threshold
+            threshold = 0.0
+            for idf, ranked, _ in lists:
+                impact, itinerary_id = ranked[depth]
+                threshold += idf * impact
+                if itinerary_id in seen:
+                    continue
+                seen.add(itinerary_id)
+                if not all(itinerary_id in scores for _, _, scores in lists):
+                    continue
+                # Rounded so the score sent back in a cursor compares equal
+                score = round(sum(idf * scores[itinerary_id] for idf, _, scores in lists), 6)
+                if after is not None and (score, itinerary_id) >= after:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, (score, itinerary_id))
+                elif (score, itinerary_id) > best[0]:
+                    heapq.heapreplace(best, (score, itinerary_id))
+            if len(best) == limit and round(threshold, 6) < best[0][0]:
+                break
+        return sorted(best, reverse=True)
+
+class SearchIndex:
+    """
+    Per-process search index for SEARCH_BACKEND=memory: a UserIndex per
+    user, built from the database on the user's first search and kept up to
+    date by the write paths in model.py. Up to `max_users` users are kept
+    for `ttl` seconds, which bounds how stale results can be after writes
+    made by other workers.
+    """
+
+    def __init__(self, max_users: int, ttl: float):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._users: "OrderedDict[str, Tuple[UserIndex, float]]" = OrderedDict()
+        self._generation = 0
+        # Last stamp at which each user's itineraries were written; the oldest
+        # are forgotten and `_floor` remembers the newest of those
+        self._written: "OrderedDict[str, int]" = OrderedDict()
+        self._floor = 0
+        self.builds = 0
+
+    def stamp(self) -> int:
+        """Take before reading a user's itineraries; pass to put()."""
+        return self._generation
+
+    def _bump(self, user_id: str) -> None:
+        self._generation += 1
+        self._written[user_id] = self._generation
+        self._written.move_to_end(user_id)
+        while len(self._written) > self.max_users * 4:
+            _, generation = self._written.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def get(self, user_id: str) -> Optional[UserIndex]:
+        entry = self._users.get(user_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        self._users.move_to_end(user_id)
+        return entry[0]
+
+    def put(self, user_id: str, index: UserIndex, stamp: int) -> None:
+        """Keep a freshly built index, unless the user wrote since `stamp`."""
+        self.builds += 1
+        if stamp < self._floor or self._written.get(user_id, 0) > stamp:
+            return
+        self._users[user_id] = (index, time.monotonic() + self.ttl)
+        self._users.move_to_end(user_id)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def add(self, row: dict) -> None:
+        self._bump(row["user_id"])
+        index = self.get(row["user_id"])
+        if index is not None:
+            index.put(row["id"], row["mood"], row.get("preferences"), row.get("content"), [])
+
+    def refine(self, itinerary_id: int, user_id: str, content: str, request: Optional[str] = None) -> None:
+        self._bump(user_id)
+        index = self.get(user_id)
+        if index is not None:
+            index.refine(itinerary_id, content, request)
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user's index so the next search rebuilds it."""
+        self._bump(user_id)
+        self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._users),
+            "itineraries": sum(len(index) for index, _ in self._users.values()),
+            "builds": self.builds
+        }
+
+def snippet(content: Optional[str], terms: List[str], words: int = SEARCH_SNIPPET_WORDS) -> str:
+    """
+    The stretch of `words` words of content holding the most matches, with
+    matched words highlighted and whitespace collapsed, like ts_headline in
+    the Postgres backend.
+    """
+    spans = [match.span() for match in WORD.finditer(content or "")]
+    if not spans:
+        return ""
+    wanted = set(terms)
+    found = {}
+    matched = []
+    for start, end in spans:
+        word = content[start:end].lower()
+        if word not in found:
+            found[word] = bool(wanted.intersection(tokenize(word)))
+        matched.append(found[word])
+
+    best, best_count, count = 0, -1, 0
+    for position in range(len(spans)):
+        count += matched[position]
+        if position >= words:
+            count -= matched[position - words]
+        if count > best_count:
+            best, best_count = max(0, position - words + 1), count
+
+    parts = []
+    cursor = spans[best][0]
+    for position in range(best, min(best + words, len(spans))):
+        start, end = spans[position]
+        parts.append(content[cursor:start])
+        word = content[start:end]
+        parts.append(f"{HIGHLIGHT}{word}{HIGHLIGHT}" if matched[position] else word)
+        cursor = end
+    return " ".join("".join(parts).split())
+
+search_index = SearchIndex(SEARCH_INDEX_USERS, SEARCH_INDEX_TTL)
@@ -0,0 +1,355 @@
+import asyncio
+import hashlib
+import importlib
+import json
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from cache import normalize_preferences, normalize_text
+from logger import setup_logger
+
+try:
+    import numpy as np
+except ImportError:  # Optional, only needed when SEMANTIC_CACHE_ENABLED is set
+    np = None
+
+# Setup logger
+logger = setup_logger("semantic")
+
+# Load environment variables
+load_dotenv()
+
+# Serve generations for (mood, preferences) pairs that are close to, not only
+# identical to, earlier ones (requires the numpy package)
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Cosine similarity a cached entry needs to count as the same request
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+# Matches needed before serving one of them at random, like GENERATION_CACHE_VARIANTS
+SEMANTIC_CACHE_TOP_K = int(os.getenv("SEMANTIC_CACHE_TOP_K", os.getenv("GENERATION_CACHE_VARIANTS", "3")))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "10000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "512"))
+# "hashing", or "package.module:factory" for a factory taking the dimension
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing")
+# Path prefix for <path>.vectors (memory-mapped matrix) and <path>.sqlite; unset keeps it in memory
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH")
+# New entries are written to <path>.sqlite in a worker thread once this many
+# are pending or the oldest has waited this many seconds
+SEMANTIC_CACHE_WRITE_BATCH = int(os.getenv("SEMANTIC_CACHE_WRITE_BATCH", "32"))
+SEMANTIC_CACHE_WRITE_INTERVAL = float(os.getenv("SEMANTIC_CACHE_WRITE_INTERVAL", "2"))
+
+# Words that carry no intent ("chill and relaxed" vs "relaxed, want to chill")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "but", "for", "from", "i", "i'm", "im", "in", "into", "is", "it",
+    "just", "like", "me", "my", "of", "on", "or", "really", "so", "some", "that", "the", "to", "very", "want",
+    "wanna", "we", "with", "would", "feel", "feeling", "bit", "more", "lot", "lots"
+}
+SUFFIXES = ("ing", "ed", "es", "s", "ly")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased words without stopwords, with common suffixes stripped so
+    "relaxing" and "relaxed" are the same feature.
+    """
+    tokens = []
+    for word in "".join(c if c.isalnum() or c == "'" else " " for c in normalize_text(text)).split():
+        if word in STOPWORDS:
+            continue
+        for suffix in SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)]
+                break
+        tokens.append(word)
+    return tokens
+
+def params_namespace(params: dict) -> int:
+    """Entries only match requests made with the same model parameters."""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+class Embedder:
+    """Turns a (mood, preferences) pair into a unit-length float32 vector of size `dim`."""
+
+    dim: int
+
+    def embed(self, mood: str, preferences: Optional[str]):
+        raise NotImplementedError
+
+    def embed_batch(self, requests: Sequence[Tuple[str, Optional[str]]]):
+        return np.stack([self.embed(mood, preferences) for mood, preferences in requests])
+
+class HashingEmbedder(Embedder):
+    """
+    Offline embedder: signed feature hashing of word counts with sublinear
+    (1 + log) term frequency. Mood and preferences each get half of the
+    dimensions, so the similarity of two requests averages the two, and a
+    request without preferences never matches one with them. Vectors are
+    sparse, which SemanticIndex uses to read only the matching rows.
+    """
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.half = dim // 2
+
+    def feature(self, token: str) -> Tuple[int, float]:
+        value = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+        return value % self.half, 1.0 if value >> 63 else -1.0
+
+    def embed_part(self, vector, offset: int, text: str) -> None:
+        counts = {}
+        for token in tokenize(text):
+            counts[token] = counts.get(token, 0) + 1
+        part = vector[offset:offset + self.half]
+        for token, count in counts.items():
+            index, sign = self.feature(token)
+            part[index] += sign * (1.0 + math.log(count))
+        norm = np.linalg.norm(part)
+        if norm > 0:
+            part /= norm
+
+    def embed(self, mood: str, preferences: Optional[str]):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        self.embed_part(vector, 0, mood)
+        self.embed_part(vector, self.half, normalize_preferences(preferences).replace(",", " "))
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+def load_embedder(name: str, dim: int) -> Embedder:
+    if name == "hashing":
+        return HashingEmbedder(dim)
+    module_name, _, factory = name.partition(":")
+    if not factory:
+        raise ValueError(f"SEMANTIC_CACHE_EMBEDDER must be 'hashing' or 'module:factory', got {name!r}")
+    return getattr(importlib.import_module(module_name), factory)(dim)
+
+class SemanticIndex:
+    """
+    Fixed-capacity vector index with exact cosine top-k search.
+
+    Vectors are unit length and kept in one contiguous float32 matrix
+    stored feature-major (dim x capacity), so a dot product against every
+    entry is a single matrix-vector product. A sparse query only reads the
+    rows of its non-zero features, which keeps lookups under a millisecond
+    at 100k entries. When full, the least recently used entry is replaced.
+
+    With a path the matrix is a memory-mapped file and values live in a
+    SQLite table next to it, so a restarted process starts warm. add() only
+    queues the SQLite row; flush() writes the queue in one transaction and
+    may run in a worker thread. close() writes whatever is left.
+    """
+
+    def __init__(self, dim: int, capacity: int, path: Optional[str] = None):
+        if np is None:
+            raise ValueError("The numpy package is required when SEMANTIC_CACHE_ENABLED is set")
+        self.dim = dim
+        self.capacity = capacity
+        self.path = path
+        self.namespaces = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.valid = np.zeros(capacity, dtype=bool)
+        self.values: List[Optional[str]] = [None] * capacity
+        # Slots below `size` have been written at least once
+        self.size = 0
+        self.evictions = 0
+        self._db = None
+        # slot -> entries row not yet written, and when the oldest was queued
+        self._pending: Dict[int, tuple] = {}
+        self._pending_since = 0.0
+        self._pending_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        if path is None:
+            self.vectors = np.zeros((dim, capacity), dtype=np.float32)
+        else:
+            self.open(path)
+
+    def open(self, path: str) -> None:
+        self._db = sqlite3.connect(f"{path}.sqlite", check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries "
+            "(slot INTEGER PRIMARY KEY, namespace INTEGER, value TEXT, last_used REAL)"
+        )
+        shape = dict(self._db.execute("SELECT key, value FROM meta").fetchall())
+        vectors_path = f"{path}.vectors"
+        if shape != {"dim": self.dim, "capacity": self.capacity} or not os.path.exists(vectors_path):
+            if shape:
+                logger.warning(f"Semantic cache at {path} has a different shape {shape}, starting empty")
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("DELETE FROM meta")
+            self._db.executemany("INSERT INTO meta VALUES (?, ?)", [("dim", self.dim), ("capacity", self.capacity)])
+            self._db.commit()
+            self.vectors = np.lib.format.open_memmap(
+                vectors_path, mode="w+", dtype=np.float32, shape=(self.dim, self.capacity)
+            )
+            return
+
+        self.vectors = np.lib.format.open_memmap(vectors_path, mode="r+")
+        for slot, namespace, value, last_used in self._db.execute("SELECT * FROM entries"):
+            self.namespaces[slot] = namespace
+            self.values[slot] = value
+            self.last_used[slot] = last_used
+            self.valid[slot] = True
+            self.size = max(self.size, slot + 1)
+        logger.info(f"Loaded {int(self.valid.sum())} semantic cache entries from {path}")
+
+    def __len__(self) -> int:
+        return int(self.valid[:self.size].sum())
+
+    def scores(self, queries):
+        """
+        Cosine similarity of each query row against every written slot,
+        reading only the feature rows some query uses when that is cheaper.
+        """
+        features = np.flatnonzero(np.any(queries != 0, axis=0))
+        if len(features) < self.dim // 2:
+            return queries[:, features] @ self.vectors[features, :self.size]
+        return queries @ self.vectors[:, :self.size]
+
+    def search_batch(self, queries, namespaces: Sequence[int], k: int, threshold: float) -> List[List[Tuple[int, float]]]:
+        """
+        Top-k (slot, similarity) pairs at or above `threshold` for each query,
+        best first, among entries in the query's namespace.
+        """
+        if not self.size:
+            return [[] for _ in namespaces]
+        scores = self.scores(queries)
+        now = time.time()
+        results = []
+        for row, namespace in zip(scores, namespaces):
+            candidates = np.flatnonzero(row >= threshold)
+            candidates = candidates[self.valid[candidates] & (self.namespaces[candidates] == namespace)]
+            top = candidates[np.argsort(-row[candidates], kind="stable")[:k]]
+            self.last_used[top] = now
+            results.append([(int(slot), float(row[slot])) for slot in top])
+        return results
+
+    def search(self, query, namespace: int, k: int, threshold: float) -> List[Tuple[int, float]]:
+        return self.search_batch(query[np.newaxis, :], [namespace], k, threshold)[0]
+
+    def add(self, vector, namespace: int, value: str) -> int:
+        if self.size < self.capacity:
+            slot = self.size
+            self.size += 1
+        else:
+            slot = int(np.argmin(np.where(self.valid, self.last_used, -np.inf)))
+            if self.valid[slot]:
+                self.evictions += 1
+        now = time.time()
+        self.vectors[:, slot] = vector
+        self.namespaces[slot] = namespace
+        self.last_used[slot] = now
+        self.values[slot] = value
+        self.valid[slot] = True
+        if self._db is not None:
+            with self._pending_lock:
+                if not self._pending:
+                    self._pending_since = now
+                self._pending[slot] = (slot, namespace, value, now)
+        return slot
+
+    def writes_due(self, batch: int, interval: float) -> bool:
+        pending = len(self._pending)
+        return pending >= batch or (pending > 0 and time.time() - self._pending_since >= interval)
+
+    def _write_pending(self) -> None:
+        with self._pending_lock:
+            rows, self._pending = list(self._pending.values()), {}
+        if rows:
+            self._db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", rows)
+            self._db.commit()
+
+    def flush(self) -> None:
+        """Write the queued entries in one transaction."""
+        with self._db_lock:
+            if self._db is not None:
+                self._write_pending()
+
+    def close(self) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._write_pending()
+            self._db.executemany(
+                "UPDATE entries SET last_used = ? WHERE slot = ?",
+                [(float(self.last_used[slot]), int(slot)) for slot in np.flatnonzero(self.valid)]
+            )
+            self._db.commit()
+            self._db.close()
+            self._db = None
+        self.vectors.flush()
+
+class SemanticCache:
+    """
+    Near-duplicate cache of generated itineraries in front of the model.
+    Like GenerationCache, a request is only served once `top_k` similar
+    generations exist, and then gets one of them at random.
+    """
+
+    def __init__(self, embedder: Embedder, index: SemanticIndex, threshold: float, top_k: int):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.top_k = max(1, top_k)
+        self.hits = 0
+        self.misses = 0
+        self._flushing: Optional[asyncio.Task] = None
+
+    def pick(self, matches: List[Tuple[int, float]]) -> Optional[str]:
+        if len(matches) < self.top_k:
+            self.misses += 1
+            return None
+        self.hits += 1
+        slot, similarity = random.choice(matches)
+        logger.info(f"Serving itinerary from semantic cache (similarity {similarity:.3f})")
+        return self.index.values[slot]
+
+    def lookup(self, mood: str, preferences: Optional[str], params: dict) -> Optional[str]:
+        query = self.embedder.embed(mood, preferences)
+        return self.pick(self.index.search(query, params_namespace(params), self.top_k, self.threshold))
+
+    def lookup_batch(self, requests: Sequence[Tuple[str, Optional[str]]], params: dict) -> List[Optional[str]]:
+        """Look up many requests with one matrix product."""
+        if not requests:
+            return []
+        queries = self.embedder.embed_batch(requests)
+        namespace = params_namespace(params)
+        matches = self.index.search_batch(queries, [namespace] * len(requests), self.top_k, self.threshold)
+        return [self.pick(request_matches) for request_matches in matches]
+
+    def store(self, mood: str, preferences: Optional[str], params: dict, value: str) -> None:
+        self.index.add(self.embedder.embed(mood, preferences), params_namespace(params), value)
+        if not self.index.writes_due(SEMANTIC_CACHE_WRITE_BATCH, SEMANTIC_CACHE_WRITE_INTERVAL):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.index.flush()
+            return
+        # One write at a time; entries queued meanwhile go with the next
+        if self._flushing is None or self._flushing.done():
+            self._flushing = loop.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Write queued entries to disk without blocking the event loop."""
+        try:
+            await asyncio.to_thread(self.index.flush)
+        except Exception as e:
+            logger.error(f"Failed to write semantic cache entries: {str(e)}")
+
+    def close(self) -> None:
+        self.index.close()
+
+def build_semantic_cache() -> Optional[SemanticCache]:
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    embedder = load_embedder(SEMANTIC_CACHE_EMBEDDER, SEMANTIC_CACHE_DIM)
+    index = SemanticIndex(embedder.dim, SEMANTIC_CACHE_CAPACITY, SEMANTIC_CACHE_PATH)
+    return SemanticCache(embedder, index, SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_TOP_K)
+
+semantic_cache = build_semantic_cache()
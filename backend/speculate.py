@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from admission import AdmissionController, llm_admission
+from cache import normalize_text
+from llm import set_deadline
+from logger import setup_logger
+from ratelimit import TokenBucket
+
+# Setup logger
+logger = setup_logger("speculate")
+
+# Load environment variables
+load_dotenv()
+
+# Precompute likely refinements of new itineraries while the model routes are idle
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "false").lower() == "true"
+# Refinements tried for each new itinerary, most requested first
+SPECULATION_TOP_K = int(os.getenv("SPECULATION_TOP_K", "3"))
+# Starting candidates, "|"-separated; real /refine requests take over as they are counted
+SPECULATION_REFINEMENTS = os.getenv(
+    "SPECULATION_REFINEMENTS", "Make it cheaper|Add more food experiences|Less walking"
+)
+# Estimated tokens speculation may spend per minute; calls that do not fit are skipped
+SPECULATION_TOKENS_PER_MINUTE = int(os.getenv("SPECULATION_TOKENS_PER_MINUTE", "20000"))
+SPECULATION_CONCURRENCY = int(os.getenv("SPECULATION_CONCURRENCY", "2"))
+SPECULATION_CACHE_SIZE = int(os.getenv("SPECULATION_CACHE_SIZE", "256"))
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "900"))
+# Share of admission slots in use above which speculation stops and in-flight work is cancelled
+SPECULATION_MAX_LOAD = float(os.getenv("SPECULATION_MAX_LOAD", "0.25"))
+# Seconds between load checks
+SPECULATION_INTERVAL = float(os.getenv("SPECULATION_INTERVAL", "0.2"))
+
+# (text, structured, tokens) for a finished refinement
+Refinement = Tuple[str, Optional[dict], int]
+# Computes a refinement of an itinerary row: (itinerary, request) -> Refinement
+RefineFn = Callable[[dict, str], Awaitable[Refinement]]
+# Estimates the tokens a refinement will use: (itinerary, request) -> tokens
+EstimateFn = Callable[[dict, str], int]
+
+# Most distinct requests kept in the popularity count
+MAX_TRACKED_REQUESTS = 1000
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256((content or "").encode("utf-8")).hexdigest()
+
+def speculation_key(itinerary: dict, refinement_request: str) -> Tuple[int, str, str]:
+    return itinerary["id"], content_hash(itinerary.get("content")), normalize_text(refinement_request)
+
+class Speculator:
+    """
+    Background pre-generation of the refinements users are likely to ask
+    for next. New itineraries are queued with schedule(); while the admission
+    controller is mostly idle, the top-K most requested refinements of each
+    are computed under a token budget and kept in a bounded LRU keyed by
+    (itinerary id, content hash, normalized request). The newest itineraries
+    go first, since their users are the ones about to refine. take() hands a
+    result to a matching /refine, waiting for it if it is still being
+    computed. As soon as load rises, running speculation is cancelled and
+    nothing new starts.
+
+    Tokens spent on results that are never served (evicted, expired or
+    invalidated) are counted as wasted; cancelled calls are counted apart,
+    as their usage is never reported.
+    """
+
+    def __init__(self, admission: AdmissionController, top_k: int, candidates: List[str],
+                 tokens_per_minute: int, concurrency: int, cache_size: int, ttl: float,
+                 max_load: float, interval: float):
+        self.admission = admission
+        self.top_k = top_k
+        self.budget = TokenBucket(tokens_per_minute)
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.max_load = max_load
+        self.interval = interval
+        self._refine: Optional[RefineFn] = None
+        self._estimate: Optional[EstimateFn] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._pending: Deque[dict] = deque(maxlen=cache_size)
+        self._tasks: Dict[Tuple[int, str, str], asyncio.Task] = {}
+        self._entries: "OrderedDict[Tuple[int, str, str], Tuple[Refinement, float]]" = OrderedDict()
+        # Seed candidates start with one request each, so observed requests soon outrank them
+        self._popularity: Counter = Counter({normalize_text(request): 1 for request in candidates if request.strip()})
+        self.hits = 0
+        self.joined = 0
+        self.misses = 0
+        self.speculated = 0
+        self.cancelled = 0
+        self.skipped = 0
+        self.tokens_used = 0
+        self.tokens_wasted = 0
+
+    @property
+    def running(self) -> bool:
+        return self._runner is not None
+
+    def idle(self) -> bool:
+        return not self.admission.queued and self.admission.in_flight <= self.max_load * self.admission.max_concurrency
+
+    def start(self, refine: RefineFn, estimate: EstimateFn) -> None:
+        self._refine = refine
+        self._estimate = estimate
+        self._runner = asyncio.create_task(self.run())
+        logger.info(f"Speculating top {self.top_k} refinements of new itineraries")
+
+    async def stop(self) -> None:
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        self.cancel_all()
+        await asyncio.gather(self._runner, *self._tasks.values(), return_exceptions=True)
+        self._runner = None
+
+    def record_request(self, refinement_request: str) -> None:
+        """Count a user refinement request towards the top-K candidates."""
+        if not self.running:
+            return
+        self._popularity[normalize_text(refinement_request)] += 1
+        if len(self._popularity) > MAX_TRACKED_REQUESTS:
+            self._popularity = Counter(dict(self._popularity.most_common(MAX_TRACKED_REQUESTS // 2)))
+
+    def candidates(self) -> List[str]:
+        return [request for request, _ in self._popularity.most_common(self.top_k)]
+
+    def schedule(self, itinerary: dict) -> None:
+        """Queue a new itinerary for speculation; a no-op unless started."""
+        if self.running and itinerary.get("content"):
+            self._pending.append(itinerary)
+
+    async def take(self, itinerary: dict, refinement_request: str) -> Optional[Refinement]:
+        """
+        Remove and return the speculated refinement for this exact itinerary
+        content and request, if there is one.
+        """
+        if not self.running:
+            return None
+        # A refinement is on its way, so the itinerary's content is about to change
+        self.unschedule(itinerary["id"])
+        key = speculation_key(itinerary, refinement_request)
+        task = self._tasks.get(key)
+        if task is not None:
+            # Already being computed: wait for it instead of starting a second call.
+            # wait() neither raises if the speculation is cancelled nor cancels it if we are.
+            self.joined += 1
+            await asyncio.wait({task})
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[1] <= time.monotonic():
+            if entry is not None:
+                self.tokens_wasted += entry[0][2]
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.info(f"Serving speculated refinement of itinerary {itinerary['id']}")
+        return entry[0]
+
+    def invalidate(self, itinerary_id: int) -> None:
+        """Drop speculation for an itinerary whose content has changed."""
+        for key in [key for key in self._entries if key[0] == itinerary_id]:
+            self.tokens_wasted += self._entries.pop(key)[0][2]
+        for key, task in self._tasks.items():
+            if key[0] == itinerary_id:
+                task.cancel()
+        self.unschedule(itinerary_id)
+
+    def unschedule(self, itinerary_id: int) -> None:
+        if any(itinerary["id"] == itinerary_id for itinerary in self._pending):
+            self._pending = deque(
+                (itinerary for itinerary in self._pending if itinerary["id"] != itinerary_id), maxlen=self.cache_size
+            )
+
+    def store(self, key: Tuple[int, str, str], refinement: Refinement) -> None:
+        self._entries[key] = (refinement, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.cache_size:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.tokens_wasted += evicted[2]
+
+    def expire(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at <= now]:
+            self.tokens_wasted += self._entries.pop(key)[0][2]
+
+    def cancel_all(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.expire()
+                if not self.idle():
+                    if self._tasks:
+                        logger.info(f"Load rising, cancelling {len(self._tasks)} speculative refinements")
+                        self.cancel_all()
+                    continue
+                self.launch()
+            except Exception as e:
+                logger.error(f"Speculation loop failed: {str(e)}")
+
+    def launch(self) -> None:
+        while self._pending and len(self._tasks) < self.concurrency:
+            itinerary = self._pending[-1]
+            requests = [
+                request for request in self.candidates()
+                if speculation_key(itinerary, request) not in self._entries
+                and speculation_key(itinerary, request) not in self._tasks
+            ]
+            if not requests:
+                self._pending.pop()
+                continue
+            tokens = self._estimate(itinerary, requests[0])
+            if self.budget.wait_time(tokens) > 0:
+                # Out of budget: leave the queue for the next refill
+                self.skipped += 1
+                return
+            self.budget.reserve(tokens)
+            key = speculation_key(itinerary, requests[0])
+            task = asyncio.create_task(self.speculate(itinerary, requests[0], tokens))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _, key=key: self._tasks.pop(key, None))
+
+    async def speculate(self, itinerary: dict, refinement_request: str, estimate: int) -> None:
+        set_deadline()
+        key = speculation_key(itinerary, refinement_request)
+        try:
+            refinement = await self._refine(itinerary, refinement_request)
+        except asyncio.CancelledError:
+            # The reservation stays spent: part of the call may already be billed
+            self.cancelled += 1
+            raise
+        except Exception as e:
+            logger.error(f"Speculative refinement of itinerary {itinerary['id']} failed: {str(e)}")
+            return
+        # The estimate assumes the longest output; give back what was not used
+        self.budget.refund(max(0, estimate - refinement[2]))
+        self.speculated += 1
+        self.tokens_used += refinement[2]
+        self.store(key, refinement)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.running,
+            "hits": self.hits,
+            "joined": self.joined,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "speculated": self.speculated,
+            "cancelled": self.cancelled,
+            "skipped_for_budget": self.skipped,
+            "cached": len(self._entries),
+            "pending": len(self._pending),
+            "tokens_used": self.tokens_used,
+            "tokens_wasted": self.tokens_wasted
+        }
+
+speculator = Speculator(
+    llm_admission,
+    SPECULATION_TOP_K,
+    SPECULATION_REFINEMENTS.split("|"),
+    SPECULATION_TOKENS_PER_MINUTE,
+    SPECULATION_CONCURRENCY,
+    SPECULATION_CACHE_SIZE,
+    SPECULATION_TTL,
+    SPECULATION_MAX_LOAD,
+    SPECULATION_INTERVAL
+)
@@ -0,0 +1,135 @@
+import asyncio
+import os
+from typing import Dict, List
+import httpx
+from dotenv import load_dotenv
+from logger import setup_logger
+from metrics import span, upstream_in_flight, upstream_requests
+
+# Setup logger
+logger = setup_logger("transport")
+
+# Load environment variables
+load_dotenv()
+
+# Default pool settings, overridable per upstream as HTTP_<UPSTREAM>_<SETTING>,
+# e.g. HTTP_OPENAI_MAX_CONNECTIONS=200 or HTTP_POSTGREST_HTTP2=false
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP2 = os.getenv("HTTP_HTTP2", "true").lower() == "true"
+# Connections opened to each upstream at startup
+HTTP_WARM_CONNECTIONS = int(os.getenv("HTTP_WARM_CONNECTIONS", "2"))
+
+UPSTREAMS = ["openai", "postgrest", "gotrue", "default"]
+
+def upstream_name(url: httpx.URL) -> str:
+    """
+    Name the service a request goes to, for metrics and Server-Timing.
+    """
+    if url.path.startswith("/rest/"):
+        return "postgrest"
+    if url.path.startswith("/auth/"):
+        return "gotrue"
+    if url.path.endswith("/responses") or "openai" in url.host:
+        return "openai"
+    return url.host
+
+def upstream_setting(upstream: str, name: str, default):
+    value = os.getenv(f"HTTP_{upstream.upper()}_{name}")
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() == "true"
+    return type(default)(value)
+
+def create_upstream_transport(upstream: str) -> httpx.AsyncHTTPTransport:
+    return httpx.AsyncHTTPTransport(
+        limits=httpx.Limits(
+            max_connections=upstream_setting(upstream, "MAX_CONNECTIONS", MAX_CONNECTIONS),
+            max_keepalive_connections=upstream_setting(upstream, "MAX_KEEPALIVE_CONNECTIONS", MAX_KEEPALIVE_CONNECTIONS),
+            keepalive_expiry=upstream_setting(upstream, "KEEPALIVE_EXPIRY", KEEPALIVE_EXPIRY)
+        ),
+        http2=upstream_setting(upstream, "HTTP2", HTTP2)
+    )
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    One connection pool per upstream (OpenAI, PostgREST, GoTrue, anything
+    else), shared by every httpx client so connections are reused across
+    clients. Closing an individual client leaves the pools open; call
+    close() on shutdown.
+    Every request is timed up to its response headers, which for non-streamed
+    calls is when the upstream has finished its work.
+    """
+
+    def __init__(self, transports: Dict[str, httpx.AsyncBaseTransport]):
+        self._transports = transports
+
+    def transport_for(self, upstream: str) -> httpx.AsyncBaseTransport:
+        return self._transports.get(upstream) or self._transports["default"]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = upstream_name(request.url)
+        status = "error"
+        upstream_in_flight.inc(1, (upstream,))
+        try:
+            with span(upstream):
+                response = await self.transport_for(upstream).handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            upstream_in_flight.dec(1, (upstream,))
+            upstream_requests.inc(1, (upstream, status))
+
+    async def aclose(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        for upstream_transport in self._transports.values():
+            await upstream_transport.aclose()
+
+    async def warm(self, urls: List[str], connections: int = HTTP_WARM_CONNECTIONS) -> None:
+        """
+        Open connections ahead of the first real request by sending HEAD
+        requests to each URL. The status does not matter, only that the
+        TCP/TLS (and HTTP/2) handshake is done and the connection is kept alive.
+        """
+        async with pooled_client(timeout=10) as http:
+            async def touch(url: str) -> None:
+                try:
+                    await http.head(url)
+                except httpx.HTTPError as e:
+                    logger.error(f"Failed to warm connection to {url}: {str(e)}")
+
+            await asyncio.gather(*(touch(url) for url in urls for _ in range(connections)))
+        logger.info(f"Warmed connections to {len(urls)} upstreams")
+
+    def pool_stats(self) -> Dict[str, dict]:
+        """
+        Connection counts per upstream pool. A pool with queued requests is
+        saturated: every connection is busy and callers wait for one.
+        """
+        stats = {}
+        for upstream, upstream_transport in self._transports.items():
+            pool = getattr(upstream_transport, "_pool", None)
+            if pool is None:
+                continue
+            connections = pool.connections
+            idle = sum(1 for connection in connections if connection.is_idle())
+            stats[upstream] = {
+                "connections": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                "queued_requests": sum(1 for request in getattr(pool, "_requests", []) if request.is_queued()),
+                "max_connections": pool._max_connections
+            }
+        return stats
+
+transport = SharedTransport({upstream: create_upstream_transport(upstream) for upstream in UPSTREAMS})
+
+def pooled_client(**kwargs) -> httpx.AsyncClient:
+    """
+    Build an httpx client backed by the shared connection pools.
+    """
+    return httpx.AsyncClient(transport=transport, **kwargs)
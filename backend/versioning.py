@@ -0,0 +1,93 @@
+import json
+import os
+from difflib import SequenceMatcher
+from typing import Dict, List
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Every K-th version is stored in full so rebuilding any version applies at most K-1 deltas
+HISTORY_SNAPSHOT_INTERVAL = int(os.getenv("HISTORY_SNAPSHOT_INTERVAL", "10"))
+
+def make_delta(base: str, target: str) -> str:
+    """
+    Encode target as line-level edits against base. The delta is a JSON list
+    where a positive int copies that many lines from base, a negative int
+    skips that many base lines and a list of strings inserts those lines.
+    """
+    base_lines = base.splitlines(keepends=True)
+    target_lines = target.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, base_lines, target_lines, autojunk=False).get_opcodes():
+        if tag == "equal":
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(-(i2 - i1))
+        if j2 > j1:
+            ops.append(target_lines[j1:j2])
+    return json.dumps(ops, separators=(",", ":"))
+
+def apply_delta(base: str, delta: str) -> str:
+    base_lines = base.splitlines(keepends=True)
+    lines = []
+    position = 0
+    for op in json.loads(delta):
+        if isinstance(op, list):
+            lines.extend(op)
+        elif op >= 0:
+            lines.extend(base_lines[position:position + op])
+            position += op
+        else:
+            position -= op
+    return "".join(lines)
+
+def is_snapshot_version(version: int, snapshot_interval: int = HISTORY_SNAPSHOT_INTERVAL) -> bool:
+    return version % snapshot_interval == 0
+
+def snapshot_floor(version: int, snapshot_interval: int = HISTORY_SNAPSHOT_INTERVAL) -> int:
+    """
+    The newest version at or below `version` that is stored in full.
+    Version 0 is the itinerary's original_content.
+    """
+    return version - version % snapshot_interval
+
+def build_history_entry(
+    itinerary_id: int, version: int, base_version: int, base_content: str,
+    content: str, refinement_request: str, snapshot_interval: int = HISTORY_SNAPSHOT_INTERVAL
+) -> dict:
+    """
+    Build a refinement_history row storing `content` either in full (on
+    snapshot versions, or when the delta would not be smaller) or as a delta
+    against `base_version`.
+    """
+    entry = {
+        "itinerary_id": itinerary_id,
+        "version": version,
+        "base_version": base_version,
+        "refinement_request": refinement_request,
+        "content": None,
+        "delta": None
+    }
+    if not is_snapshot_version(version, snapshot_interval):
+        delta = make_delta(base_content, content)
+        if len(delta) < len(content):
+            entry["delta"] = delta
+            return entry
+    entry["content"] = content
+    return entry
+
+def rebuild_versions(original_content: str, rows: List[dict]) -> Dict[int, str]:
+    """
+    Rebuild the content of every history row. Rows must be sorted by version
+    ascending and include every base they depend on, back to a snapshot or
+    version 0.
+    """
+    contents = {0: original_content}
+    for row in rows:
+        if row.get("delta") is None:
+            contents[row["version"]] = row["content"]
+        else:
+            contents[row["version"]] = apply_delta(contents[row["base_version"]], row["delta"])
+    return contents